@@ -0,0 +1,84 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class Account:
+    name: str
+    access_token: str
+
+
+# Reads the accounts of a run: CANVAS_ACCESS_TOKENS holds comma separated tokens, optionally
+# named as name:token. Without it the single CANVAS_ACCESS_TOKEN is used.
+def load_accounts(
+    tokens: Optional[str] = None, default_token: Optional[str] = None
+) -> list[Account]:
+    tokens = tokens if tokens is not None else os.getenv("CANVAS_ACCESS_TOKENS", "")
+    accounts = []
+    for number, entry in enumerate(filter(None, map(str.strip, tokens.split(","))), 1):
+        name, separator, token = entry.partition(":")
+        if not separator:
+            name, token = f"account{number}", entry
+        accounts.append(Account(name.strip(), token.strip()))
+    if not accounts and default_token:
+        accounts.append(Account("default", default_token))
+    return accounts
+
+
+_accounts: list[Account] = []
+
+
+# The accounts of the run, failures are recorded with the account whose token was used
+def get_accounts() -> list[Account]:
+    return _accounts
+
+
+def set_accounts(accounts: list[Account]):
+    global _accounts
+    _accounts = list(accounts)
+
+
+# Function to get the name of the account a token belongs to, None when it is unknown
+def account_for_token(access_token: Optional[str]) -> Optional[str]:
+    for account in _accounts:
+        if account.access_token == access_token:
+            return account.name
+    return None
+
+
+# The courses an account processes. Shared courses are downloaded by one account only,
+# the others just fetch their own submissions and grades for them.
+@dataclass
+class CoursePlan:
+    owned: list[dict]
+    submissions_only: list[dict]
+
+
+# Function to split the course listings of all accounts into plans. Every course is owned by
+# the account listing it that owns the fewest courses so far, which spreads the work (and the
+# requests) evenly over the rate limit budgets of the tokens.
+def plan_courses(listings: dict[str, list[dict]]) -> dict[str, CoursePlan]:
+    listed_by: dict = {}
+    for name, listing in listings.items():
+        for course in listing:
+            listed_by.setdefault(course["id"], []).append(name)
+
+    # Courses with the fewest candidate accounts are assigned first, they have the least choice
+    owners: dict = {}
+    owned_count = {name: 0 for name in listings}
+    for course_id in sorted(listed_by, key=lambda course_id: len(listed_by[course_id])):
+        owner = min(listed_by[course_id], key=lambda name: owned_count[name])
+        owners[course_id] = owner
+        owned_count[owner] += 1
+
+    # Plans keep the order of the listings
+    plans = {}
+    for name, listing in listings.items():
+        plans[name] = CoursePlan(
+            owned=[course for course in listing if owners[course["id"]] == name],
+            submissions_only=[
+                course for course in listing if owners[course["id"]] != name
+            ],
+        )
+    return plans
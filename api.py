@@ -7,13 +7,17 @@ from endpoints import (
     COURSE_ASSIGNMENTS_ENDPOINT,
     COURSE_FRONTPAGE_ENDPOINT,
     COURSE_PAGE_ENDPOINT,
+    COURSE_PAGES_ENDPOINT,
     COURSE_SUBMISSION_ENDPOINT,
     COURSES_ENDPOINT,
     COURSE_FILES_ENDPOINT,
     COURSE_MODULES_ENDPOINT,
     COURSE_MODULES_ITEMS_ENDPOINT,
+    ACTIVITY_STREAM_ENDPOINT,
 )
 from models import CanvasCourse, CanvasPage
+from hedging import HedgedGetter
+from transport import get_session, get_transfer_settings
 
 T = TypeVar("T", bound=BaseModel)
 
@@ -32,7 +36,7 @@ class CanvasAPIResponse(Generic[T]):
 
 # TODO: Write documentation and return types
 class CanvasAPIClient:
-    def __init__(self, access_token, domain_url, logger=None):
+    def __init__(self, access_token, domain_url, logger=None, session=None):
         self.access_token = access_token
         self.domain_url = domain_url
         self.api_url = f"https://{domain_url}/api/v1"
@@ -43,9 +47,30 @@ class CanvasAPIClient:
             "Charset": "UTF-8",
         }
 
+        self.session: requests.Session = session or get_session()
+        self.hedger = HedgedGetter()
         self.logger = logger or logging.getLogger(__name__)
         self.logger.debug(f"Initialized Canvas API client for {domain_url}")
 
+    # Function to send a GET with timeouts, retried after timeouts and connection errors.
+    # With hedging enabled a duplicate is sent once the request runs past the latency percentile.
+    def _get(self, endpoint: str, params=None) -> requests.Response:
+        settings = get_transfer_settings()
+        for attempt in range(settings.retries + 1):
+            try:
+                return self.hedger.get(
+                    self.session,
+                    endpoint,
+                    settings.hedge_percentile,
+                    headers=self.auth_headers,
+                    params=params,
+                    timeout=settings.timeout,
+                )
+            except (requests.Timeout, requests.ConnectionError) as e:
+                if attempt == settings.retries:
+                    raise
+                self.logger.warning(f"Retrying {endpoint} after error: {e}")
+
     def _handle_response(
         self, response: requests.Response, model: Type[T]
     ) -> CanvasAPIResponse[T]:
@@ -69,9 +94,7 @@ class CanvasAPIClient:
             f"{self.api_url}{COURSE_FRONTPAGE_ENDPOINT.format(course_id=course_id)}"
         )
         self.logger.debug(f"Fetching front page in {endpoint}")
-        return self._handle_response(
-            requests.get(endpoint, headers=self.auth_headers), CanvasPage
-        )
+        return self._handle_response(self._get(endpoint), CanvasPage)
 
     # Function to get a page of a course
     def get_course_page(
@@ -80,9 +103,75 @@ class CanvasAPIClient:
         # Reference: https://canvas.instructure.com/doc/api/pages.html#method.wiki_pages_api.show_front_page
         endpoint = f"{self.api_url}{COURSE_PAGE_ENDPOINT.format(course_id=course_id, page_id=page_id)}"
         self.logger.debug(f"Fetching front page in {endpoint}")
-        return self._handle_response(
-            requests.get(endpoint, headers=self.auth_headers), CanvasPage
+        return self._handle_response(self._get(endpoint), CanvasPage)
+
+    # Function to list the pages of a course, the listing contains updated_at but no bodies
+    def get_course_pages(self, course_id: int) -> list:
+        # Reference: https://canvas.instructure.com/doc/api/pages.html#method.wiki_pages_api.index
+        endpoint = f"{self.api_url}{COURSE_PAGES_ENDPOINT.format(course_id=course_id)}"
+        self.logger.debug(f"Fetching page list for course {course_id} in {endpoint}")
+
+        pages = []
+        page = 1
+
+        while True:
+            response = self._get(
+                endpoint,
+                params={"page": page, "per_page": 100},
+            )
+            if response.status_code != 200:
+                self.logger.error(
+                    f"Failed to fetch pages for course {course_id}: {response.status_code} -> {response.content}"
+                )
+                return pages
+
+            data = response.json()
+            if not data:
+                break
+
+            self.logger.debug(
+                f"Successful fetch {len(data)} pages from course {course_id} at page {page}"
+            )
+            pages.extend(data)
+            page += 1
+
+        self.logger.debug(
+            f"Fetched {len(pages)} pages from course {course_id} in {page} pages"
+        )
+        return pages
+
+    # Function to get the most recently updated files or pages of a course ("files" or "pages"),
+    # a single small request that tells whether anything changed
+    def get_recently_updated(self, course_id: int, kind: str, limit: int = 1) -> list:
+        # Reference: https://canvas.instructure.com/doc/api/files.html#method.files.api_index
+        if kind == "files":
+            endpoint = f"{self.api_url}{COURSE_FILES_ENDPOINT.format(course_id=course_id, file_id='')}"
+        else:
+            endpoint = (
+                f"{self.api_url}{COURSE_PAGES_ENDPOINT.format(course_id=course_id)}"
+            )
+        response = self._get(
+            endpoint,
+            params={"sort": "updated_at", "order": "desc", "per_page": limit},
         )
+        if response.status_code != 200:
+            self.logger.debug(
+                f"Failed to fetch recent {kind} for course {course_id}: {response.status_code}"
+            )
+            return []
+        return response.json()
+
+    # Function to get the recent activity (announcements, discussions, submissions, ...) of the user
+    def get_activity_stream(self, per_page: int = 100) -> list:
+        # Reference: https://canvas.instructure.com/doc/api/users.html#method.users.activity_stream
+        endpoint = f"{self.api_url}{ACTIVITY_STREAM_ENDPOINT}"
+        response = self._get(endpoint, params={"per_page": per_page})
+        if response.status_code != 200:
+            self.logger.error(
+                f"Failed to fetch activity stream: {response.status_code} -> {response.content}"
+            )
+            return []
+        return response.json()
 
     # Function to get the syllabus page of a course
     def get_course(
@@ -96,12 +185,12 @@ class CanvasAPIClient:
         params = {"include": "syllabus_body"} if with_syllabus else {}
 
         return self._handle_response(
-            requests.get(endpoint, headers=self.auth_headers, params=params),
+            self._get(endpoint, params=params),
             CanvasCourse,
         )
 
-    # Function to get all courses
-    def get_courses(self) -> list[str]:
+    # Function to get all courses, optionally only those with the given enrollment state
+    def get_courses(self, enrollment_state: Optional[str] = None) -> list[str]:
         # Reference: https://canvas.instructure.com/doc/api/courses.html
         endpoint = f'{self.api_url}{COURSES_ENDPOINT.format(course_id="")}'
         self.logger.debug(f"Fetching all courses in {endpoint}")
@@ -111,9 +200,11 @@ class CanvasAPIClient:
         # TODO: Maybe use the LINK header to get the next page
         while True:
 
-            response = requests.get(
-                endpoint, headers=self.auth_headers, params={"page": page}
-            )
+            # The term is included so runs can be filtered on the term name
+            params = {"page": page, "per_page": 100, "include[]": "term"}
+            if enrollment_state:
+                params["enrollment_state"] = enrollment_state
+            response = self._get(endpoint, params=params)
 
             if response.status_code != 200:
                 # TODO: Also return the error code
@@ -137,15 +228,16 @@ class CanvasAPIClient:
     # Function to get all files in a course
     def get_course_files(self, course_id: int, file_id: Optional[int] = None) -> list:
         # Reference: https://canvas.instructure.com/doc/api/files.html
-        endpoint = f"{self.api_url}{COURSE_FILES_ENDPOINT.format(course_id=course_id, file_id=file_id)}"
+        endpoint = f"{self.api_url}{COURSE_FILES_ENDPOINT.format(course_id=course_id, file_id=file_id or '')}"
         self.logger.debug(f"Fetching all files from course {course_id} in {endpoint}")
 
         files = []
         page = 1
 
         while True:
-            response = requests.get(
-                endpoint, headers=self.auth_headers, params={"page": page}
+            response = self._get(
+                endpoint,
+                params={"page": page, "per_page": 100},
             )
             if response.status_code != 200:
                 # TODO: Also return the error code
@@ -168,8 +260,7 @@ class CanvasAPIClient:
                 files.append(data)
                 break
 
-            if file_id:
-                break
+            files.extend(data)
             page += 1
 
         self.logger.debug(
@@ -182,7 +273,7 @@ class CanvasAPIClient:
         self, course_id: int, assignment_id: Optional[int] = None
     ):
         # Reference: https://canvas.instructure.com/doc/api/assignments.html
-        endpoint = f"{self.api_url}{COURSE_ASSIGNMENTS_ENDPOINT.format(course_id=course_id, assignment_id=assignment_id)}"
+        endpoint = f"{self.api_url}{COURSE_ASSIGNMENTS_ENDPOINT.format(course_id=course_id, assignment_id=assignment_id or '')}"
         self.logger.debug(
             f"Fetching all assignments from course {course_id} in {endpoint}"
         )
@@ -191,9 +282,7 @@ class CanvasAPIClient:
         page = 1
 
         while True:
-            response = requests.get(
-                endpoint, headers=self.auth_headers, params={"page": page}
-            )
+            response = self._get(endpoint, params={"page": page})
             if response.status_code != 200:
                 # TODO: Also return the error code
                 self.logger.error(
@@ -224,16 +313,14 @@ class CanvasAPIClient:
     # Function to get all modules in a course
     def get_modules(self, course_id: int, module_id: Optional[int] = None):
         # Reference: https://canvas.instructure.com/doc/api/modules.html
-        endpoint = f"{self.api_url}{COURSE_MODULES_ENDPOINT.format(course_id=course_id, module_id=module_id)}"
+        endpoint = f"{self.api_url}{COURSE_MODULES_ENDPOINT.format(course_id=course_id, module_id=module_id or '')}"
         self.logger.debug(f"Fetching all modules from course {course_id} in {endpoint}")
 
         modules = []
         page = 1
 
         while True:
-            response = requests.get(
-                endpoint, headers=self.auth_headers, params={"page": page}
-            )
+            response = self._get(endpoint, params={"page": page})
             if response.status_code != 200:
                 # TODO: Also return the error code
                 self.logger.error(
@@ -267,16 +354,14 @@ class CanvasAPIClient:
         self, course_id: int, module_id: int, item_id: Optional[int] = None
     ):
         # Reference: https://canvas.instructure.com/doc/api/modules.html#method.context_module_items_api.index
-        endpoint = f"{self.api_url}{COURSE_MODULES_ITEMS_ENDPOINT.format(course_id=course_id, module_id=module_id, item_id=item_id)}"
+        endpoint = f"{self.api_url}{COURSE_MODULES_ITEMS_ENDPOINT.format(course_id=course_id, module_id=module_id, item_id=item_id or '')}"
         self.logger.debug(f"Fetching items for module {module_id} in {endpoint}")
 
         items = []
         page = 1
 
         while True:
-            response = requests.get(
-                endpoint, headers=self.auth_headers, params={"page": page}
-            )
+            response = self._get(endpoint, params={"page": page})
             if response.status_code != 200:
                 # TODO: Also return the error code
                 self.logger.error(
@@ -308,12 +393,13 @@ class CanvasAPIClient:
     # Function to get submission details for an assignment
     def get_course_self_assignment_submission(self, course_id: int, assignment_id: int):
         # Reference: https://canvas.instructure.com/doc/api/submissions.html
-        endpoint = f"{self.api_url}{COURSE_SUBMISSION_ENDPOINT.format(course_id=course_id, assignment_id=assignment_id)}/self"
+        endpoint = f"{self.api_url}{COURSE_SUBMISSION_ENDPOINT.format(course_id=course_id, assignment_id=assignment_id, submission_id='self')}"
         self.logger.debug(
             f"Fetching self submission for assignment {assignment_id} in {endpoint}"
         )
 
-        response = requests.get(endpoint, headers=self.auth_headers)
+        # The comments are saved with the grade
+        response = self._get(endpoint, params={"include[]": "submission_comments"})
 
         if response.status_code != 200:
             # TODO: Also return the error code
@@ -0,0 +1,194 @@
+import argparse
+import gc
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from visited import VisitedSet
+
+
+def _urls(count: int):
+    for number in range(count):
+        yield (
+            f"https://canvas.example.edu/courses/{number % 50}/pages/"
+            f"page-{number}?module_item_id={number * 7}"
+        )
+
+
+# Function to measure the peak traced memory and the time of building a structure.
+# The time is taken in a separate untraced run, tracemalloc slows allocations down a lot.
+def _measure(build) -> tuple[float, float]:
+    gc.collect()
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak / 2**20, elapsed
+
+
+def _visited_benchmarks(count: int, max_exact: int) -> dict:
+    def strings():
+        return set(_urls(count))
+
+    def exact():
+        visited = VisitedSet()
+        for url in _urls(count):
+            visited.add(url)
+        return visited
+
+    def tiered():
+        visited = VisitedSet(max_exact=max_exact, bloom_capacity=count)
+        for url in _urls(count):
+            visited.add(url)
+        return visited
+
+    return {
+        "visited: set of str": strings,
+        "visited: VisitedSet": exact,
+        f"visited: VisitedSet max_exact={max_exact}": tiered,
+    }
+
+
+def _frontier_benchmarks(count: int) -> dict:
+    # Imported here, the crawler pulls in the HTTP and HTML parsing dependencies
+    from crawler import FrontierEntry
+
+    def tuples():
+        return [(number % 8, 1, number, url) for number, url in enumerate(_urls(count))]
+
+    def entries():
+        return [
+            FrontierEntry(number % 8, 1, number, url)
+            for number, url in enumerate(_urls(count))
+        ]
+
+    return {"frontier: tuples": tuples, "frontier: FrontierEntry": entries}
+
+
+def _download_benchmarks(count: int) -> dict:
+    from functions import PendingDownload
+
+    def dicts():
+        return [
+            {"url": url, "save_path": f"courses/c/{number}.pdf", "file_id": number}
+            for number, url in enumerate(_urls(count))
+        ]
+
+    def pending():
+        return [
+            PendingDownload(url, f"courses/c/{number}.pdf", number)
+            for number, url in enumerate(_urls(count))
+        ]
+
+    return {"downloads: dicts": dicts, "downloads: PendingDownload": pending}
+
+
+def memory(args):
+    benchmarks = _visited_benchmarks(args.urls, args.max_exact)
+    benchmarks.update(_frontier_benchmarks(args.urls))
+    benchmarks.update(_download_benchmarks(args.urls))
+    print(f"{'benchmark':<45} {'peak MB':>10} {'seconds':>10}")
+    for name, build in benchmarks.items():
+        peak, elapsed = _measure(build)
+        print(f"{name:<45} {peak:>10.1f} {elapsed:>10.2f}")
+
+
+# Modules the fast commands must not import, they are only needed to talk to Canvas
+HEAVY_MODULES = ("requests", "bs4", "pydantic")
+STARTUP_CODE = "import cli; cli.build_parser()"
+
+
+# Function to parse the `python -X importtime` report into (module, self µs, cumulative µs)
+def _import_times(report: str) -> list[tuple[str, int, int]]:
+    times = []
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # The header line
+            continue
+        # Nested imports are indented after the separator
+        times.append((fields[2][1:].rstrip(), int(fields[0]), int(fields[1])))
+    return times
+
+
+def startup(args):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(result.returncode)
+
+    times = _import_times(result.stderr)
+    # Top-level imports (no indentation) add up to the whole import time
+    total_ms = sum(cumulative for name, _, cumulative in times if name == name.lstrip())
+    total_ms /= 1000
+    print(f"{'module':<45} {'self ms':>10} {'cumul. ms':>10}")
+    for name, own, cumulative in sorted(times, key=lambda t: t[1], reverse=True)[
+        : args.top
+    ]:
+        print(f"{name.strip():<45} {own / 1000:>10.1f} {cumulative / 1000:>10.1f}")
+    print(f"\nTotal import time of the CLI: {total_ms:.1f} ms")
+
+    imported = {name.strip() for name, _, _ in times}
+    heavy = [module for module in HEAVY_MODULES if module in imported]
+    failed = False
+    if heavy:
+        print(f"Heavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"Over the budget of {args.budget_ms} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the crawler internals")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    memory_parser = subparsers.add_parser(
+        "memory",
+        help="Compare the peak memory of the visited set, frontier and download lists",
+    )
+    memory_parser.add_argument("--urls", type=int, default=200_000)
+    memory_parser.add_argument(
+        "--max-exact",
+        type=int,
+        default=50_000,
+        help="URLs kept exactly before the Bloom filter tier is used",
+    )
+    memory_parser.set_defaults(func=memory)
+
+    startup_parser = subparsers.add_parser(
+        "startup",
+        help="Measure the import time of the command line and check it stays light",
+    )
+    startup_parser.add_argument(
+        "--top", type=int, default=15, help="Number of slowest modules to list"
+    )
+    startup_parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=150,
+        help="Fail when the total import time exceeds this, 0 disables the check",
+    )
+    startup_parser.set_defaults(func=startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
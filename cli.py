@@ -0,0 +1,463 @@
+import argparse
+import importlib
+import os
+import time
+
+from config import (
+    ARCHIVE_COMPRESSION_METHOD,
+    CANVAS_ACCESS_TOKEN,
+    CANVAS_ACCESS_TOKENS,
+    CONNECT_TIMEOUT,
+    CRAWLER_WORKERS,
+    FSYNC,
+    HEDGE_PERCENTILE,
+    METADATA_DB,
+    MIN_DOWNLOAD_RATE,
+    PROGRESS_MODE,
+    RATE_LIMIT,
+    RATE_LIMIT_BURST,
+    READ_TIMEOUT,
+    SEARCH_INDEX,
+    SEGMENT_THRESHOLD_MB,
+    SEGMENTS,
+    STORAGE_BACKEND,
+    WRITE_QUEUE,
+)
+from accounts import load_accounts
+from dead_letters import DEAD_LETTERS_PATH
+from filters import CONTENT_TYPES
+from manifest import MANIFEST_PATH, DownloadManifest, get_manifest, set_manifest
+from profiling import PROFILE_MODES
+from progress import PROGRESS_MODES
+from search_index import SEARCH_INDEX_PATH, SearchIndex
+from storage import ARCHIVE_COMPRESSION, COURSES_ROOT, extract_archives
+from verify import (
+    entries_from_canvas,
+    entries_from_manifest,
+    requeue_failed,
+    verify_entries,
+)
+from writer import FSYNC_POLICIES
+
+
+# Function to wrap a command that is only imported when it runs. The download commands need
+# requests, pydantic and BeautifulSoup, help, search, extract and verify start without them.
+def lazy_command(module_name: str, function_name: str):
+    def command(args):
+        module = importlib.import_module(module_name)
+        return getattr(module, function_name)(args)
+
+    return command
+
+
+def extract(args):
+    extracted = extract_archives(args.root, args.dest, args.courses)
+    print(f"Extracted {extracted} files")
+
+
+def search(args):
+    if not os.path.exists(args.index):
+        print(
+            f"NOTICE: No search index found at {args.index}, run the downloader first."
+        )
+        exit(1)
+
+    search_index = SearchIndex(args.index)
+    start = time.perf_counter()
+    hits = search_index.search(args.query, args.limit, args.course, args.raw)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    search_index.close()
+
+    for hit in hits:
+        print(f"[{hit.course_name}] {hit.kind} {hit.title} ({hit.canvas_id})")
+        if hit.path:
+            print(f"    {hit.path}")
+        print(f"    {hit.snippet}")
+    print(f"{len(hits)} hits in {elapsed_ms:.1f} ms")
+
+
+def verify(args):
+    # The accounts of a run, verify --source canvas lists their courses and --requeue uses their tokens
+    accounts = load_accounts(CANVAS_ACCESS_TOKENS, CANVAS_ACCESS_TOKEN)
+    if (args.source == "canvas" or args.requeue) and not accounts:
+        print("NOTICE: Please set the environment variables for Canvas API access.")
+        exit(1)
+
+    if args.source == "manifest":
+        manifest_entries = DownloadManifest(args.manifest).load()
+        if not manifest_entries:
+            print(f"NOTICE: No downloads recorded in {args.manifest}")
+            exit(1)
+        entries = entries_from_manifest(manifest_entries)
+    else:
+        from downloader import create_client
+
+        # Courses shared by several accounts are verified once
+        entries = {}
+        for account in accounts:
+            client = create_client(account.access_token)
+            for entry in entries_from_canvas(
+                client, client.get_courses(), account.name
+            ):
+                entries.setdefault(entry.path, entry)
+        entries = list(entries.values())
+
+    start = time.perf_counter()
+    results = verify_entries(entries, args.workers, check_hash=not args.no_hash)
+    elapsed = time.perf_counter() - start
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        print(f"{result.status:8s} {result.entry.path}")
+    print(f"Verified {len(results)} files in {elapsed:.1f}s, {len(failed)} failed")
+
+    if failed and args.requeue:
+        set_manifest(DownloadManifest(args.manifest))
+        access_tokens = {account.name: account.access_token for account in accounts}
+        fixed = requeue_failed(results, access_tokens, args.workers)
+        get_manifest().close()
+        print(f"Re-downloaded {fixed}/{len(failed)} files")
+
+
+# Command line options that select what a run processes
+def add_filter_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_argument_group(
+        "filters",
+        "Select courses and content, repeatable options match any of their values",
+    )
+    group.add_argument(
+        "--enrollment-state",
+        choices=["active", "invited_or_pending", "completed"],
+        help="Only list courses with this enrollment state (filtered by Canvas)",
+    )
+    group.add_argument(
+        "--term",
+        action="append",
+        help="enrollment_term_id or term name (glob) of the courses to process",
+    )
+    group.add_argument("--course-id", action="append", help="Id of a course to process")
+    group.add_argument(
+        "--course-name",
+        action="append",
+        help="Glob matched against the course name or code, e.g. '*2024*'",
+    )
+    group.add_argument(
+        "--workflow-state",
+        action="append",
+        help="Course workflow state to process, e.g. available",
+    )
+    group.add_argument(
+        "--only",
+        nargs="+",
+        choices=CONTENT_TYPES,
+        help="Only process these content types",
+    )
+    group.add_argument(
+        "--skip", nargs="+", choices=CONTENT_TYPES, help="Skip these content types"
+    )
+    group.add_argument("--min-file-size", help="Skip smaller files, e.g. 10K")
+    group.add_argument("--max-file-size", help="Skip larger files, e.g. 500M")
+    group.add_argument(
+        "--ext", action="append", help="Only download files with this extension"
+    )
+
+
+# Command line options of the commands that sync courses (run, watch and retry). They are
+# accepted before and after the command name: the copy attached to the commands has no
+# defaults, so it doesn't overwrite the values given before the command.
+def sync_options(suppress_defaults: bool = False) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        add_help=False,
+        argument_default=argparse.SUPPRESS if suppress_defaults else None,
+    )
+
+    def default(value):
+        return argparse.SUPPRESS if suppress_defaults else value
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default(int(CRAWLER_WORKERS) if CRAWLER_WORKERS else None),
+        help="Parallel downloads and crawler workers (default: CRAWLER_WORKERS)",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["files", "archive"],
+        default=default(STORAGE_BACKEND),
+        help="Store pages and text artifacts as separate files or in a compressed archive per course",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=list(ARCHIVE_COMPRESSION),
+        default=default(ARCHIVE_COMPRESSION_METHOD),
+        help="Compression used by the archive storage",
+    )
+    parser.add_argument(
+        "--no-search-index",
+        dest="search_index",
+        action="store_false",
+        default=default(SEARCH_INDEX),
+        help="Do not update the full text search index while downloading",
+    )
+    parser.add_argument(
+        "--no-metadata",
+        dest="metadata",
+        action="store_false",
+        default=default(METADATA_DB),
+        help="Do not write the per-course metadata database (courses/<course>/metadata.sqlite)",
+    )
+    parser.add_argument(
+        "--full-crawl",
+        action="store_true",
+        help="Refetch every page and file instead of skipping those that did not change since the last run",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="full",
+        choices=PROFILE_MODES,
+        default=default(None),
+        help="Profile every phase: 'full' writes cProfile and tracemalloc reports to logs/profile, "
+        "'sample' uses a low-overhead stack sampler",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=default(25),
+        help="Number of entries in the profile reports",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Record all HTTP requests and responses into a cassette file",
+    )
+    parser.add_argument(
+        "--record-max-body",
+        type=int,
+        default=default(None),
+        metavar="BYTES",
+        help="Truncate recorded response bodies (e.g. file downloads) to this size",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        help="Serve all HTTP requests from a recorded cassette instead of Canvas",
+    )
+    parser.add_argument(
+        "--replay-latency-scale",
+        type=float,
+        default=default(1.0),
+        help="Multiplier for the recorded latencies when replaying, 0 disables the delays",
+    )
+    parser.add_argument(
+        "--progress",
+        choices=PROGRESS_MODES,
+        default=default(PROGRESS_MODE),
+        help="Progress output: a status line (bar), periodic JSON status lines for headless runs (json), "
+        "or off. auto picks bar on a terminal and json otherwise",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=default(None),
+        help="Seconds between progress updates (default: 0.5 for bar, 30 for json)",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=default(float(RATE_LIMIT) if RATE_LIMIT else None),
+        help="Requests per second per access token (default: unlimited, Canvas throttling is still honored)",
+    )
+    parser.add_argument(
+        "--rate-limit-burst",
+        type=int,
+        default=default(int(RATE_LIMIT_BURST) if RATE_LIMIT_BURST else None),
+        help="Requests a token may send at once before --rate-limit applies",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=default(CONNECT_TIMEOUT),
+        help="Seconds to wait for a connection",
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=default(READ_TIMEOUT),
+        help="Seconds to wait for any data of a response",
+    )
+    parser.add_argument(
+        "--min-download-rate",
+        type=float,
+        default=default(MIN_DOWNLOAD_RATE),
+        help="Bytes per second below which a download counts as stalled and is restarted, 0 disables the check",
+    )
+    parser.add_argument(
+        "--stall-window",
+        type=float,
+        default=default(30.0),
+        help="Seconds over which the download rate is measured",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=default(2),
+        help="Retries of GETs and downloads after timeouts, stalls and connection errors",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=default(float(HEDGE_PERCENTILE) if HEDGE_PERCENTILE else None),
+        help="Send a duplicate of API requests that take longer than this percentile of recent latencies, e.g. 95",
+    )
+    parser.add_argument(
+        "--segment-threshold",
+        type=float,
+        default=default(SEGMENT_THRESHOLD_MB),
+        help="Download files of at least this many MB as parallel byte ranges, 0 disables segmented downloads",
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=default(SEGMENTS),
+        help="Parallel byte ranges per large file",
+    )
+    parser.add_argument(
+        "--write-queue",
+        type=int,
+        default=default(WRITE_QUEUE),
+        help="Chunks and files buffered for the background writer thread, 0 writes on the download workers",
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=FSYNC_POLICIES,
+        default=default(FSYNC),
+        help="When written files are fsynced: never (none), when each is closed (file) or per written batch (batch)",
+    )
+    add_filter_arguments(parser)
+    return parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Download all possible content from Canvas",
+        parents=[sync_options()],
+    )
+    parser.set_defaults(func=lazy_command("downloader", "run"))
+    command_options = sync_options(suppress_defaults=True)
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser(
+        "run", help="Download all courses (default)", parents=[command_options]
+    ).set_defaults(func=lazy_command("downloader", "run"))
+
+    extract_parser = subparsers.add_parser(
+        "extract", help="Extract course archives into the regular directory layout"
+    )
+    extract_parser.add_argument(
+        "courses", nargs="*", help="Courses to extract (default: all)"
+    )
+    extract_parser.add_argument(
+        "--root", default=COURSES_ROOT, help="Directory holding the archives"
+    )
+    extract_parser.add_argument(
+        "--dest", default=None, help="Destination directory (default: --root)"
+    )
+    extract_parser.set_defaults(func=extract)
+
+    search_parser = subparsers.add_parser(
+        "search", help="Search pages, assignments, grades and file names"
+    )
+    search_parser.add_argument("query", help="Words to search for")
+    search_parser.add_argument("--course", help="Limit results to a course name or id")
+    search_parser.add_argument("--limit", type=int, default=20)
+    search_parser.add_argument(
+        "--raw", action="store_true", help="Pass the query as FTS5 query syntax"
+    )
+    search_parser.add_argument("--index", default=SEARCH_INDEX_PATH)
+    search_parser.set_defaults(func=search)
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Keep running and sync courses as soon as they change",
+        parents=[command_options],
+    )
+    watch_parser.add_argument(
+        "--min-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between polls right after a change",
+    )
+    watch_parser.add_argument(
+        "--max-interval",
+        type=float,
+        default=1800.0,
+        help="Longest pause between polls when nothing changes",
+    )
+    watch_parser.add_argument(
+        "--once", action="store_true", help="Poll and sync once, then exit"
+    )
+    watch_parser.set_defaults(func=lazy_command("downloader", "watch"))
+
+    retry_parser = subparsers.add_parser(
+        "retry",
+        help="Retry the failed downloads and pages of earlier runs",
+        parents=[command_options],
+    )
+    retry_parser.add_argument("--queue", default=DEAD_LETTERS_PATH)
+    retry_parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=8,
+        help="Give up on failures after this many attempts",
+    )
+    retry_parser.add_argument(
+        "--max-wait",
+        type=float,
+        default=300.0,
+        help="Seconds to keep waiting for failures whose next retry is not due yet",
+    )
+    retry_parser.add_argument(
+        "--now",
+        action="store_true",
+        help="Retry all failures right away instead of waiting for their backoff",
+    )
+    retry_parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Also retry failures that look permanent (e.g. 403 or 404)",
+    )
+    retry_parser.set_defaults(func=lazy_command("downloader", "retry"))
+
+    verify_parser = subparsers.add_parser(
+        "verify", help="Check downloaded files for missing, truncated or corrupt files"
+    )
+    verify_parser.add_argument(
+        "--source",
+        choices=["manifest", "canvas"],
+        default="manifest",
+        help="Compare against the local download manifest (sizes and hashes) or the Canvas file listings (sizes)",
+    )
+    verify_parser.add_argument("--manifest", default=MANIFEST_PATH)
+    verify_parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 4, help="Hashing threads"
+    )
+    verify_parser.add_argument(
+        "--no-hash", action="store_true", help="Only compare file sizes"
+    )
+    verify_parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="Download the files that failed verification again",
+    )
+    verify_parser.set_defaults(func=verify)
+
+    return parser
+
+
+def main():
+    arguments = build_parser().parse_args()
+    arguments.func(arguments)
+
+
+if __name__ == "__main__":
+    main()
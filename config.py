@@ -0,0 +1,31 @@
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Retrieve environment variables
+CANVAS_ACCESS_TOKEN = os.getenv("CANVAS_ACCESS_TOKEN")
+CANVAS_ACCESS_TOKENS = os.getenv("CANVAS_ACCESS_TOKENS", "")
+CANVAS_DOMAIN = os.getenv("CANVAS_DOMAIN")
+CANVAS_API_URL = f"https://{CANVAS_DOMAIN}/api/v1"
+CRAWLER_WORKERS = os.getenv("CRAWLER_WORKERS")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "files")
+ARCHIVE_COMPRESSION_METHOD = os.getenv("ARCHIVE_COMPRESSION", "deflate")
+PROGRESS_MODE = os.getenv("PROGRESS", "auto")
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "true").lower() in ("1", "true", "yes")
+METADATA_DB = os.getenv("METADATA_DB", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT = os.getenv("RATE_LIMIT")
+RATE_LIMIT_BURST = os.getenv("RATE_LIMIT_BURST")
+CONNECT_TIMEOUT = float(os.getenv("CONNECT_TIMEOUT") or 10)
+READ_TIMEOUT = float(os.getenv("READ_TIMEOUT") or 60)
+MIN_DOWNLOAD_RATE = float(os.getenv("MIN_DOWNLOAD_RATE") or 10_000)
+HEDGE_PERCENTILE = os.getenv("HEDGE_PERCENTILE")
+SEGMENT_THRESHOLD_MB = float(os.getenv("SEGMENT_THRESHOLD_MB") or 256)
+SEGMENTS = int(os.getenv("SEGMENTS") or 4)
+WRITE_QUEUE = int(os.getenv("WRITE_QUEUE") or 256)
+FSYNC = os.getenv("FSYNC") or "none"
+VISITED_MAX_EXACT = os.getenv("VISITED_MAX_EXACT")
+VISITED_BLOOM_CAPACITY = int(os.getenv("VISITED_BLOOM_CAPACITY") or 1_000_000)
+VISITED_ERROR_RATE = float(os.getenv("VISITED_ERROR_RATE") or 0.001)
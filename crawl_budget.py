@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from logger import main_logger
+
+
+# Limits for a crawl, None means unlimited
+@dataclass
+class CrawlBudget:
+    max_depth: Optional[int] = None
+    max_pages: Optional[int] = None
+    max_seconds: Optional[float] = None
+    max_bytes: Optional[int] = None
+
+    # Reads a budget from environment variables with the given prefix, e.g. CRAWL_MAX_PAGES.
+    # Malformed values are logged and leave that limit unset.
+    @classmethod
+    def from_env(cls, prefix: str = "CRAWL") -> "CrawlBudget":
+        def read(name, cast):
+            value = os.getenv(f"{prefix}_{name}", "").strip()
+            if not value:
+                return None
+            try:
+                return cast(value)
+            except ValueError:
+                main_logger.warning(
+                    f"Ignoring {prefix}_{name}={value!r}, it is not a number"
+                )
+                return None
+
+        return cls(
+            max_depth=read("MAX_DEPTH", int),
+            max_pages=read("MAX_PAGES", int),
+            max_seconds=read("MAX_SECONDS", float),
+            max_bytes=read("MAX_BYTES", int),
+        )
+
+
+# Tracks what has been spent of a budget since the tracker was created
+class BudgetTracker:
+    def __init__(self, budget: Optional[CrawlBudget] = None):
+        self.budget = budget or CrawlBudget()
+        self.pages = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, pages: int = 0, size: int = 0):
+        with self._lock:
+            self.pages += pages
+            self.bytes += size
+
+    # Returns why the budget ran out, None while there is budget left
+    def exhausted(self) -> Optional[str]:
+        budget = self.budget
+        if budget.max_pages is not None and self.pages >= budget.max_pages:
+            return "max_pages"
+        if budget.max_bytes is not None and self.bytes >= budget.max_bytes:
+            return "max_bytes"
+        if (
+            budget.max_seconds is not None
+            and time.monotonic() - self.started >= budget.max_seconds
+        ):
+            return "max_seconds"
+        return None
+
+    def allows_depth(self, depth: int) -> bool:
+        return self.budget.max_depth is None or depth <= self.budget.max_depth
@@ -1,14 +1,37 @@
+from datetime import datetime
 from enum import Enum
+import hashlib
+import heapq
+import itertools
 import logging
 import os
 import re
 from typing import Optional
+import requests
 from bs4 import BeautifulSoup
 from logger import ignore_logger
 
 from urllib.parse import ParseResult, parse_qs, urljoin, urlparse
+from accounts import account_for_token
 from api import CanvasAPIClient
-from functions import download_file, sanitize_filename, save_html
+from crawl_budget import BudgetTracker, CrawlBudget
+from dead_letters import DeadLetter, get_dead_letters
+from endpoints import (
+    COURSE_FRONTPAGE_ENDPOINT,
+    COURSE_PAGE_ENDPOINT,
+    COURSES_ENDPOINT,
+)
+from dedupe import PageFingerprint, PageFingerprints, simhash
+from file_index import FileIndexCache
+from filters import SyncFilter
+from functions import download_file, html_save_path, sanitize_filename, save_html
+from page_index import PageIndex
+from progress import get_progress
+from search_index import get_search_index
+from metadata import course_metadata
+from storage import get_storage
+from writer import ensure_dir
+from visited import VisitedSet
 
 # Regular expressions to extract file IDs and preview IDs from Canvas URLs
 # TODO: More patterns should be added and tested
@@ -16,6 +39,30 @@ file_id_pattern = re.compile(r"/files/(\d+)")
 preview_id_pattern = re.compile(r"preview=(\d+)")
 
 
+# Canvas returns timestamps with a "Z" suffix, pydantic parses them into aware datetimes
+def _normalize_timestamp(value) -> str:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.isoformat()
+
+
+# Entry of the crawl frontier. Depth, priority and insertion order are packed into one integer
+# key, so the heap compares ints and every entry is a small slotted object instead of a tuple.
+class FrontierEntry:
+    __slots__ = ("key", "url")
+
+    def __init__(self, depth: int, priority: int, seq: int, url: str):
+        self.key = (depth << 41) | (priority << 40) | seq
+        self.url = url
+
+    @property
+    def depth(self) -> int:
+        return self.key >> 41
+
+    def __lt__(self, other: "FrontierEntry") -> bool:
+        return self.key < other.key
+
+
 class SupportedURLCrawl(Enum):
     PAGES = "/pages"
     HOME = "/front_page"
@@ -24,9 +71,36 @@ class SupportedURLCrawl(Enum):
 
 
 class CanvasCrawler:
-    def __init__(self, client, logger=None):
+    def __init__(
+        self,
+        client,
+        logger=None,
+        page_index: Optional[PageIndex] = None,
+        course_budget: Optional[CrawlBudget] = None,
+        global_budget: Optional[CrawlBudget | BudgetTracker] = None,
+        file_indexes: Optional[FileIndexCache] = None,
+        sync_filter: Optional[SyncFilter] = None,
+    ):
         self.client: CanvasAPIClient = client
         self.logger = logger or logging.getLogger(__name__)
+        # Limits for every crawled course, and for everything crawled by this crawler.
+        # A tracker can be passed to share the global budget between crawlers.
+        self.course_budget = course_budget or CrawlBudget()
+        if isinstance(global_budget, BudgetTracker):
+            self.global_budget = global_budget
+        else:
+            self.global_budget = BudgetTracker(global_budget)
+        # File listings by course, links to files are resolved against them
+        self.file_indexes = file_indexes or FileIndexCache(client)
+        # Files that don't match the filter (size, extension) are not downloaded
+        self.sync_filter = sync_filter or SyncFilter()
+        # Persistent index of crawled pages, enables incremental crawls when set
+        self.page_index = page_index
+        # Per course caches, filled on first use and kept until forget_course
+        self._course_info: dict[int, object] = {}
+        self._page_listing: dict[int, dict[str, dict]] = {}
+        # Fingerprints of the pages fetched by the current crawl, to detect duplicates
+        self._fingerprints = PageFingerprints()
 
     def _check_supported_link(self, url_form: ParseResult) -> SupportedURLCrawl:
         if not url_form.netloc or url_form.netloc != self.client.domain_url:
@@ -61,155 +135,539 @@ class CanvasCrawler:
             return match.group(1)
         return None
 
-    # Function to crawl and download files/pages recursively
-    def crawl_page(self, page_url: str, visited: Optional[list[str]] = None):
-
-        if visited is None:
-            visited = set()
-
-        # Check if the page has already been visited
-        if page_url in visited:
-            self.logger.debug(f"Page already visited: {page_url}")
-            return
-
-        try:
-            url_form = urlparse(page_url)
-        except Exception as e:
-            self.logger.error(f"Failed to parse URL: {page_url}")
-            raise Exception(f"Failed to parse URL: {page_url}, Details: {e}")
+    # Function to drop the cached info and page listing of a course once it has been crawled,
+    # a later crawl of the course (e.g. by the watch daemon) sees its current state
+    def forget_course(self, course_id: int):
+        self._course_info.pop(course_id, None)
+        self._page_listing.pop(course_id, None)
 
-        visited.add(page_url)
-        self.logger.debug(f"Visiting: {page_url}")
+    # Function to get the course info (name and syllabus), fetched once per course
+    def _get_course_info(self, course_id: int):
+        if course_id not in self._course_info:
+            response = self.client.get_course(course_id, with_syllabus=True)
+            if response.status_code != 200:
+                return None
+            self._course_info[course_id] = response.data
+        return self._course_info[course_id]
 
-        link_type = self._check_supported_link(url_form)
+    # Function to get the page listing of a course (slug -> page without body), fetched once per course
+    def _get_page_listing(self, course_id: int) -> dict[str, dict]:
+        if course_id not in self._page_listing:
+            self._page_listing[course_id] = {
+                page["url"]: page for page in self.client.get_course_pages(course_id)
+            }
+        return self._page_listing[course_id]
 
-        if link_type == SupportedURLCrawl.NONE:
-            self.logger.debug(f"Skipping unsupported link: {page_url}")
-            ignore_logger.error(f"{page_url}: Unsupported link")
-            return
+    # Returns the updated_at Canvas reports for a page, None if it is unknown
+    def _listed_updated_at(
+        self, course_id: int, link_type: SupportedURLCrawl, page_id: Optional[str]
+    ) -> Optional[str]:
+        listing = self._get_page_listing(course_id)
+        if link_type == SupportedURLCrawl.HOME:
+            page = next((p for p in listing.values() if p.get("front_page")), None)
+        else:
+            page = listing.get(page_id)
+        if not page or not page.get("updated_at"):
+            return None
+        return _normalize_timestamp(page["updated_at"])
 
+    # Function to fetch a page, save it and return its outgoing links.
+    # Pages that did not change since the last run are served from the page index.
+    def _get_page_links(
+        self,
+        page_url: str,
+        link_type: SupportedURLCrawl,
+        course_id: int,
+        course_info,
+    ) -> Optional[tuple[list[str], int]]:
+        course_name = course_info.name or f"Unknown_Course_{course_id}"
+        html_body = course_info.syllabus_body
+        page_title = f"{course_name} syllabus"
         page_id = None
-        course_id = self._extract_course_id(page_url)
-        if course_id is None:
-            self.logger.error(f"Failed to extract course ID from URL: {page_url}")
-            ignore_logger.error(f"{page_url}: Failed to extract course ID")
-            # raise Exception(f"Failed to extract course ID from URL: {page_url}")
-        self.logger.debug(f"Fetching course info from: {page_url}")
-        response_info = self.client.get_course(course_id, with_syllabus=True)
-        if response_info.status_code != 200:
-            self.logger.error(f"Failed to fetch course info: {page_url}")
-            ignore_logger.error(f"{page_url}: Failed to fetch course info")
-            return
-        course_name = response_info.data.name or f"Unknown_Course_{course_id}"
-        html_body = response_info.data.syllabus_body
+        updated_at = None
 
+        if link_type == SupportedURLCrawl.PAGES:
+            page_id = self._extract_page_identifier(page_url)
+            if page_id is None:
+                self.logger.error(f"Failed to extract page ID from URL: {page_url}")
+                raise Exception(f"Failed to extract page ID from URL: {page_url}")
+
+        record = self.page_index.get_page(page_url) if self.page_index else None
         if link_type != SupportedURLCrawl.SYLLABUS:
+            if record is not None:
+                updated_at = self._listed_updated_at(course_id, link_type, page_id)
+                if updated_at is not None and updated_at == record.updated_at:
+                    self.logger.debug(f"Page unchanged, reusing links: {page_url}")
+                    return record.links, 0
+
             if link_type == SupportedURLCrawl.HOME:
                 response = self.client.get_course_frontpage(course_id)
                 if response.status_code != 200:
                     self.logger.error(f"Failed to fetch front page: {page_url}")
                     ignore_logger.error(f"{page_url}: Failed to fetch front page")
-                    return
-                html_body = response.data.body
+                    self._record_failure(
+                        "page", page_url, response.status_code, course_id
+                    )
+                    return None
             else:
-                page_id = self._extract_page_identifier(page_url)
-                if page_id is None:
-                    self.logger.error(f"Failed to extract page ID from URL: {page_url}")
-                    raise Exception(f"Failed to extract page ID from URL: {page_url}")
                 self.logger.debug(f"Fetching page: {page_url}")
                 self.logger.debug(f"Got page ID: {page_id}")
                 response = self.client.get_course_page(course_id, page_id)
                 if response.status_code != 200:
                     self.logger.error(f"Failed to fetch page: {page_url}")
                     ignore_logger.error(f"{page_url}: Failed to fetch page")
-                    return
-                html_body = response.data.body
+                    self._record_failure(
+                        "page", page_url, response.status_code, course_id
+                    )
+                    return None
+            html_body = response.data.body
+            page_title = response.data.title
+            updated_at = _normalize_timestamp(response.data.updated_at)
 
         if not html_body:
             self.logger.warning(f"Empty page content: {page_url}")
             ignore_logger.error(f"{page_url}: Empty page content")
-            return
+            return None
+
+        # The syllabus has no updated_at, an unchanged body means nothing to do
+        encoded_body = html_body.encode("utf-8")
+        body_hash = hashlib.sha1(encoded_body).hexdigest()
+        if record is not None and record.body_hash == body_hash:
+            self.logger.debug(f"Page body unchanged, reusing links: {page_url}")
+            if self.page_index:
+                self.page_index.put_page(
+                    page_url, course_id, updated_at, body_hash, record.links
+                )
+            return record.links, len(encoded_body)
+
+        # An exact copy of a page fetched earlier (e.g. the same page under another slug or a
+        # syllabus repeating the front page) is linked to the saved copy instead of parsed again
+        duplicate = self._fingerprints.find_exact(body_hash)
+        if duplicate is not None and duplicate.saved_path:
+            saved_path = html_save_path(page_url, course_name)
+            if get_storage().link(duplicate.saved_path, saved_path):
+                self.logger.debug(f"Page duplicates {duplicate.url}: {page_url}")
+                self._record_page(
+                    page_url, link_type, course_id, page_title, updated_at, saved_path
+                )
+                self._fingerprints.add(
+                    PageFingerprint(
+                        page_url,
+                        body_hash,
+                        duplicate.simhash,
+                        saved_path,
+                        duplicate.links,
+                    )
+                )
+                if self.page_index:
+                    self.page_index.put_page(
+                        page_url, course_id, updated_at, body_hash, duplicate.links
+                    )
+                return duplicate.links, len(encoded_body)
 
         # Save the HTML content
         soup = BeautifulSoup(html_body, "html.parser")
-        save_html(page_url, soup.prettify(), course_name)
+        saved_path = save_html(page_url, soup.prettify(), course_name)
+        self._record_page(
+            page_url, link_type, course_id, page_title, updated_at, saved_path
+        )
 
-        # Find and download any files in the page (e.g., <a href="...file">)
-        all_links = soup.find_all("a", href=True)
+        search_index = get_search_index()
+        if search_index:
+            if link_type == SupportedURLCrawl.SYLLABUS:
+                kind, canvas_id = "syllabus", course_id
+            else:
+                kind, canvas_id = "page", page_id or "front_page"
+            search_index.index_document(
+                course_id,
+                course_name,
+                kind,
+                canvas_id,
+                page_title,
+                soup.get_text(" ", strip=True),
+                saved_path,
+            )
 
+        # Collect the links to other canvas resources (e.g., <a href="...file">)
+        links = []
+        for link in soup.find_all("a", href=True):
+            full_url = urljoin(page_url, link["href"])
+            if self.client.domain_url not in urlparse(full_url).netloc:
+                continue
+            if full_url not in links:
+                links.append(full_url)
+
+        self._fingerprints.add(
+            PageFingerprint(page_url, body_hash, simhash(html_body), saved_path, links)
+        )
+        if self.page_index:
+            self.page_index.put_page(page_url, course_id, updated_at, body_hash, links)
+        return links, len(encoded_body)
+
+    # Function to resolve a file link to its metadata and download it, returns the downloaded bytes
+    def _download_linked_file(
+        self, full_url: str, course_id: int, course_name: str
+    ) -> int:
+        parsed_full_url = urlparse(full_url)
         course_base_url = f"{self.client.api_url}/courses/{course_id}"
-        for link in all_links:
-            href = link["href"]
-            full_url = urljoin(page_url, href)
-            parsed_full_url = urlparse(full_url)
-            self.logger.info(f"Parsing: {full_url}")
-            if (
-                not self.client.domain_url in parsed_full_url.netloc
-                or full_url in visited
-            ):
+
+        # IMPORTANT: The urls in this section need to be converted to API calls
+        match = file_id_pattern.search(full_url)
+        if not match:
+            query_params = parse_qs(parsed_full_url.query)
+            # Some files have a 'preview' query parameter instead of the file ID
+            # TODO: This needs to be written as a better case distinction
+            if "preview" in query_params:
+                file_id = query_params["preview"][0]
+            else:
+                self.logger.error(f"Failed to parse file ID from URL: {full_url}")
+                ignore_logger.error(f"{full_url}: Failed to parse file ID")
+                return 0
+                # raise Exception(f"Failed to parse file ID from URL: {full_url}")
+        else:
+            file_id = match.group(1)
+
+        file_info_req_url = f"{course_base_url}/files/{file_id}"
+        self.logger.debug(f"Resolving file: {file_info_req_url}")
+        file_info_res_json = self.file_indexes.get(course_id).get(file_id)
+        if file_info_res_json is None:
+            self.logger.error(f"Failed to fetch file info: {file_info_req_url}")
+            ignore_logger.error(f"{file_info_req_url}: Failed to fetch file info")
+            return 0
+        if self.page_index:
+            existing_path = self.page_index.get_file(
+                course_id, file_id, file_info_res_json
+            )
+            if existing_path:
+                self.logger.debug(f"File already downloaded: {existing_path}")
+                return 0
+        file_name = sanitize_filename(
+            file_info_res_json.get("display_name", f"file_{file_id}")
+        )
+        if not self.sync_filter.matches_file(file_name, file_info_res_json.get("size")):
+            self.logger.debug(f"Skipping filtered file: {file_name}")
+            return 0
+        file_download_url = file_info_res_json.get("url", "")
+        if not file_download_url:
+            self.logger.error(
+                f"File download URL not found: {file_info_req_url}; {file_info_res_json}; {full_url}"
+            )
+            ignore_logger.error(f"{file_info_req_url}: File download URL not found")
+            return 0
+        file_save_path = os.path.join("courses", course_name, "cv_files")
+        # TODO: Not sure if save_dirs should be handled here
+        ensure_dir(file_save_path)
+        file_save_location = os.path.join(file_save_path, file_name)
+        file_info = (file_download_url, file_save_location)
+        search_index = get_search_index()
+        if search_index:
+            search_index.index_document(
+                course_id,
+                course_name,
+                "file",
+                file_id,
+                file_name,
+                file_name,
+                file_save_location,
+            )
+        metadata = course_metadata(course_id)
+        if metadata:
+            metadata.record_file(file_info_res_json, file_save_location)
+        get_progress().add_files(1)
+        if not download_file(file_info, self.client.access_token, file_id):
+            return 0
+        if self.page_index:
+            self.page_index.put_file(course_id, file_id, file_save_location)
+        return os.path.getsize(file_save_location)
+
+    def _record_page(
+        self,
+        page_url: str,
+        link_type: SupportedURLCrawl,
+        course_id,
+        title: Optional[str],
+        updated_at,
+        saved_path: Optional[str],
+    ):
+        metadata = course_metadata(course_id)
+        if metadata:
+            metadata.record_page(
+                page_url,
+                link_type.name.lower(),
+                title,
+                None if updated_at is None else str(updated_at),
+                saved_path,
+            )
+
+    # Function to queue a page or file link that could not be fetched for the retry pass
+    def _record_failure(self, kind: str, url: str, status, course_id, course_name=None):
+        dead_letters = get_dead_letters()
+        if dead_letters is not None:
+            dead_letters.add(
+                kind,
+                url,
+                status,
+                course_id=course_id,
+                course_name=course_name,
+                account=account_for_token(self.client.access_token),
+            )
+
+    # Function to fetch a single page, returns (link type, course id, course name, links, bytes)
+    def _visit_page(self, page_url: str, visited: VisitedSet):
+        try:
+            url_form = urlparse(page_url)
+        except Exception as e:
+            self.logger.error(f"Failed to parse URL: {page_url}")
+            raise Exception(f"Failed to parse URL: {page_url}, Details: {e}")
+
+        visited.add(page_url)
+        self.logger.debug(f"Visiting: {page_url}")
+
+        link_type = self._check_supported_link(url_form)
+
+        if link_type == SupportedURLCrawl.NONE:
+            self.logger.debug(f"Skipping unsupported link: {page_url}")
+            ignore_logger.error(f"{page_url}: Unsupported link")
+            return None
+
+        course_id = self._extract_course_id(page_url)
+        if course_id is None:
+            self.logger.error(f"Failed to extract course ID from URL: {page_url}")
+            ignore_logger.error(f"{page_url}: Failed to extract course ID")
+            # raise Exception(f"Failed to extract course ID from URL: {page_url}")
+        # Pages that still fail after the client's retries are queued, the crawl goes on
+        try:
+            self.logger.debug(f"Fetching course info from: {page_url}")
+            course_info = self._get_course_info(course_id)
+            if course_info is None:
+                self.logger.error(f"Failed to fetch course info: {page_url}")
+                ignore_logger.error(f"{page_url}: Failed to fetch course info")
+                return None
+            course_name = course_info.name or f"Unknown_Course_{course_id}"
+            result = self._get_page_links(page_url, link_type, course_id, course_info)
+        except requests.RequestException as e:
+            self.logger.error(f"Failed to fetch page: {page_url}: {e}")
+            ignore_logger.error(f"{page_url}: Failed to fetch page")
+            self._record_failure(
+                "page", page_url, f"{type(e).__name__}: {e}", course_id
+            )
+            return None
+        if result is None:
+            return None
+        dead_letters = get_dead_letters()
+        if dead_letters is not None:
+            dead_letters.remove(page_url)
+        links, size = result
+        return link_type, course_id, course_name, links, size
+
+    # Function to write the links that were not crawled because a budget ran out
+    def _record_skipped(self, course_name: str, skipped: dict[str, tuple[int, str]]):
+        lines = [
+            f"{reason}\tdepth {depth}\t{url}\n"
+            for url, (depth, reason) in sorted(
+                skipped.items(), key=lambda item: item[1][0]
+            )
+        ]
+        save_path = os.path.join("courses", course_name, "crawl_skipped.txt")
+        get_storage().write_text(save_path, "".join(lines))
+        self.logger.warning(
+            f"Skipped {len(skipped)} links of {course_name} because of crawl budgets"
+        )
+        for line in lines:
+            ignore_logger.error(f"Crawl budget: {line.strip()}")
+
+    # Function to write the groups of duplicate and near-duplicate pages of a crawl
+    def _record_duplicates(self, course_name: str, fingerprints: PageFingerprints):
+        clusters = fingerprints.clusters()
+        if not clusters:
+            return
+        save_path = os.path.join("courses", course_name, "duplicate_pages.txt")
+        get_storage().write_text(save_path, fingerprints.report())
+        self.logger.info(
+            f"Found {len(clusters)} groups of similar pages in {course_name}, "
+            f"{fingerprints.exact_duplicates} exact copies"
+        )
+
+    # Function to crawl and download files/pages, starting from the given pages.
+    # Pages are crawled from a frontier ordered by depth, pages linked from the front page come
+    # first within a depth. When a budget runs out the rest of the frontier is recorded as skipped.
+    # Visited and queued URLs are kept as hashes, every URL is queued at most once.
+    def crawl(self, start_urls: list[str], visited: Optional[VisitedSet] = None):
+        if visited is None:
+            visited = VisitedSet()
+
+        course_budget = BudgetTracker(self.course_budget)
+        order = itertools.count()
+        frontier = [FrontierEntry(0, 0, next(order), url) for url in start_urls]
+        heapq.heapify(frontier)
+        queued = VisitedSet()
+        skipped: dict[str, tuple[int, str]] = {}
+        course_name = None
+        self._fingerprints = PageFingerprints()
+
+        while frontier:
+            entry = heapq.heappop(frontier)
+            depth, page_url = entry.depth, entry.url
+
+            # Check if the page has already been visited
+            if page_url in visited:
+                self.logger.debug(f"Page already visited: {page_url}")
                 continue
-            go_visit = True
-
-            # Check if the link is a file download (Canvas files often have '/files/' in the URL)
-            # TODO: This has been mostly trial and error and needs more research
-
-            # IMPORTANT: The urls in this section need to be converted to API calls
-            if "/files/" in full_url:
-                match = file_id_pattern.search(full_url)
-                if not match:
-                    query_params = parse_qs(parsed_full_url.query)
-                    # Some files have a 'preview' query parameter instead of the file ID
-                    # TODO: This needs to be written as a better case distinction
-                    if "preview" in query_params:
-                        file_id = query_params["preview"][0]
-                    else:
-                        self.logger.error(
-                            f"Failed to parse file ID from URL: {full_url}"
+
+            reason = course_budget.exhausted() or self.global_budget.exhausted()
+            if reason:
+                for entry in [entry] + frontier:
+                    if entry.url not in visited:
+                        skipped.setdefault(entry.url, (entry.depth, reason))
+                break
+
+            result = self._visit_page(page_url, visited)
+            if result is None:
+                continue
+            link_type, course_id, course_name, links, size = result
+            course_budget.consume(pages=1, size=size)
+            get_progress().page_done(size)
+            self.global_budget.consume(pages=1, size=size)
+
+            # Find and download any files in the page, and queue the linked pages
+            for full_url in links:
+                self.logger.info(f"Parsing: {full_url}")
+                if full_url in visited:
+                    continue
+
+                # Check if the link is a file download (Canvas files often have '/files/' in the URL)
+                # TODO: This has been mostly trial and error and needs more research
+                if "/files/" in full_url:
+                    reason = course_budget.exhausted() or self.global_budget.exhausted()
+                    if reason:
+                        skipped.setdefault(full_url, (depth + 1, reason))
+                        continue
+                    visited.add(full_url)
+                    try:
+                        size = self._download_linked_file(
+                            full_url, course_id, course_name
+                        )
+                    except requests.RequestException as e:
+                        self.logger.error(f"Failed to resolve file: {full_url}: {e}")
+                        self._record_failure(
+                            "link",
+                            full_url,
+                            f"{type(e).__name__}: {e}",
+                            course_id,
+                            course_name,
                         )
-                        ignore_logger.error(f"{full_url}: Failed to parse file ID")
                         continue
-                        # raise Exception(f"Failed to parse file ID from URL: {full_url}")
-                else:
-                    file_id = match.group(1)
-                file_info_req_url = f"{course_base_url}/files/{file_id}"
-                self.logger.debug(f"Fetching file: {file_info_req_url}")
-                file_info_res = self.client.get_course_files(course_id, file_id)
-                if len(file_info_res) == 0:
-                    self.logger.error(f"Failed to fetch file info: {file_info_req_url}")
-                    ignore_logger.error(
-                        f"{file_info_req_url}: Failed to fetch file info"
-                    )
+                    course_budget.consume(size=size)
+                    self.global_budget.consume(size=size)
                     continue
-                file_info_res_json = file_info_res[0]
-                file_name = sanitize_filename(
-                    file_info_res_json.get("display_name", f"file_{file_id}")
-                )
-                file_download_url = file_info_res_json.get("url", "")
-                if not file_download_url:
-                    self.logger.error(
-                        f"File download URL not found: {file_info_req_url}; {file_info_res_json}; {full_url}"
-                    )
-                    ignore_logger.error(
-                        f"{file_info_req_url}: File download URL not found"
+                # TODO: Add module support
+                # TODO: Add more edge cases support for pages. Sometimes pages contain other ids on it
+                #       For example it can be /pages/<page_url>#TOC_<page_id>. Both should be supported and crawled
+                #       Furthermore, it should be able to tell if pages are similar or not
+                elif "/pages" in full_url:
+                    self.logger.debug(f"Found page: {full_url}")
+                    if not (
+                        course_budget.allows_depth(depth + 1)
+                        and self.global_budget.allows_depth(depth + 1)
+                    ):
+                        skipped.setdefault(full_url, (depth + 1, "max_depth"))
+                        continue
+                    if full_url in queued:
+                        continue
+                    queued.add(full_url)
+                    from_front_page = link_type == SupportedURLCrawl.HOME
+                    heapq.heappush(
+                        frontier,
+                        FrontierEntry(
+                            depth + 1,
+                            0 if from_front_page else 1,
+                            next(order),
+                            full_url,
+                        ),
                     )
-                    continue
-                file_save_path = os.path.join("courses", course_name, "cv_files")
-                # TODO: Not sure if save_dirs should be handled here
-                os.makedirs(file_save_path, exist_ok=True)
-                file_save_location = os.path.join(file_save_path, file_name)
-                file_info = (file_download_url, file_save_location)
-                download_file(file_info, self.client.access_token)
+                else:
+                    # TODO: Investigate other link types
+                    self.logger.warning(f"Link type not supported: {full_url}")
+                    ignore_logger.error(f"{full_url}: Link type not supported")
+
+        # Links that were reached later through another page were not skipped after all
+        skipped = {url: entry for url, entry in skipped.items() if url not in visited}
+        if skipped and course_name:
+            self._record_skipped(course_name, skipped)
+        if course_name:
+            self._record_duplicates(course_name, self._fingerprints)
+
+    # Function to retry a queued page or file link, failing again queues it with one more attempt
+    def retry_dead_letter(self, entry: DeadLetter):
+        if entry.kind == "page":
+            self.crawl([entry.url])
+            return
+        try:
+            self._download_linked_file(
+                entry.url, int(entry.course_id), entry.course_name
+            )
+        except requests.RequestException as e:
+            self.logger.error(f"Failed to resolve file: {entry.url}: {e}")
+            self._record_failure(
+                "link",
+                entry.url,
+                f"{type(e).__name__}: {e}",
+                entry.course_id,
+                entry.course_name,
+            )
+            return
+        dead_letters = get_dead_letters()
+        if dead_letters is not None:
+            dead_letters.remove(entry.url)
+
+    # Function to crawl and download files/pages reachable from a single page
+    def crawl_page(self, page_url: str, visited: Optional[VisitedSet] = None):
+        self.crawl([page_url], visited)
+
+    # Function to fetch the syllabus and every page of a course without saving anything, for the
+    # event stream. Yields (url, link type, title, html body, updated_at) one page at a time.
+    def iter_pages(self, course_id: int):
+        course_url = (
+            f"{self.client.api_url}{COURSES_ENDPOINT.format(course_id=course_id)}"
+        )
+        course_info = self._get_course_info(course_id)
+        if course_info is not None and course_info.syllabus_body:
+            yield (
+                f"{course_url}?include[]=syllabus_body",
+                SupportedURLCrawl.SYLLABUS,
+                f"{course_info.name} syllabus",
+                course_info.syllabus_body,
+                None,
+            )
+
+        listing = self._get_page_listing(course_id)
+        if not listing:
+            # Courses with a hidden pages tab can still have a front page
+            response = self.client.get_course_frontpage(course_id)
+            if response.status_code == 200 and response.data.body:
+                yield (
+                    f"{self.client.api_url}{COURSE_FRONTPAGE_ENDPOINT.format(course_id=course_id)}",
+                    SupportedURLCrawl.HOME,
+                    response.data.title,
+                    response.data.body,
+                    response.data.updated_at,
+                )
+            return
+
+        for slug, page in listing.items():
+            page_url = f"{self.client.api_url}{COURSE_PAGE_ENDPOINT.format(course_id=course_id, page_id=slug)}"
+            response = self.client.get_course_page(course_id, slug)
+            if response.status_code != 200 or not response.data.body:
+                self.logger.error(f"Failed to fetch page: {page_url}")
                 continue
-            # TODO: Add module support
-            # TODO: Add more edge cases support for pages. Sometimes pages contain other ids on it
-            #       For example it can be /pages/<page_url>#TOC_<page_id>. Both should be supported and crawled
-            #       Furthermore, it should be able to tell if pages are similar or not
-            elif "/pages" in full_url:
-                self.logger.debug(f"Found page: {full_url}")
-                self.crawl_page(full_url, visited)
-                # page_id = href.split("/")[-1]
-                # full_url = f"{BASE_URL}/pages/{page_id}"
-            else:
-                # TODO: Investigate other link types
-                self.logger.warning(f"Link type not supported: {full_url}")
-                ignore_logger.error(f"{full_url}: Link type not supported")
+            yield (
+                page_url,
+                (
+                    SupportedURLCrawl.HOME
+                    if page.get("front_page")
+                    else SupportedURLCrawl.PAGES
+                ),
+                response.data.title,
+                response.data.body,
+                response.data.updated_at,
+            )
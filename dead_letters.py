@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from storage import COURSES_ROOT
+
+DEAD_LETTERS_PATH = os.path.join(COURSES_ROOT, "dead_letters.sqlite")
+
+# Delay before the first retry of a failure, doubled with every failed attempt
+RETRY_BASE_DELAY = 30.0
+RETRY_MAX_DELAY = 6 * 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS failures (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    file_id TEXT,
+    course_id TEXT,
+    course_name TEXT,
+    save_path TEXT,
+    status TEXT,
+    attempts INTEGER NOT NULL,
+    first_failed REAL NOT NULL,
+    last_failed REAL NOT NULL,
+    next_attempt REAL NOT NULL,
+    account TEXT
+);
+"""
+
+
+@dataclass
+class DeadLetter:
+    key: str
+    kind: str
+    url: str
+    file_id: Optional[str]
+    course_id: Optional[str]
+    course_name: Optional[str]
+    save_path: Optional[str]
+    status: Optional[str]
+    attempts: int
+    first_failed: float
+    last_failed: float
+    next_attempt: float
+    # The account whose token failed, retries use the same account
+    account: Optional[str] = None
+
+    # Timeouts, connection errors, throttling and server errors are worth retrying,
+    # other HTTP errors (e.g. 403 for locked files) only with --all
+    @property
+    def transient(self) -> bool:
+        if self.status is None or not self.status.isdigit():
+            return True
+        status = int(self.status)
+        return status in (408, 429) or status >= 500
+
+
+FIELDS = tuple(DeadLetter.__dataclass_fields__)
+
+
+def _course_from_path(save_path: Optional[str]) -> Optional[str]:
+    if not save_path:
+        return None
+    parts = os.path.normpath(save_path).split(os.sep)
+    if len(parts) > 2 and parts[0] == COURSES_ROOT:
+        return parts[1]
+    return None
+
+
+# Persistent queue of failed downloads ("file", keyed by save path), page fetches ("page") and
+# file links the crawler could not resolve ("link", both keyed by URL). A failure that succeeds
+# later, in a run or in the retry pass, is removed.
+class DeadLetterQueue:
+    def __init__(self, path: str = DEAD_LETTERS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(failures)")}
+        if "account" not in columns:
+            # Queues written before failures recorded their account
+            self._conn.execute("ALTER TABLE failures ADD COLUMN account TEXT")
+        self._lock = threading.Lock()
+        # Keys in the queue, so successes of items that never failed cost no query
+        self._keys = {row[0] for row in self._conn.execute("SELECT key FROM failures")}
+
+    def add(
+        self,
+        kind: str,
+        url: str,
+        status,
+        save_path: Optional[str] = None,
+        file_id=None,
+        course_id=None,
+        course_name: Optional[str] = None,
+        account: Optional[str] = None,
+    ):
+        key = save_path if kind == "file" and save_path else url
+        course_name = course_name or _course_from_path(save_path)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM failures WHERE key = ?", (key,)
+            ).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+            self._conn.execute(
+                "INSERT INTO failures (key, kind, url, file_id, course_id, course_name, save_path, "
+                "status, attempts, first_failed, last_failed, next_attempt, account) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET url = excluded.url, status = excluded.status, "
+                "attempts = excluded.attempts, last_failed = excluded.last_failed, "
+                "next_attempt = excluded.next_attempt, "
+                "file_id = COALESCE(excluded.file_id, file_id), "
+                "course_id = COALESCE(excluded.course_id, course_id), "
+                "course_name = COALESCE(excluded.course_name, course_name), "
+                "account = COALESCE(excluded.account, account)",
+                (
+                    key,
+                    kind,
+                    url,
+                    None if file_id is None else str(file_id),
+                    None if course_id is None else str(course_id),
+                    course_name,
+                    save_path,
+                    str(status),
+                    attempts,
+                    now,
+                    now,
+                    now + delay,
+                    account,
+                ),
+            )
+            self._conn.commit()
+            self._keys.add(key)
+
+    def remove(self, key: str):
+        with self._lock:
+            if key not in self._keys:
+                return
+            self._conn.execute("DELETE FROM failures WHERE key = ?", (key,))
+            self._conn.commit()
+            self._keys.discard(key)
+
+    # Function to list the queued failures, optionally only those due for a retry
+    def entries(
+        self, due: bool = False, max_attempts: Optional[int] = None
+    ) -> list[DeadLetter]:
+        query = f"SELECT {', '.join(FIELDS)} FROM failures WHERE 1 = 1"
+        params: list = []
+        if due:
+            query += " AND next_attempt <= ?"
+            params.append(time.time())
+        if max_attempts is not None:
+            query += " AND attempts < ?"
+            params.append(max_attempts)
+        with self._lock:
+            rows = self._conn.execute(
+                query + " ORDER BY next_attempt", params
+            ).fetchall()
+        return [DeadLetter(*row) for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_dead_letters: Optional[DeadLetterQueue] = None
+
+
+# The queue failures are recorded into, None when it is disabled
+def get_dead_letters() -> Optional[DeadLetterQueue]:
+    return _dead_letters
+
+
+def set_dead_letters(queue: Optional[DeadLetterQueue]):
+    global _dead_letters
+    _dead_letters = queue
@@ -0,0 +1,125 @@
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Pages whose SimHash differs in at most this many of the 64 bits are near-duplicates
+NEAR_DUPLICATE_DISTANCE = 3
+SHINGLE_SIZE = 3
+
+# Splitting the 64-bit SimHash into DISTANCE + 1 bands guarantees that two near-duplicates
+# share at least one band exactly, so candidates are found without comparing every pair
+_BANDS = NEAR_DUPLICATE_DISTANCE + 1
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+_token_pattern = re.compile(r"\w+")
+
+
+# Function to compute the 64-bit SimHash of a document from its word shingles.
+# Works on raw HTML too: markup tokens make shared navigation blocks count.
+def simhash(text: str) -> int:
+    tokens = _token_pattern.findall(text.lower())
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [
+            " ".join(tokens[i : i + SHINGLE_SIZE])
+            for i in range(len(tokens) - SHINGLE_SIZE + 1)
+        ]
+
+    # Count the set bits per position column-wise over the binary strings, which keeps
+    # the per-bit loop out of Python for pages with thousands of shingles
+    hashes = [
+        format(
+            int.from_bytes(
+                hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big"
+            ),
+            "064b",
+        )
+        for shingle in shingles
+    ]
+    half = len(hashes) / 2
+    bits = "".join(
+        "1" if column.count("1") > half else "0"
+        for column in map("".join, zip(*hashes))
+    )
+    return int(bits, 2)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+@dataclass
+class PageFingerprint:
+    url: str
+    body_hash: str
+    simhash: int
+    saved_path: Optional[str] = None
+    links: list[str] = field(default_factory=list)
+
+
+# Fingerprints of the pages of a crawl. Finds exact copies by body hash and near-duplicates
+# by SimHash, and groups near-duplicates into clusters for the report.
+class PageFingerprints:
+    def __init__(self, max_distance: int = NEAR_DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        self._by_hash: dict[str, PageFingerprint] = {}
+        self._pages: list[PageFingerprint] = []
+        self._bands: list[dict[int, list[int]]] = [{} for _ in range(_BANDS)]
+        self._parents: list[int] = []
+        self.exact_duplicates = 0
+
+    # Returns the first page with exactly the same body
+    def find_exact(self, body_hash: str) -> Optional[PageFingerprint]:
+        return self._by_hash.get(body_hash)
+
+    def _find(self, index: int) -> int:
+        while self._parents[index] != index:
+            self._parents[index] = self._parents[self._parents[index]]
+            index = self._parents[index]
+        return index
+
+    def add(self, fingerprint: PageFingerprint):
+        index = len(self._pages)
+        self._pages.append(fingerprint)
+        self._parents.append(index)
+        if fingerprint.body_hash in self._by_hash:
+            self.exact_duplicates += 1
+        else:
+            self._by_hash[fingerprint.body_hash] = fingerprint
+
+        for band, buckets in enumerate(self._bands):
+            key = fingerprint.simhash >> (band * _BAND_BITS) & _BAND_MASK
+            candidates = buckets.setdefault(key, [])
+            for candidate in candidates:
+                other = self._pages[candidate]
+                if (
+                    hamming_distance(fingerprint.simhash, other.simhash)
+                    <= self.max_distance
+                ):
+                    self._parents[self._find(index)] = self._find(candidate)
+            candidates.append(index)
+
+    # Function to list the groups of exact and near-duplicate pages (clusters of two or more)
+    def clusters(self) -> list[list[PageFingerprint]]:
+        groups: dict[int, list[PageFingerprint]] = {}
+        for index, fingerprint in enumerate(self._pages):
+            groups.setdefault(self._find(index), []).append(fingerprint)
+        return [group for group in groups.values() if len(group) > 1]
+
+    # Function to render the duplicate clusters as text
+    def report(self) -> str:
+        lines = []
+        for number, cluster in enumerate(self.clusters(), start=1):
+            first = cluster[0]
+            lines.append(f"Cluster {number} ({len(cluster)} pages)\n")
+            for fingerprint in cluster:
+                if fingerprint.body_hash == first.body_hash:
+                    kind = "exact"
+                else:
+                    distance = hamming_distance(fingerprint.simhash, first.simhash)
+                    kind = f"distance {distance}"
+                lines.append(f"  {kind}\t{fingerprint.url}\n")
+        return "".join(lines)
@@ -0,0 +1,1092 @@
+from contextlib import contextmanager
+import os
+import signal
+import threading
+import time
+from typing import Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import itertools
+import json
+from accounts import (
+    Account,
+    CoursePlan,
+    account_for_token,
+    load_accounts,
+    plan_courses,
+    set_accounts,
+)
+from api import CanvasAPIClient
+from crawler import CanvasCrawler
+from crawl_budget import BudgetTracker, CrawlBudget
+from dead_letters import (
+    DeadLetter,
+    DeadLetterQueue,
+    get_dead_letters,
+    set_dead_letters,
+)
+from endpoints import COURSE_FRONTPAGE_ENDPOINT, COURSES_ENDPOINT
+from functions import (
+    download_file,
+    PendingDownload,
+    get_page_content,
+    is_up_to_date,
+    save_assignment_description,
+    save_grade_and_comments,
+    save_page_content,
+)
+
+from file_index import CourseFileIndex
+from filters import SyncFilter
+from logger import main_logger, api_logger, crawl_logger, ignore_logger
+from storage import COURSES_ROOT, create_storage, get_storage, set_storage
+from metadata import MetadataStore, course_metadata, get_metadata, set_metadata
+from manifest import DownloadManifest, get_manifest, set_manifest
+from page_index import PageIndex
+from recording import RecordingSession, ReplaySession
+from progress import ProgressReporter, get_progress
+from profiling import PhaseProfiler
+from rate_limit import mount_rate_limiter
+from search_index import SearchIndex, get_search_index, set_search_index
+from transport import TransferSettings, get_session, set_session, set_transfer_settings
+from visited import VisitedSet
+from writer import (
+    WriteBehindWriter,
+    ensure_dir,
+    get_writer,
+    set_writer,
+)
+from watch import WATCH_STATE_PATH, AdaptiveInterval, ChangeWatcher
+
+from config import (
+    CANVAS_ACCESS_TOKEN,
+    CANVAS_ACCESS_TOKENS,
+    CANVAS_API_URL,
+    CANVAS_DOMAIN,
+    VISITED_BLOOM_CAPACITY,
+    VISITED_ERROR_RATE,
+    VISITED_MAX_EXACT,
+)
+
+
+# Function to download files in parallel. Only a few downloads per worker are submitted at
+# a time, so the number of futures stays bounded for courses with thousands of files.
+# A download that raises is queued as a dead letter, the other downloads go on.
+def download_files(
+    file_downloads: list[PendingDownload], access_token: str, workers: int = 1
+):
+    progress = get_progress()
+    progress.add_files(len(file_downloads))
+    # The workers count for the course of the calling thread
+    course = progress.current_course()
+    workers = max(1, min(workers, len(file_downloads)))
+    pending = iter(file_downloads)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight: dict = {}
+        while True:
+            for download in itertools.islice(pending, 2 * workers - len(in_flight)):
+                future = executor.submit(
+                    progress.in_course,
+                    course,
+                    download_file,
+                    (download.url, download.save_path),
+                    access_token,
+                    download.file_id,
+                )
+                in_flight[future] = download
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                download = in_flight.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    main_logger.exception(f"Download of {download.url} failed")
+                    ignore_logger.error(f"{download.url}: Couldn't download file")
+                    dead_letters = get_dead_letters()
+                    if dead_letters is not None:
+                        dead_letters.add(
+                            "file",
+                            download.url,
+                            f"{type(e).__name__}: {e}",
+                            download.save_path,
+                            download.file_id,
+                            account=account_for_token(access_token),
+                        )
+
+
+# Function to create the visited set of a crawl, with a Bloom filter tier when VISITED_MAX_EXACT is set
+def new_visited_set() -> VisitedSet:
+    return VisitedSet(
+        max_exact=int(VISITED_MAX_EXACT) if VISITED_MAX_EXACT else None,
+        bloom_capacity=VISITED_BLOOM_CAPACITY,
+        error_rate=VISITED_ERROR_RATE,
+    )
+
+
+# Context manager that logs a failing phase and lets the course go on with the next phase.
+# The names of failed phases are added to failures when it is given.
+@contextmanager
+def continue_on_error(
+    phase_name: str, course_name: str, failures: Optional[list[str]] = None
+):
+    try:
+        yield
+    except Exception:
+        main_logger.exception(f"Phase {phase_name} failed for course {course_name}")
+        ignore_logger.error(f"{course_name}: Phase {phase_name} failed")
+        if failures is not None:
+            failures.append(phase_name)
+
+
+# TODO: Obviously this also needs to be refactored and functions need to be merged
+
+
+# Main function to download assignment details, submissions, and save results
+def download_assignments_and_submissions(
+    client: CanvasAPIClient,
+    course_id: str,
+    course_name: str,
+    workers: int = 1,
+    sync_filter: Optional[SyncFilter] = None,
+    account_name: Optional[str] = None,
+    incremental: bool = False,
+):
+    sync_filter = sync_filter or SyncFilter()
+    # Get all assignments for the course
+    assignments = client.get_course_assignments(course_id)
+    if not assignments:
+        main_logger.warning(f"No assignments found for course: {course_name}")
+        return
+
+    file_downloads = []  # List to hold all file download tasks
+    search_index = get_search_index()
+    metadata = course_metadata(course_id)
+
+    for assignment in assignments:
+        assignment_name = assignment.get("name", "Unnamed_Assignment").replace("/", "_")
+        assignment_id = assignment["id"]
+        main_logger.debug(f"  Assignment: {assignment_name} (ID: {assignment_id})")
+
+        # Create directory structure for the assignment, in multi-account runs
+        # every account gets its own copy because submissions and grades are personal
+        assignments_dir = os.path.join("courses", course_name, "cv_assignments")
+        if account_name:
+            assignments_dir = os.path.join(assignments_dir, account_name)
+        course_dir = os.path.join(assignments_dir, assignment_name)
+        ensure_dir(course_dir)
+
+        # Save assignment description if available
+        description = assignment.get("description", None)
+        description_file_path = os.path.join(course_dir, "assignment_description.txt")
+        save_assignment_description(description_file_path, description)
+        if metadata:
+            metadata.record_assignment(
+                assignment, description_file_path if description else None
+            )
+        if search_index and description:
+            search_index.index_html(
+                course_id,
+                course_name,
+                "assignment",
+                assignment_id,
+                assignment_name,
+                description,
+                description_file_path,
+            )
+
+        # Download any attached files in the assignment description
+        if "attachments" in assignment and assignment["attachments"]:
+            for attachment in assignment["attachments"]:
+                file_name = attachment["display_name"].replace("/", "_")
+                if not sync_filter.matches_file(file_name, attachment.get("size")):
+                    continue
+                file_url = attachment["url"]
+                save_path = os.path.join(course_dir, file_name)
+                if metadata:
+                    metadata.record_file(attachment, save_path)
+                # Indexed like the files phase, also when the file is already up to date
+                if search_index:
+                    search_index.index_document(
+                        course_id,
+                        course_name,
+                        "file",
+                        attachment["id"],
+                        file_name,
+                        file_name,
+                        save_path,
+                    )
+                if incremental and is_up_to_date(save_path, attachment):
+                    continue
+                file_downloads.append(PendingDownload(file_url, save_path))
+
+        # Fetch submission details
+        submission = client.get_course_self_assignment_submission(
+            course_id, assignment_id
+        )
+        if submission:
+            # Download any files attached to the submission
+            if "attachments" in submission and submission["attachments"]:
+                for attachment in submission["attachments"]:
+                    file_name = attachment["display_name"].replace("/", "_")
+                    if not sync_filter.matches_file(file_name, attachment.get("size")):
+                        continue
+                    file_url = attachment["url"]
+                    save_path = os.path.join(course_dir, f"submission_{file_name}")
+                    if metadata:
+                        metadata.record_file(attachment, save_path)
+                    if incremental and is_up_to_date(save_path, attachment):
+                        continue
+                    file_downloads.append(PendingDownload(file_url, save_path))
+
+            # Save grade and comments to a text file
+            result_file_path = os.path.join(course_dir, "assignment_result_score.txt")
+            save_grade_and_comments(result_file_path, submission)
+            if metadata:
+                metadata.record_submission(
+                    assignment_id, submission, account_name, result_file_path
+                )
+            if search_index:
+                comments = " ".join(
+                    comment.get("comment", "")
+                    for comment in submission.get("submission_comments") or []
+                )
+                search_index.index_document(
+                    course_id,
+                    course_name,
+                    "grade",
+                    (
+                        f"{account_name}:{assignment_id}"
+                        if account_name
+                        else assignment_id
+                    ),
+                    assignment_name,
+                    f"Grade: {submission.get('grade')} {comments}",
+                    result_file_path,
+                )
+        else:
+            main_logger.warning(
+                f"    No submission found for assignment: {assignment_name}"
+            )
+
+    # Parallel downloading of files
+    if file_downloads:
+        download_files(file_downloads, client.access_token, workers)
+    else:
+        main_logger.warning(f"  No files to download for course: {course_name}")
+
+
+def download_all_files(
+    client: CanvasAPIClient,
+    course_id: str,
+    course_name: str,
+    workers: int = 1,
+    file_index: Optional[CourseFileIndex] = None,
+    sync_filter: Optional[SyncFilter] = None,
+    incremental: bool = False,
+):
+    sync_filter = sync_filter or SyncFilter()
+    # Get all files for the course, the index fetches the listing once for all phases
+    file_index = file_index or CourseFileIndex(client, course_id)
+    files = [
+        file
+        for file in file_index.files()
+        if sync_filter.matches_file(file["display_name"], file.get("size"))
+    ]
+    if files:
+        main_logger.info(f"Found {len(files)} files for course: {course_name}")
+
+        # Create a directory only if there are files
+        course_dir = os.path.join("courses", course_name)
+        ensure_dir(course_dir)
+
+        # Prepare file info for parallel downloading, incremental syncs only download
+        # new and changed files
+        file_downloads = []
+        search_index = get_search_index()
+        metadata = course_metadata(course_id)
+        for file in files:
+            save_path = os.path.join(course_dir, file["display_name"].replace("/", "_"))
+            if metadata:
+                metadata.record_file(file, save_path)
+            if not (incremental and is_up_to_date(save_path, file)):
+                file_downloads.append(
+                    PendingDownload(file["url"], save_path, file["id"])
+                )
+            if search_index:
+                search_index.index_document(
+                    course_id,
+                    course_name,
+                    "file",
+                    file["id"],
+                    file["display_name"],
+                    file["display_name"],
+                    save_path,
+                )
+
+        # Download the files in parallel
+        if file_downloads:
+            download_files(file_downloads, client.access_token, workers)
+    else:
+        main_logger.warning(f"No files found for course: {course_name}")
+
+
+# Main function to download files from modules in all courses
+def download_files_from_modules(
+    client: CanvasAPIClient,
+    course_id: str,
+    course_name: str,
+    workers: int = 1,
+    file_index: Optional[CourseFileIndex] = None,
+    sync_filter: Optional[SyncFilter] = None,
+    incremental: bool = False,
+):
+    sync_filter = sync_filter or SyncFilter()
+    file_index = file_index or CourseFileIndex(client, course_id)
+
+    # Get all modules for the course
+    modules = client.get_modules(course_id)
+    if not modules:
+        main_logger.warning(f"No modules found for course: {course_name}")
+        return
+
+    # List to hold all files that need to be downloaded
+    file_downloads = []
+    external_links = []
+    cant_download = []
+    search_index = get_search_index()
+    metadata = course_metadata(course_id)
+
+    for module in modules:
+        module_name = module.get("name", "Unnamed_Module").replace("/", "_")
+        module_id = module["id"]
+        main_logger.debug(f"  Module: {module_name} (ID: {module_id})")
+        if metadata:
+            metadata.record_module(module)
+
+        # Get all items in the module
+        module_items = client.get_module_items(course_id, module_id)
+        if not module_items:
+            main_logger.warning(f"    No items found in module: {module_name}")
+            continue
+
+        for item in module_items:
+            # Check the type of item
+            item_type = item["type"]
+            save_path = None
+
+            # TODO: Needs to be same implementation as crawler
+            if item_type == "File":
+                # Handle file attachments
+                file_name = item["title"].replace("/", "_")
+                file_id = item["content_id"]
+                file_obj = file_index.get(file_id)
+                if file_obj is None:
+                    main_logger.error(f"Failed to fetch file info: {file_id}")
+                    ignore_logger.error(
+                        f"{course_name}: Failed to fetch file info for module file {file_id}"
+                    )
+                    continue
+                if not sync_filter.matches_file(
+                    file_obj.get("display_name", file_name), file_obj.get("size")
+                ):
+                    main_logger.debug(f"Skipping filtered file: {file_name}")
+                    continue
+                # Prepare the download directory for the course and module
+                course_dir = os.path.join(
+                    "courses", course_name, "cv_modules", module_name
+                )
+                ensure_dir(course_dir)
+
+                url = file_obj.get("url", "")
+                if url == "":
+                    main_logger.error(f"Can't download {file_obj['display_name']}")
+                    main_logger.error(f"  File ID: {file_id}")
+                    main_logger.error(f"  File URL: {url}")
+                    main_logger.error(f"  f{json.dumps(file_obj)}")
+
+                    # Also save the file info, all of them are written after the modules
+                    cant_download.append(file_obj)
+                    if metadata:
+                        metadata.record_cant_download(
+                            file_id,
+                            module_id,
+                            item.get("title"),
+                            "no download URL",
+                            file_obj,
+                        )
+                else:
+                    save_path = os.path.join(course_dir, file_name)
+                    if metadata:
+                        metadata.record_file(file_obj, save_path)
+                    if not (incremental and is_up_to_date(save_path, file_obj)):
+                        file_downloads.append(PendingDownload(url, save_path, file_id))
+                    if search_index:
+                        search_index.index_document(
+                            course_id,
+                            course_name,
+                            "file",
+                            file_id,
+                            file_name,
+                            file_name,
+                            save_path,
+                        )
+
+            elif item_type == "ExternalUrl":
+                # Save external links
+                external_link = item["external_url"]
+                external_links.append(external_link)
+
+            # TODO: Needs to be rechecked
+            elif item_type == "Page":
+                # Handle Canvas pages
+                page_url = item["url"]  # Use the page URL provided in the item
+                page_title = item["title"].replace("/", "_")
+                page_content = get_page_content(page_url, client.access_token)
+
+                # Prepare the page save path, the storage backend creates the directories
+                course_dir = os.path.join(
+                    "courses", course_name, "cv_modules", module_name
+                )
+
+                save_path = os.path.join(course_dir, f"{page_title}.txt")
+                save_page_content(page_content, save_path)
+                if metadata:
+                    metadata.record_page(
+                        page_url, "module_page", item.get("title"), None, save_path
+                    )
+
+            if metadata:
+                metadata.record_module_item(module_id, item, save_path)
+
+    # Download files in parallel
+    if file_downloads:
+        main_logger.debug(f"Downloading {len(file_downloads)} files")
+        download_files(file_downloads, client.access_token, workers)
+    else:
+        main_logger.warning(
+            f"  No files to download in modules for course: {course_name}"
+        )
+
+    # Save external links to a file
+    if external_links:
+        external_links_path = os.path.join("courses", course_name, "external_links.txt")
+        get_storage().write_text(
+            external_links_path, "".join(link + "\n" for link in external_links)
+        )
+        main_logger.debug(f"Saved external links to: {external_links_path}")
+
+    if cant_download:
+        cant_download_path = os.path.join(
+            "courses", course_name, "cv_modules", "cant_download.txt"
+        )
+        get_storage().write_text(
+            cant_download_path,
+            "".join(json.dumps(file_obj) + "\n" for file_obj in cant_download),
+        )
+
+
+# Main function to download all files for each course.
+# Returns the ids of the courses in which a phase failed.
+def download_content_from_course(
+    client: CanvasAPIClient,
+    crawler: CanvasCrawler,
+    workers: int = 1,
+    profiler: Optional[PhaseProfiler] = None,
+    sync_filter: Optional[SyncFilter] = None,
+    enrollment_state: Optional[str] = None,
+    plan: Optional[CoursePlan] = None,
+    account_name: Optional[str] = None,
+    incremental: bool = False,
+) -> set:
+    profiler = profiler or PhaseProfiler()
+    sync_filter = sync_filter or SyncFilter()
+    file_indexes = crawler.file_indexes
+    progress = get_progress()
+    failed_courses: set = set()
+    if plan is None:
+        plan = CoursePlan(list_courses(client, sync_filter, enrollment_state), [])
+    courses = plan.owned + plan.submissions_only
+    submissions_only = {course["id"] for course in plan.submissions_only}
+    progress.add_courses(len(courses))
+
+    # for idx, course in enumerate(courses):
+    #     course_name = course.get("name", "Unnamed_Course").replace("/", "_")
+    #     course_id = course["id"]
+    #     print(f"{course_name} : {course_id}")
+
+    for course in courses:
+        course_name = course.get("name", "Unnamed_Course").replace(
+            "/", "_"
+        )  # Avoid directory issues with slashes
+        course_id = course["id"]
+
+        progress.start_course(course_name)
+        failures: list[str] = []
+        main_logger.info(f"Fetching \nCourse: {course_name} (ID: {course_id})")
+        metadata_store = get_metadata()
+        if metadata_store:
+            metadata_store.open(course_id, course_name).record_course(course)
+
+        # Courses shared with another account are downloaded by that account,
+        # only the submissions and grades of this account are fetched here
+        if course_id in submissions_only:
+            if sync_filter.wants("assignments"):
+                with profiler.phase(
+                    "download_assignments_and_submissions", course_name
+                ), continue_on_error(
+                    "download_assignments_and_submissions", course_name, failures
+                ):
+                    download_assignments_and_submissions(
+                        client,
+                        course_id,
+                        course_name,
+                        workers,
+                        sync_filter,
+                        account_name,
+                        incremental,
+                    )
+            if metadata_store:
+                metadata_store.release(course_id)
+            if failures:
+                failed_courses.add(course_id)
+            progress.finish_course()
+            continue
+
+        with profiler.course(course_name):
+            # Phases can be disabled with --only/--skip
+            file_index = file_indexes.get(course_id)
+            if sync_filter.wants("files"):
+                with profiler.phase(
+                    "download_all_files", course_name
+                ), continue_on_error("download_all_files", course_name, failures):
+                    download_all_files(
+                        client,
+                        course_id,
+                        course_name,
+                        workers,
+                        file_index,
+                        sync_filter,
+                        incremental,
+                    )
+            if sync_filter.wants("modules"):
+                with profiler.phase(
+                    "download_files_from_modules", course_name
+                ), continue_on_error(
+                    "download_files_from_modules", course_name, failures
+                ):
+                    download_files_from_modules(
+                        client,
+                        course_id,
+                        course_name,
+                        workers,
+                        file_index,
+                        sync_filter,
+                        incremental,
+                    )
+            if sync_filter.wants("assignments"):
+                with profiler.phase(
+                    "download_assignments_and_submissions", course_name
+                ), continue_on_error(
+                    "download_assignments_and_submissions", course_name, failures
+                ):
+                    download_assignments_and_submissions(
+                        client,
+                        course_id,
+                        course_name,
+                        workers,
+                        sync_filter,
+                        account_name,
+                        incremental,
+                    )
+
+            if sync_filter.wants("pages"):
+                # Starting points for crawling
+                homepage_url = f"{CANVAS_API_URL}{COURSE_FRONTPAGE_ENDPOINT.format(course_id=course_id)}"
+                syllabus_url = f"{CANVAS_API_URL}{COURSES_ENDPOINT.format(course_id=course_id)}?include[]=syllabus_body"
+
+                # Start crawling from the homepage
+                visited_links = new_visited_set()  # To avoid re-crawling the same pages
+                with profiler.phase("crawl_page", course_name), continue_on_error(
+                    "crawl_page", course_name, failures
+                ):
+                    crawler.crawl([homepage_url, syllabus_url], visited_links)
+            file_indexes.release(course_id)
+            crawler.forget_course(course_id)
+            if metadata_store:
+                metadata_store.release(course_id)
+        if failures:
+            failed_courses.add(course_id)
+        progress.finish_course()
+
+    progress.finish()
+    return failed_courses
+
+
+# Function to list the courses of an account that match the filter
+def list_courses(
+    client: CanvasAPIClient,
+    sync_filter: SyncFilter,
+    enrollment_state: Optional[str] = None,
+) -> list[dict]:
+    courses = client.get_courses(enrollment_state=enrollment_state)
+    if not courses:
+        main_logger.warning("No courses found.")
+        return []
+
+    # Filter on the listing alone, skipped courses don't cost a single request
+    matching = [course for course in courses if sync_filter.matches_course(course)]
+    main_logger.info(f"Processing {len(matching)} of {len(courses)} courses")
+    return matching
+
+
+# Function to create the API client from the environment, exits if it is not configured
+def create_client(access_token: Optional[str] = None) -> CanvasAPIClient:
+    access_token = access_token or CANVAS_ACCESS_TOKEN
+    if not access_token or not CANVAS_DOMAIN:
+        print("NOTICE: Please set the environment variables for Canvas API access.")
+        exit(1)
+
+    return CanvasAPIClient(
+        access_token=access_token, domain_url=CANVAS_DOMAIN, logger=api_logger
+    )
+
+
+# Function to install the recording or replaying HTTP session selected on the command line
+def configure_session(args):
+    if args.record and args.replay:
+        print("NOTICE: --record and --replay can't be used together.")
+        exit(1)
+    if args.record:
+        set_session(RecordingSession(args.record, args.record_max_body))
+        main_logger.info(f"Recording HTTP traffic to: {args.record}")
+    elif args.replay:
+        set_session(ReplaySession(args.replay, args.replay_latency_scale))
+        main_logger.info(f"Replaying HTTP traffic from: {args.replay}")
+
+
+# Function to start the write-behind stage selected on the command line
+def configure_writer(args):
+    if args.write_queue > 0:
+        set_writer(WriteBehindWriter(args.write_queue, args.fsync))
+
+
+# Function to write out everything pending and stop the write-behind stage, its metrics go to the log
+def close_writer():
+    writer = get_writer()
+    if writer is None:
+        return
+    writer.close()
+    set_writer(None)
+    main_logger.info(f"Write-behind stage: {writer.metrics()}")
+
+
+# Function to set up the HTTP layer for the configured accounts: recording or replaying,
+# timeouts, and one connection pool for the workers of all accounts with a rate limit per token
+def configure_transfers(args, workers: int) -> dict[str, CanvasAPIClient]:
+    configure_session(args)
+    set_transfer_settings(
+        TransferSettings(
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            min_download_rate=args.min_download_rate,
+            stall_window=args.stall_window,
+            retries=args.retries,
+            hedge_percentile=args.hedge_percentile,
+            segment_threshold=int(args.segment_threshold * 1024 * 1024),
+            segments=args.segments,
+        )
+    )
+    accounts = load_accounts(CANVAS_ACCESS_TOKENS, CANVAS_ACCESS_TOKEN)
+    if not accounts:
+        print("NOTICE: Please set the environment variables for Canvas API access.")
+        exit(1)
+    set_accounts(accounts)
+
+    mount_rate_limiter(
+        get_session(),
+        rate=args.rate_limit,
+        burst=args.rate_limit_burst,
+        pool_maxsize=max(10, workers * len(accounts) + args.segments),
+    )
+    return {account.name: create_client(account.access_token) for account in accounts}
+
+
+def run(args):
+    if not args.workers:
+        print("NOTICE: Please set the number of workers for the crawler.")
+        exit(1)
+    workers = args.workers
+    accounts = load_accounts(CANVAS_ACCESS_TOKENS, CANVAS_ACCESS_TOKEN)
+    clients = configure_transfers(args, workers)
+
+    set_storage(create_storage(args.storage, COURSES_ROOT, args.compression))
+    configure_writer(args)
+    if args.search_index:
+        set_search_index(SearchIndex())
+    if args.metadata:
+        set_metadata(MetadataStore())
+    set_manifest(DownloadManifest())
+    set_dead_letters(DeadLetterQueue())
+
+    page_index = None if args.full_crawl else PageIndex()
+    sync_filter = SyncFilter.from_args(args)
+    global_budget = BudgetTracker(CrawlBudget.from_env("GLOBAL_CRAWL"))
+    crawlers = {
+        name: CanvasCrawler(
+            client,
+            sync_filter=sync_filter,
+            logger=crawl_logger,
+            page_index=page_index,
+            course_budget=CrawlBudget.from_env("CRAWL"),
+            global_budget=global_budget,
+        )
+        for name, client in clients.items()
+    }
+
+    profiler = PhaseProfiler(args.profile, top_n=args.profile_top)
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+
+    get_session().hooks["response"].append(get_progress().request_done)
+    reporter = ProgressReporter(get_progress(), args.progress, args.progress_interval)
+    reporter.start()
+
+    try:
+        if len(accounts) == 1:
+            download_content_from_course(
+                client=clients[accounts[0].name],
+                crawler=crawlers[accounts[0].name],
+                workers=workers,
+                profiler=profiler,
+                sync_filter=sync_filter,
+                enrollment_state=args.enrollment_state,
+                incremental=not args.full_crawl,
+            )
+        else:
+            run_accounts(
+                accounts,
+                clients,
+                crawlers,
+                workers,
+                profiler,
+                sync_filter,
+                args.enrollment_state,
+                incremental=not args.full_crawl,
+            )
+    finally:
+        reporter.stop()
+        profiler.close()
+        close_writer()
+        # Archives only get their central directory once they are closed
+        get_storage().close()
+        if get_search_index():
+            get_search_index().close()
+        if get_metadata():
+            get_metadata().close()
+        if page_index:
+            page_index.close()
+        get_manifest().close()
+        if len(get_dead_letters()):
+            print(
+                f"{len(get_dead_letters())} failed downloads and pages are queued, "
+                "run `python main.py retry` to try them again"
+            )
+        get_dead_letters().close()
+        for client in clients.values():
+            if client.hedger.hedged:
+                main_logger.info(
+                    f"Hedged {client.hedger.hedged} requests, {client.hedger.hedge_wins} won by the duplicate"
+                )
+            client.hedger.close()
+        get_session().close()
+
+        # Comparable numbers for regression runs, e.g. against a replayed cassette
+        wall = time.perf_counter() - start_wall
+        cpu = time.process_time() - start_cpu
+        main_logger.info(f"Run finished in {wall:.1f}s wall time, {cpu:.1f}s CPU time")
+        print(f"Run finished in {wall:.1f}s wall time, {cpu:.1f}s CPU time")
+
+
+# Function to download the courses of several accounts in one process. Shared courses are
+# assigned to one account, the accounts then run concurrently on the shared session, storage
+# and indexes, each limited only by the rate limit of its own token.
+def run_accounts(
+    accounts: list[Account],
+    clients: dict[str, CanvasAPIClient],
+    crawlers: dict[str, CanvasCrawler],
+    workers: int,
+    profiler: PhaseProfiler,
+    sync_filter: SyncFilter,
+    enrollment_state: Optional[str] = None,
+    incremental: bool = False,
+):
+    listings = {
+        account.name: list_courses(clients[account.name], sync_filter, enrollment_state)
+        for account in accounts
+    }
+    plans = plan_courses(listings)
+    for account in accounts:
+        plan = plans[account.name]
+        main_logger.info(
+            f"Account {account.name}: {len(plan.owned)} courses, "
+            f"{len(plan.submissions_only)} shared courses for submissions only"
+        )
+
+    def run_account(account: Account):
+        download_content_from_course(
+            client=clients[account.name],
+            crawler=crawlers[account.name],
+            workers=workers,
+            profiler=profiler,
+            sync_filter=sync_filter,
+            plan=plans[account.name],
+            account_name=account.name,
+            incremental=incremental,
+        )
+
+    # The profilers hook into the running thread, profiled runs process the accounts in turn
+    account_workers = 1 if profiler.mode else len(accounts)
+    with ThreadPoolExecutor(
+        max_workers=account_workers, thread_name_prefix="account"
+    ) as executor:
+        futures = [executor.submit(run_account, account) for account in accounts]
+        for future in as_completed(futures):
+            future.result()
+
+
+# Function to keep the clients, connection pool and caches warm and sync courses as soon as
+# they change. Every poll lists the courses and checks the cheap change signals, only changed
+# courses are synced (incrementally unless --full-crawl). The poll interval adapts to activity.
+def watch(args):
+    if not args.workers:
+        print("NOTICE: Please set the number of workers for the crawler.")
+        exit(1)
+    workers = args.workers
+    clients = configure_transfers(args, workers)
+    multi_account = len(clients) > 1
+
+    set_storage(create_storage(args.storage, COURSES_ROOT, args.compression))
+    configure_writer(args)
+    if args.search_index:
+        set_search_index(SearchIndex())
+    if args.metadata:
+        set_metadata(MetadataStore())
+    set_manifest(DownloadManifest())
+    set_dead_letters(DeadLetterQueue())
+    page_index = None if args.full_crawl else PageIndex()
+    sync_filter = SyncFilter.from_args(args)
+    crawlers = {
+        name: CanvasCrawler(
+            client,
+            sync_filter=sync_filter,
+            logger=crawl_logger,
+            page_index=page_index,
+            course_budget=CrawlBudget.from_env("CRAWL"),
+        )
+        for name, client in clients.items()
+    }
+    # The activity stream is personal, every account keeps its own state
+    watchers = {
+        name: ChangeWatcher(
+            client,
+            (
+                WATCH_STATE_PATH.replace(".json", f".{name}.json")
+                if multi_account
+                else WATCH_STATE_PATH
+            ),
+        )
+        for name, client in clients.items()
+    }
+    interval = AdaptiveInterval(args.min_interval, args.max_interval)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    get_session().hooks["response"].append(get_progress().request_done)
+
+    try:
+        while not stop.is_set():
+            requests_before = get_progress().requests
+            synced = 0
+            try:
+                listings = {
+                    name: list_courses(client, sync_filter, args.enrollment_state)
+                    for name, client in clients.items()
+                }
+                plans = plan_courses(listings)
+                for name, watcher in watchers.items():
+                    plan = plans[name]
+                    changes = watcher.changed_courses(
+                        plan.owned + plan.submissions_only
+                    )
+                    if not changes:
+                        continue
+                    changed_ids = {course["id"] for course, _ in changes}
+                    failed_courses = download_content_from_course(
+                        client=clients[name],
+                        crawler=crawlers[name],
+                        workers=workers,
+                        sync_filter=sync_filter,
+                        plan=CoursePlan(
+                            [c for c in plan.owned if c["id"] in changed_ids],
+                            [
+                                c
+                                for c in plan.submissions_only
+                                if c["id"] in changed_ids
+                            ],
+                        ),
+                        account_name=name if multi_account else None,
+                        incremental=not args.full_crawl,
+                    )
+                    # Courses with a failed phase are synced again by the next poll
+                    for course, signals in changes:
+                        if course["id"] in failed_courses:
+                            main_logger.warning(
+                                f"Not marking {course.get('name')} as synced, a phase failed"
+                            )
+                            continue
+                        watcher.mark_synced(course, signals)
+                    synced += len(changes)
+            except Exception:
+                main_logger.exception("Watch poll failed")
+            # Claims dedupe downloads within a poll, files that change later are fetched again
+            get_manifest().new_run()
+
+            if synced:
+                # Make the new content visible to extract and search between polls
+                get_storage().close()
+                if get_search_index():
+                    get_search_index().commit()
+            if args.once:
+                break
+            delay = interval.update(synced > 0)
+            main_logger.info(
+                f"Synced {synced} courses with {get_progress().requests - requests_before} requests, "
+                f"next poll in {delay:.0f}s"
+            )
+            stop.wait(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_writer()
+        get_storage().close()
+        if get_search_index():
+            get_search_index().close()
+        if get_metadata():
+            get_metadata().close()
+        if page_index:
+            page_index.close()
+        get_manifest().close()
+        get_dead_letters().close()
+        for client in clients.values():
+            client.hedger.close()
+        get_session().close()
+
+
+# Function to drain the dead letter queue: failed downloads are retried concurrently,
+# failed pages and file links through the crawler. Every entry is retried with the account
+# that queued it, entries of unknown accounts with the first one. Entries that fail again are
+# pushed back with a doubled delay, the pass waits for them as long as --max-wait allows.
+def retry(args):
+    if not os.path.exists(args.queue):
+        print(f"NOTICE: No failures queued at {args.queue}")
+        return
+
+    workers = args.workers or 4
+    clients = configure_transfers(args, workers)
+    default_account = next(iter(clients))
+    set_storage(create_storage(args.storage, COURSES_ROOT, args.compression))
+    configure_writer(args)
+    if args.search_index:
+        set_search_index(SearchIndex())
+    if args.metadata:
+        set_metadata(MetadataStore())
+    set_manifest(DownloadManifest())
+    queue = DeadLetterQueue(args.queue)
+    set_dead_letters(queue)
+    page_index = None if args.full_crawl else PageIndex()
+    crawlers = {
+        name: CanvasCrawler(client, logger=crawl_logger, page_index=page_index)
+        for name, client in clients.items()
+    }
+
+    def account_of(entry: DeadLetter) -> str:
+        if entry.account in clients:
+            return entry.account
+        if entry.account:
+            main_logger.warning(
+                f"Account {entry.account} is not configured, retrying {entry.url} as {default_account}"
+            )
+        return default_account
+
+    # Entries that were retried but neither recovered nor failed again (e.g. a page that
+    # turned out empty) keep their attempt count, they are not tried twice in one pass
+    tried: set[tuple[str, int]] = set()
+
+    def pending(due: bool) -> list:
+        return [
+            entry
+            for entry in queue.entries(due=due, max_attempts=args.max_attempts)
+            if (args.all or entry.transient)
+            and (entry.key, entry.attempts) not in tried
+        ]
+
+    start = time.monotonic()
+    queued = len(queue)
+    first_round = True
+    try:
+        while True:
+            entries = pending(due=not (args.now and first_round))
+            first_round = False
+            if not entries:
+                waiting = pending(due=False)
+                if not waiting:
+                    break
+                delay = max(waiting[0].next_attempt - time.time(), 0)
+                if time.monotonic() - start + delay > args.max_wait:
+                    break
+                main_logger.info(f"Waiting {delay:.0f}s for the next retry")
+                time.sleep(delay)
+                continue
+
+            main_logger.info(f"Retrying {len(entries)} failures")
+            tried.update((entry.key, entry.attempts) for entry in entries)
+            for entry in entries:
+                if entry.kind == "file" and entry.save_path:
+                    ensure_dir(os.path.dirname(entry.save_path))
+            downloads: dict[str, list[PendingDownload]] = {}
+            for entry in entries:
+                if entry.kind == "file":
+                    downloads.setdefault(account_of(entry), []).append(
+                        PendingDownload(entry.url, entry.save_path, entry.file_id)
+                    )
+            for name, file_downloads in downloads.items():
+                download_files(file_downloads, clients[name].access_token, workers)
+            # The crawler keeps per crawl state, pages and links are retried one by one
+            for entry in entries:
+                if entry.kind != "file":
+                    with continue_on_error(f"retry {entry.kind}", entry.course_name):
+                        crawlers[account_of(entry)].retry_dead_letter(entry)
+    finally:
+        close_writer()
+        get_storage().close()
+        if get_search_index():
+            get_search_index().close()
+        if get_metadata():
+            get_metadata().close()
+        if page_index:
+            page_index.close()
+        get_manifest().close()
+        remaining = queue.entries()
+        queue.close()
+        for client in clients.values():
+            client.hedger.close()
+        get_session().close()
+
+    for entry in remaining:
+        print(
+            f"{entry.kind:5s} {entry.status} (attempt {entry.attempts}) {entry.save_path or entry.url}"
+        )
+    print(
+        f"Recovered {queued - len(remaining)} of {queued} failures, {len(remaining)} left"
+    )
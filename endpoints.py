@@ -1,5 +1,6 @@
 COURSES_ENDPOINT = "/courses/{course_id}"
 COURSE_PAGE_ENDPOINT = "/courses/{course_id}/pages/{page_id}"
+COURSE_PAGES_ENDPOINT = "/courses/{course_id}/pages"
 COURSE_FRONTPAGE_ENDPOINT = "/courses/{course_id}/front_page"
 COURSE_FILES_ENDPOINT = "/courses/{course_id}/files/{file_id}"
 COURSE_ASSIGNMENTS_ENDPOINT = "/courses/{course_id}/assignments/{assignment_id}"
@@ -10,3 +11,4 @@ COURSE_MODULES_ENDPOINT = "/courses/{course_id}/modules/{module_id}"
 COURSE_MODULES_ITEMS_ENDPOINT = (
     "/courses/{course_id}/modules/{module_id}/items/{item_id}"
 )
+ACTIVITY_STREAM_ENDPOINT = "/users/self/activity_stream"
@@ -0,0 +1,261 @@
+import asyncio
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import AsyncIterator, ClassVar, Iterable, Iterator, Optional
+
+from api import CanvasAPIClient
+from crawler import CanvasCrawler
+from filters import SyncFilter
+from transport import get_session, get_transfer_settings, iter_content_with_watchdog
+
+# Seconds a blocked producer or consumer waits before checking whether the stream was closed
+POLL_SECONDS = 0.5
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class Event:
+    kind: ClassVar[str] = "event"
+    course_id: int
+
+
+@dataclass
+class CourseEvent(Event):
+    kind: ClassVar[str] = "course"
+    course: dict
+
+
+@dataclass
+class ModuleEvent(Event):
+    kind: ClassVar[str] = "module"
+    module: dict
+
+
+@dataclass
+class ItemEvent(Event):
+    kind: ClassVar[str] = "item"
+    module_id: int
+    item: dict
+
+
+# A wiki page, the front page or the syllabus with its HTML body
+@dataclass
+class PageEvent(Event):
+    kind: ClassVar[str] = "page"
+    url: str
+    page_type: str
+    title: Optional[str]
+    body: str
+    updated_at: Optional[str] = None
+
+
+@dataclass
+class AssignmentEvent(Event):
+    kind: ClassVar[str] = "assignment"
+    assignment: dict
+    submission: Optional[dict] = None
+
+
+# A file of the course. Nothing is downloaded until the content is iterated, and then it is
+# streamed chunk by chunk without touching the disk.
+@dataclass
+class FileEvent(Event):
+    kind: ClassVar[str] = "file"
+    file: dict
+    access_token: str = field(repr=False, default="")
+
+    @property
+    def name(self) -> str:
+        return self.file.get("display_name", f"file_{self.file.get('id')}")
+
+    @property
+    def size(self) -> Optional[int]:
+        return self.file.get("size")
+
+    def iter_content(self, chunk_size: int = FILE_CHUNK_SIZE) -> Iterator[bytes]:
+        settings = get_transfer_settings()
+        with get_session().get(
+            self.file["url"],
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            stream=True,
+            timeout=settings.timeout,
+        ) as response:
+            response.raise_for_status()
+            yield from iter_content_with_watchdog(response, chunk_size, settings)
+
+    def aiter_content(
+        self, chunk_size: int = FILE_CHUNK_SIZE, max_pending: int = 4
+    ) -> AsyncIterator[bytes]:
+        return _aiterate(self.iter_content(chunk_size), max_pending)
+
+    def read(self) -> bytes:
+        return b"".join(self.iter_content())
+
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+# Function to run a blocking iterator on its own thread and hand its items to asyncio through
+# a bounded queue. The thread stops producing while max_pending items wait for the consumer,
+# and stops for good when the consumer closes the async iterator.
+async def _aiterate(iterator: Iterable, max_pending: int = 16) -> AsyncIterator:
+    loop = asyncio.get_running_loop()
+    pending: queue.Queue = queue.Queue(maxsize=max(1, max_pending))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    def get():
+        while True:
+            try:
+                return pending.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if not producer.is_alive() and pending.empty():
+                    return _DONE
+
+    producer = threading.Thread(target=produce, name="event-stream", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = await loop.run_in_executor(None, get)
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+# Programmatic access to the content of Canvas courses as a stream of typed events, for feeding
+# another system without the courses/ tree. Events are produced lazily: nothing is fetched
+# before the consumer asks for the next event, so memory stays bounded by what the consumer
+# holds. The phases and filters are the ones of the command line (files, modules, assignments,
+# pages), file contents are only downloaded when a FileEvent is read.
+#
+#     for event in ContentStream(client):
+#         ...
+#     async for event in ContentStream(client):
+#         ...
+class ContentStream:
+    def __init__(
+        self,
+        client: CanvasAPIClient,
+        crawler: Optional[CanvasCrawler] = None,
+        sync_filter: Optional[SyncFilter] = None,
+        enrollment_state: Optional[str] = None,
+        max_pending: int = 16,
+    ):
+        self.client = client
+        self.crawler = crawler or CanvasCrawler(client, logger=client.logger)
+        self.sync_filter = sync_filter or SyncFilter()
+        self.enrollment_state = enrollment_state
+        self.max_pending = max_pending
+
+    def courses(self) -> list[dict]:
+        courses = self.client.get_courses(enrollment_state=self.enrollment_state) or []
+        return [course for course in courses if self.sync_filter.matches_course(course)]
+
+    def events(self, courses: Optional[list[dict]] = None) -> Iterator[Event]:
+        for course in courses if courses is not None else self.courses():
+            yield from self.course_events(course)
+
+    def __iter__(self) -> Iterator[Event]:
+        return self.events()
+
+    # Async form of events(): the events are produced on a thread, at most max_pending ahead
+    def aevents(self, courses: Optional[list[dict]] = None) -> AsyncIterator[Event]:
+        return _aiterate(self.events(courses), self.max_pending)
+
+    def __aiter__(self) -> AsyncIterator[Event]:
+        return self.aevents()
+
+    def _file_event(self, course_id, file: Optional[dict], seen: set):
+        if file is None or not file.get("url") or file.get("id") in seen:
+            return None
+        if not self.sync_filter.matches_file(
+            file.get("display_name", ""), file.get("size")
+        ):
+            return None
+        seen.add(file.get("id"))
+        return FileEvent(course_id, file, self.client.access_token)
+
+    def course_events(self, course: dict) -> Iterator[Event]:
+        course_id = course["id"]
+        client = self.client
+        file_indexes = self.crawler.file_indexes
+        file_index = file_indexes.get(course_id)
+        # Files listed by the course and linked from modules are announced once
+        seen_files: set = set()
+        try:
+            yield CourseEvent(course_id, course)
+
+            if self.sync_filter.wants("files"):
+                for file in file_index.files():
+                    event = self._file_event(course_id, file, seen_files)
+                    if event:
+                        yield event
+
+            if self.sync_filter.wants("modules"):
+                for module in client.get_modules(course_id) or []:
+                    yield ModuleEvent(course_id, module)
+                    items = client.get_module_items(course_id, module["id"]) or []
+                    for item in items:
+                        yield ItemEvent(course_id, module["id"], item)
+                        if item.get("type") == "File":
+                            event = self._file_event(
+                                course_id,
+                                file_index.get(item["content_id"]),
+                                seen_files,
+                            )
+                            if event:
+                                yield event
+
+            if self.sync_filter.wants("assignments"):
+                for assignment in client.get_course_assignments(course_id) or []:
+                    submission = client.get_course_self_assignment_submission(
+                        course_id, assignment["id"]
+                    )
+                    yield AssignmentEvent(course_id, assignment, submission or None)
+
+            if self.sync_filter.wants("pages"):
+                for url, link_type, title, body, updated_at in self.crawler.iter_pages(
+                    course_id
+                ):
+                    yield PageEvent(
+                        course_id,
+                        url,
+                        link_type.name.lower(),
+                        title,
+                        body,
+                        None if updated_at is None else str(updated_at),
+                    )
+        finally:
+            file_indexes.release(course_id)
+            self.crawler.forget_course(course_id)
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+from typing import Optional
+
+from logger import main_logger
+from storage import COURSES_ROOT
+
+FILE_INDEX_DIR = os.path.join(COURSES_ROOT, ".file_index")
+
+# Fields of a file object the download phases and the crawler use, the index keeps only these
+INDEXED_FIELDS = (
+    "id",
+    "display_name",
+    "filename",
+    "size",
+    "url",
+    "content-type",
+    "updated_at",
+    "modified_at",
+)
+
+
+def _slim(file: dict) -> dict:
+    return {field: file[field] for field in INDEXED_FIELDS if field in file}
+
+
+# Download URLs are signed and expire, they are not persisted
+def _persisted(file: dict) -> dict:
+    return {field: value for field, value in _slim(file).items() if field != "url"}
+
+
+# In-memory index of the files of a course by id, filled from one paginated listing.
+# Ids that are not in the listing (e.g. hidden files, or courses without a Files tab)
+# fall back to a single-file request, whose result is cached too. When the listing is
+# unavailable the persisted one is used, its files get a fresh URL when they are used.
+class CourseFileIndex:
+    def __init__(self, client, course_id, persist_dir: Optional[str] = None):
+        self.client = client
+        self.course_id = course_id
+        self.persist_dir = persist_dir
+        self._files: dict[str, dict] = {}
+        self._missing: set[str] = set()
+        # Ids known from the persisted listing only, without a download URL
+        self._stale: set[str] = set()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    def _persist_path(self) -> Optional[str]:
+        if not self.persist_dir:
+            return None
+        return os.path.join(self.persist_dir, f"{self.course_id}.json")
+
+    # Function to fetch the full file listing of the course, once. Concurrent callers wait
+    # for the listing instead of seeing an empty index.
+    def load(self) -> "CourseFileIndex":
+        if self._loaded:
+            return self
+        with self._load_lock:
+            if self._loaded:
+                return self
+
+            files = self.client.get_course_files(self.course_id)
+            stale = False
+            persist_path = self._persist_path()
+            if files and persist_path:
+                os.makedirs(self.persist_dir, exist_ok=True)
+                with open(persist_path, "w", encoding="utf-8") as f:
+                    json.dump([_persisted(file) for file in files], f)
+            elif not files and persist_path and os.path.exists(persist_path):
+                # The listing can be unavailable (e.g. the Files tab is hidden), use the last known one
+                with open(persist_path, "r", encoding="utf-8") as f:
+                    files = json.load(f)
+                stale = True
+                main_logger.debug(
+                    f"Using persisted file index for course {self.course_id}"
+                )
+
+            with self._lock:
+                for file in files or []:
+                    file_id = str(file["id"])
+                    if stale:
+                        self._files[file_id] = _persisted(file)
+                        self._stale.add(file_id)
+                    else:
+                        self._files[file_id] = _slim(file)
+                self._loaded = True
+            main_logger.debug(
+                f"Indexed {len(files or [])} files of course {self.course_id}"
+            )
+        return self
+
+    # Files of the persisted listing are fetched again for their URL, files that can't be
+    # fetched are left out
+    def files(self) -> list[dict]:
+        self.load()
+        with self._lock:
+            stale = list(self._stale)
+        for file_id in stale:
+            self.get(file_id)
+        with self._lock:
+            return [file for file in self._files.values() if "url" in file]
+
+    # Function to resolve a file id, only unknown ids (and ids of a persisted listing) cost a request
+    def get(self, file_id) -> Optional[dict]:
+        self.load()
+        file_id = str(file_id)
+        with self._lock:
+            if file_id in self._files and file_id not in self._stale:
+                return self._files[file_id]
+            if file_id in self._missing:
+                return None
+            stale = self._files.get(file_id)
+
+        response = self.client.get_course_files(self.course_id, file_id)
+        file = response[0] if response else None
+        with self._lock:
+            self._stale.discard(file_id)
+            if file is None:
+                # A persisted file keeps its metadata, it just can't be downloaded
+                if stale is None:
+                    self._missing.add(file_id)
+                return stale
+            file = _slim(file)
+            self._files[file_id] = file
+        return file
+
+
+# The file indexes of the courses of a run, shared by the download phases and the crawler
+class FileIndexCache:
+    def __init__(self, client, persist_dir: Optional[str] = FILE_INDEX_DIR):
+        self.client = client
+        self.persist_dir = persist_dir
+        self._indexes: dict[str, CourseFileIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, course_id) -> CourseFileIndex:
+        with self._lock:
+            index = self._indexes.get(str(course_id))
+            if index is None:
+                index = CourseFileIndex(self.client, course_id, self.persist_dir)
+                self._indexes[str(course_id)] = index
+        return index
+
+    # Function to drop the index of a course that has been processed
+    def release(self, course_id):
+        with self._lock:
+            self._indexes.pop(str(course_id), None)
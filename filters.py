@@ -0,0 +1,104 @@
+import fnmatch
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+CONTENT_TYPES = ("files", "modules", "assignments", "pages")
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+# Parses sizes like "500", "20M" or "1.5G" into bytes
+def parse_size(value: str) -> int:
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)i?B?\s*", value.upper())
+    if not match:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+# Selects which courses, content types and files a run processes.
+# Empty lists mean no restriction. Course filters only look at the course listing,
+# so filtered out courses never cost another request.
+@dataclass
+class SyncFilter:
+    terms: list[str] = field(default_factory=list)
+    course_ids: list[str] = field(default_factory=list)
+    name_patterns: list[str] = field(default_factory=list)
+    workflow_states: list[str] = field(default_factory=list)
+    content_types: set[str] = field(default_factory=lambda: set(CONTENT_TYPES))
+    min_file_size: Optional[int] = None
+    max_file_size: Optional[int] = None
+    extensions: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        unknown = set(self.content_types) - set(CONTENT_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown content types: {', '.join(sorted(unknown))}")
+        self.extensions = [ext.lower().lstrip(".") for ext in self.extensions]
+
+    # Terms can be given by enrollment_term_id or by (a glob of) the term name
+    def _matches_term(self, course: dict) -> bool:
+        term_id = str(course.get("enrollment_term_id", ""))
+        term_name = (course.get("term") or {}).get("name") or ""
+        for term in self.terms:
+            if term == term_id or fnmatch.fnmatch(term_name.lower(), term.lower()):
+                return True
+        return False
+
+    def matches_course(self, course: dict) -> bool:
+        if self.course_ids and str(course.get("id")) not in self.course_ids:
+            return False
+        if (
+            self.workflow_states
+            and course.get("workflow_state") not in self.workflow_states
+        ):
+            return False
+        if self.terms and not self._matches_term(course):
+            return False
+        if self.name_patterns:
+            names = [(course.get(key) or "").lower() for key in ("name", "course_code")]
+            if not any(
+                fnmatch.fnmatch(name, pattern.lower())
+                for pattern in self.name_patterns
+                for name in names
+            ):
+                return False
+        return True
+
+    def wants(self, content_type: str) -> bool:
+        return content_type in self.content_types
+
+    # Files without a known size only get filtered by extension
+    def matches_file(self, file_name: str, size: Optional[int] = None) -> bool:
+        if self.extensions:
+            extension = os.path.splitext(file_name)[1].lower().lstrip(".")
+            if extension not in self.extensions:
+                return False
+        if size is not None:
+            if self.min_file_size is not None and size < self.min_file_size:
+                return False
+            if self.max_file_size is not None and size > self.max_file_size:
+                return False
+        return True
+
+    @classmethod
+    def from_args(cls, args) -> "SyncFilter":
+        content_types = set(CONTENT_TYPES)
+        if args.only:
+            content_types = set(args.only)
+        content_types -= set(args.skip or [])
+        return cls(
+            terms=args.term or [],
+            course_ids=args.course_id or [],
+            name_patterns=args.course_name or [],
+            workflow_states=args.workflow_state or [],
+            content_types=content_types,
+            min_file_size=(
+                parse_size(args.min_file_size) if args.min_file_size else None
+            ),
+            max_file_size=(
+                parse_size(args.max_file_size) if args.max_file_size else None
+            ),
+            extensions=args.ext or [],
+        )
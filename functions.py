@@ -1,8 +1,23 @@
+from datetime import datetime
+import hashlib
 import re
 from urllib.parse import urlparse
-import requests
 import os
+import requests
 from logger import main_logger, ignore_logger
+from accounts import account_for_token
+from dead_letters import get_dead_letters
+from manifest import get_manifest
+from progress import get_progress
+from segments import (
+    RangesUnsupported,
+    download_segmented,
+    segment_headers,
+    segmented_size,
+)
+from storage import get_storage
+from transport import get_session, get_transfer_settings, iter_content_with_watchdog
+from writer import get_writer
 
 
 # Function to sanitize file names
@@ -14,30 +29,183 @@ def sanitize_filename(filename: str) -> str:
     return sanitized
 
 
-# TODO: This function needs to be reworked to indicate success or failure
-# Function to download a file from a URL
-def download_file(file_info: tuple[str, str], access_token: str) -> None:
+# A file waiting to be downloaded, slotted to keep long download lists small
+class PendingDownload:
+    __slots__ = ("url", "save_path", "file_id")
+
+    def __init__(self, url: str, save_path: str, file_id=None):
+        self.url = url
+        self.save_path = save_path
+        self.file_id = file_id
+
+
+# Function to stream a response body into a file, returns the size and sha256 of the body.
+# With a write-behind stage the chunks are written by the writer thread while the next ones
+# are received, the function returns once the file is complete on disk.
+def _stream_to_file(response, path: str, settings) -> tuple[int, str]:
+    size = 0
+    digest = hashlib.sha256()
+    writer = get_writer()
+    if writer is None:
+        with open(path, "wb") as f:
+            for chunk in iter_content_with_watchdog(response, settings=settings):
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        return size, digest.hexdigest()
+
+    handle = writer.open(path)
+    try:
+        for chunk in iter_content_with_watchdog(response, settings=settings):
+            handle.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    except BaseException:
+        handle.abort()
+        raise
+    handle.close()
+    return size, digest.hexdigest()
+
+
+def _discard_partial(partial_path: str):
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+
+# Function to download a file from a URL, returns whether the file was saved.
+# The body is streamed into a partial file under the stall watchdog, timeouts and stalls
+# restart the download up to the configured number of retries. Large files are fetched as
+# parallel byte ranges, or as a single stream when the server does not support ranges.
+# Failures are queued as dead letters.
+def download_file(file_info: tuple[str, str], access_token: str, file_id=None) -> bool:
     file_url, save_path = file_info
+    manifest = get_manifest()
+    if manifest and not manifest.claim(save_path):
+        # Another worker downloads (or downloaded) the same path in this run
+        main_logger.debug(f"Waiting for the download of {save_path} in this run")
+        saved = manifest.wait(save_path)
+        get_progress().file_done()
+        return saved
     headers = {"Authorization": f"Bearer {access_token}"}
+    settings = get_transfer_settings()
+    partial_path = save_path + ".part"
     main_logger.debug(f"Downloading file from: {file_url} at {save_path}")
-    response = requests.get(file_url, headers=headers)
-    if response.status_code == 200:
-        with open(save_path, "wb") as f:
-            f.write(response.content)
+
+    status = None
+    allow_segments = True
+    attempt = 0
+    saved = False
+    try:
+        while attempt <= settings.retries:
+            try:
+                segmented = None
+                with get_session().get(
+                    file_url, headers=headers, stream=True, timeout=settings.timeout
+                ) as response:
+                    status = response.status_code
+                    if response.status_code != 200:
+                        break
+                    size = (
+                        segmented_size(response, settings) if allow_segments else None
+                    )
+                    if size is None:
+                        size, sha256 = _stream_to_file(response, partial_path, settings)
+                    else:
+                        # The single stream is dropped, the ranges go to the final (redirected) URL
+                        segmented = response.url, response.headers.get("ETag")
+                if segmented:
+                    segment_url, etag = segmented
+                    sha256 = download_segmented(
+                        segment_url,
+                        segment_headers(file_url, segment_url, headers),
+                        partial_path,
+                        size,
+                        etag,
+                        settings,
+                    )
+                os.replace(partial_path, save_path)
+            except RangesUnsupported as e:
+                # Falling back does not use up an attempt
+                main_logger.info(f"Downloading {file_url} as a single stream: {e}")
+                allow_segments = False
+                continue
+            except requests.RequestException as e:
+                status = f"{type(e).__name__}: {e}"
+                attempt += 1
+                main_logger.warning(
+                    f"Download attempt {attempt} of {file_url} failed: {e}"
+                )
+                continue
+            saved = True
+            break
+    except BaseException:
+        # A failed write (the writer raises it on close) or an unexpected error: no partial
+        # file or claim is left behind, the caller queues the download as a dead letter
+        _discard_partial(partial_path)
+        get_progress().file_done()
+        if manifest:
+            manifest.release(save_path)
+        raise
+
+    if saved:
         main_logger.debug(f"Downloaded: {save_path}")
-    else:
-        main_logger.error(f"Failed to download file from {file_url}")
-        ignore_logger.error(f"{file_url}: Couldn't download file")
+        get_progress().file_done(size)
+        if manifest:
+            manifest.finish(save_path)
+            manifest.record(save_path, file_url, size, sha256, file_id)
+        dead_letters = get_dead_letters()
+        if dead_letters is not None:
+            dead_letters.remove(save_path)
+        return True
 
+    _discard_partial(partial_path)
+    main_logger.error(f"Failed to download file from {file_url}")
+    ignore_logger.error(f"{file_url}: Couldn't download file")
+    get_progress().file_done()
+    if manifest:
+        manifest.release(save_path)
+    dead_letters = get_dead_letters()
+    if dead_letters is not None:
+        dead_letters.add(
+            "file",
+            file_url,
+            status,
+            save_path,
+            file_id,
+            account=account_for_token(access_token),
+        )
+    return False
 
-# TODO: This function needs to be reworked to indicate success or failure
-def save_html(page_url, html_content, course_name):
+
+# Function to check whether a file of a Canvas listing is already on disk: same size and not
+# modified on Canvas after it was saved. Incremental syncs skip these files.
+def is_up_to_date(save_path: str, file: dict) -> bool:
+    try:
+        stat = os.stat(save_path)
+    except OSError:
+        return False
+    size = file.get("size")
+    if size is not None and stat.st_size != size:
+        return False
+    modified = file.get("modified_at") or file.get("updated_at")
+    if modified:
+        modified = datetime.fromisoformat(modified.replace("Z", "+00:00"))
+        if stat.st_mtime < modified.timestamp():
+            return False
+    return True
+
+
+# Function to get the path a crawled page is saved at
+def html_save_path(page_url, course_name):
     parsed_url = urlparse(page_url)
     sanitized_filename = parsed_url.path.replace("/", "_") + ".html"
-    save_path = os.path.join("courses", course_name, "cv_pages", sanitized_filename)
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    with open(save_path, "w", encoding="utf-8") as f:
-        f.write(html_content)
+    return os.path.join("courses", course_name, "cv_pages", sanitized_filename)
+
+
+# TODO: This function needs to be reworked to indicate success or failure
+def save_html(page_url, html_content, course_name):
+    save_path = html_save_path(page_url, course_name)
+    get_storage().write_text(save_path, html_content)
     main_logger.debug(f"Saved page content: {save_path}")
     return save_path
 
@@ -45,8 +213,7 @@ def save_html(page_url, html_content, course_name):
 # Function to save the content of a page to a file, it is saved as  HTML from the body parameter of the page response
 # Reference: https://canvas.instructure.com/doc/api/pages.html
 def save_page_content(content, save_path):
-    with open(save_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    get_storage().write_text(save_path, content)
     main_logger.debug(f"Saved page content to: {save_path}")
 
 
@@ -54,11 +221,13 @@ def save_page_content(content, save_path):
 # Reference: https://canvas.instructure.com/doc/api/pages.html
 def get_page_content(page_url, access_token):
     headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(page_url, headers=headers)
+    response = get_session().get(
+        page_url, headers=headers, timeout=get_transfer_settings().timeout
+    )
     if response.status_code == 200:
         return response.text  # Return the full HTML content of the page
     else:
-        main_logger(
+        main_logger.warning(
             f"Failed to fetch content for page {page_url}: {response.status_code}"
         )
         return ""
@@ -72,23 +241,21 @@ def save_grade_and_comments(file_path, submission):
     score = submission.get("score", "No score")
     comments = submission.get("submission_comments", [])
 
-    with open(file_path, "w") as f:
-        f.write(f"Grade: {grade}\n")
-        f.write(f"Score: {score}\n\n")
-        if comments:
-            f.write("Comments:\n")
-            for comment in comments:
-                f.write(f"- {comment.get('comment', '')}\n")
-        else:
-            f.write("No comments available.\n")
+    lines = [f"Grade: {grade}\n", f"Score: {score}\n\n"]
+    if comments:
+        lines.append("Comments:\n")
+        for comment in comments:
+            lines.append(f"- {comment.get('comment', '')}\n")
+    else:
+        lines.append("No comments available.\n")
+    get_storage().write_text(file_path, "".join(lines))
 
 
 # Function to save the assignment description to a text file
 # Reference: https://canvas.instructure.com/doc/api/assignments.html
 def save_assignment_description(file_path, description):
     if description:
-        with open(file_path, "w") as f:
-            f.write(description)
+        get_storage().write_text(file_path, description)
         main_logger.debug(f"Saved assignment description to: {file_path}")
     else:
         main_logger.debug(f"No description available for the assignment.")
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+
+from logger import api_logger
+
+# Latencies needed before a percentile is trusted for hedging
+MIN_SAMPLES = 20
+LATENCY_WINDOW = 500
+
+
+# Sliding window of recent request latencies
+class LatencyTracker:
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+# Sends idempotent GETs and, once a request runs longer than the given latency percentile,
+# a duplicate of it. The first response wins, the other one is closed when it arrives.
+class HedgedGetter:
+    def __init__(self, max_workers: int = 32):
+        self.latencies = LatencyTracker()
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="hedge"
+                )
+            return self._executor
+
+    def _timed_get(self, session, url, **kwargs):
+        start = time.perf_counter()
+        response = session.get(url, **kwargs)
+        self.latencies.add(time.perf_counter() - start)
+        return response
+
+    def get(self, session, url, percentile: Optional[float] = None, **kwargs):
+        threshold = self.latencies.percentile(percentile) if percentile else None
+        if threshold is None:
+            return self._timed_get(session, url, **kwargs)
+
+        executor = self._get_executor()
+        primary = executor.submit(self._timed_get, session, url, **kwargs)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        api_logger.debug(f"Hedging request after {threshold:.2f}s: {url}")
+        hedge = executor.submit(self._timed_get, session, url, **kwargs)
+        with self._lock:
+            self.hedged += 1
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                if future is hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return future.result()
+        raise error
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
@@ -1,4 +1,5 @@
 import logging
+import os
 
 # Configure the root logger
 logging.basicConfig(
@@ -8,38 +9,35 @@ logging.basicConfig(
 
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
+LOG_DIR = "logs"
 
 formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
+
+# File handler that opens its file (and creates the log directory) on the first record,
+# so importing a module costs no file system access and commands that log nothing leave no files
+class LazyFileHandler(logging.FileHandler):
+    def __init__(self, filename: str):
+        super().__init__(os.path.join(LOG_DIR, filename), delay=True)
+        self.setLevel(logging.DEBUG)
+        self.setFormatter(formatter)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
 # Create loggers
 main_logger = logging.getLogger("main")
 api_logger = logging.getLogger("api")
 crawl_logger = logging.getLogger("crawl")
 ignore_logger = logging.getLogger("ignore")
 
-# Create handlers
-main_file_handler = logging.FileHandler("logs/main.log")
-api_file_handler = logging.FileHandler("logs/api.log")
-crawl_file_handler = logging.FileHandler("logs/crawl.log")
-ignore_logger_handler = logging.FileHandler("logs/ignored.log")
-
-# # Set log levels for handlers
-main_file_handler.setLevel(logging.DEBUG)
-api_file_handler.setLevel(logging.DEBUG)
-crawl_file_handler.setLevel(logging.DEBUG)
-ignore_logger_handler.setLevel(logging.DEBUG)
-
-# Create formatters and add them to handlers
-main_file_handler.setFormatter(formatter)
-api_file_handler.setFormatter(formatter)
-crawl_file_handler.setFormatter(formatter)
-ignore_logger_handler.setFormatter(formatter)
-
 # Add handlers to the loggers
-main_logger.addHandler(main_file_handler)
-api_logger.addHandler(api_file_handler)
-crawl_logger.addHandler(crawl_file_handler)
-ignore_logger.addHandler(ignore_logger_handler)
+main_logger.addHandler(LazyFileHandler("main.log"))
+api_logger.addHandler(LazyFileHandler("api.log"))
+crawl_logger.addHandler(LazyFileHandler("crawl.log"))
+ignore_logger.addHandler(LazyFileHandler("ignored.log"))
 
 main_logger.propagate = False
 api_logger.propagate = False
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from storage import COURSES_ROOT
+
+MANIFEST_PATH = os.path.join(COURSES_ROOT, "manifest.jsonl")
+
+
+# A download of one path in this run, other callers of the path wait for its result
+class _Claim:
+    __slots__ = ("done", "saved")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.saved = False
+
+
+# Append-only JSON lines record of every downloaded file: path, source URL, size and sha256.
+# Used by the verify command to find truncated or corrupted files without the API.
+class DownloadManifest:
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        # Paths being downloaded or downloaded in this run, by any account or phase
+        self._claimed: dict[str, _Claim] = {}
+
+    def record(
+        self,
+        save_path: str,
+        url: str,
+        size: int,
+        sha256: Optional[str] = None,
+        file_id=None,
+    ):
+        line = json.dumps(
+            {
+                "path": save_path,
+                "url": url,
+                "size": size,
+                "sha256": sha256,
+                "file_id": file_id,
+                "time": time.time(),
+            }
+        )
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    # Function to reserve a path for downloading, False if it is already taken in this run
+    def claim(self, save_path: str) -> bool:
+        with self._lock:
+            if save_path in self._claimed:
+                return False
+            self._claimed[save_path] = _Claim()
+            return True
+
+    # Function to wait for the download that claimed a path, returns whether it saved the file
+    def wait(self, save_path: str) -> bool:
+        with self._lock:
+            claim = self._claimed.get(save_path)
+        if claim is None:
+            return False
+        claim.done.wait()
+        return claim.saved
+
+    # Function to mark a claimed path as downloaded, it stays taken for the rest of the run
+    def finish(self, save_path: str):
+        with self._lock:
+            claim = self._claimed.get(save_path)
+        if claim is not None:
+            claim.saved = True
+            claim.done.set()
+
+    # Function to give a path back after a failed download, so it can be tried again
+    def release(self, save_path: str):
+        with self._lock:
+            claim = self._claimed.pop(save_path, None)
+        if claim is not None:
+            claim.done.set()
+
+    # Function to start a new run: paths downloaded so far can be claimed (and fetched) again
+    def new_run(self):
+        with self._lock:
+            self._claimed = {
+                path: claim
+                for path, claim in self._claimed.items()
+                if not claim.done.is_set()
+            }
+
+    # Function to load the latest record of every path
+    def load(self) -> dict[str, dict]:
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[entry["path"]] = entry
+        return entries
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_manifest: Optional[DownloadManifest] = None
+
+
+# The manifest download_file records into, None when recording is disabled
+def get_manifest() -> Optional[DownloadManifest]:
+    return _manifest
+
+
+def set_manifest(manifest: Optional[DownloadManifest]):
+    global _manifest
+    _manifest = manifest
@@ -0,0 +1,438 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from logger import main_logger
+from storage import COURSES_ROOT
+
+METADATA_NAME = "metadata.sqlite"
+# Number of buffered rows after which they are written in one transaction
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    course_code TEXT,
+    workflow_state TEXT,
+    start_at TEXT,
+    end_at TEXT,
+    synced_at REAL,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS modules (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    position INTEGER,
+    items_count INTEGER,
+    published INTEGER,
+    unlock_at TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS module_items (
+    id TEXT PRIMARY KEY,
+    module_id TEXT,
+    position INTEGER,
+    type TEXT,
+    title TEXT,
+    content_id TEXT,
+    url TEXT,
+    external_url TEXT,
+    save_path TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    due_at TEXT,
+    points_possible REAL,
+    updated_at TEXT,
+    html_url TEXT,
+    description_path TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    assignment_id TEXT,
+    account TEXT,
+    grade TEXT,
+    score REAL,
+    submitted_at TEXT,
+    workflow_state TEXT,
+    comments TEXT,
+    result_path TEXT,
+    data TEXT,
+    PRIMARY KEY (assignment_id, account)
+);
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT,
+    save_path TEXT,
+    display_name TEXT,
+    size INTEGER,
+    content_type TEXT,
+    url TEXT,
+    updated_at TEXT,
+    modified_at TEXT,
+    data TEXT,
+    PRIMARY KEY (id, save_path)
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    kind TEXT,
+    title TEXT,
+    updated_at TEXT,
+    save_path TEXT,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS cant_download (
+    file_id TEXT PRIMARY KEY,
+    module_id TEXT,
+    title TEXT,
+    reason TEXT,
+    data TEXT
+);
+"""
+
+COLUMNS = {
+    "courses": (
+        "id",
+        "name",
+        "course_code",
+        "workflow_state",
+        "start_at",
+        "end_at",
+        "synced_at",
+        "data",
+    ),
+    "modules": (
+        "id",
+        "name",
+        "position",
+        "items_count",
+        "published",
+        "unlock_at",
+        "data",
+    ),
+    "module_items": (
+        "id",
+        "module_id",
+        "position",
+        "type",
+        "title",
+        "content_id",
+        "url",
+        "external_url",
+        "save_path",
+        "data",
+    ),
+    "assignments": (
+        "id",
+        "name",
+        "due_at",
+        "points_possible",
+        "updated_at",
+        "html_url",
+        "description_path",
+        "data",
+    ),
+    "submissions": (
+        "assignment_id",
+        "account",
+        "grade",
+        "score",
+        "submitted_at",
+        "workflow_state",
+        "comments",
+        "result_path",
+        "data",
+    ),
+    "files": (
+        "id",
+        "save_path",
+        "display_name",
+        "size",
+        "content_type",
+        "url",
+        "updated_at",
+        "modified_at",
+        "data",
+    ),
+    "pages": ("url", "kind", "title", "updated_at", "save_path", "synced_at"),
+    "cant_download": ("file_id", "module_id", "title", "reason", "data"),
+}
+
+
+def _id(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _json(value) -> str:
+    return json.dumps(value, default=str)
+
+
+# Function to drop the query of the URLs in a Canvas object (and the objects nested in it), file
+# URLs carry verifiers and signatures there that grant access to the file without a token
+def _unsigned(value):
+    if isinstance(value, dict):
+        return {
+            field: (
+                urlunsplit(urlsplit(item)._replace(query="", fragment=""))
+                if field.endswith("url") and isinstance(item, str)
+                else _unsigned(item)
+            )
+            for field, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_unsigned(item) for item in value]
+    return value
+
+
+# Structured metadata of one course in courses/<course>/metadata.sqlite: the course, its modules
+# and module items, assignments, submissions, files, pages and files that can't be downloaded.
+# Rows are buffered and written in batched transactions, a record replaces the previous one.
+# Signed file URLs are stored without their query, like the persisted file listings.
+class CourseMetadata:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: dict[str, list[tuple]] = {}
+        self._pending_rows = 0
+
+    def _add(self, table: str, row: tuple):
+        with self._lock:
+            self._pending.setdefault(table, []).append(row)
+            self._pending_rows += 1
+            if self._pending_rows >= BATCH_SIZE:
+                self._write()
+
+    def _write(self):
+        if not self._pending_rows:
+            return
+        with self._conn:
+            for table, rows in self._pending.items():
+                columns = COLUMNS[table]
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    rows,
+                )
+        self._pending.clear()
+        self._pending_rows = 0
+
+    def record_course(self, course: dict):
+        self._add(
+            "courses",
+            (
+                _id(course["id"]),
+                course.get("name"),
+                course.get("course_code"),
+                course.get("workflow_state"),
+                course.get("start_at"),
+                course.get("end_at"),
+                time.time(),
+                _json(course),
+            ),
+        )
+
+    def record_module(self, module: dict):
+        self._add(
+            "modules",
+            (
+                _id(module["id"]),
+                module.get("name"),
+                module.get("position"),
+                module.get("items_count"),
+                module.get("published"),
+                module.get("unlock_at"),
+                _json(module),
+            ),
+        )
+
+    def record_module_item(
+        self, module_id, item: dict, save_path: Optional[str] = None
+    ):
+        self._add(
+            "module_items",
+            (
+                _id(item["id"]),
+                _id(module_id),
+                item.get("position"),
+                item.get("type"),
+                item.get("title"),
+                _id(item.get("content_id")),
+                item.get("url"),
+                item.get("external_url"),
+                save_path,
+                _json(item),
+            ),
+        )
+
+    def record_assignment(
+        self, assignment: dict, description_path: Optional[str] = None
+    ):
+        assignment = _unsigned(assignment)
+        self._add(
+            "assignments",
+            (
+                _id(assignment["id"]),
+                assignment.get("name"),
+                assignment.get("due_at"),
+                assignment.get("points_possible"),
+                assignment.get("updated_at"),
+                assignment.get("html_url"),
+                description_path,
+                _json(assignment),
+            ),
+        )
+
+    # Submissions are personal, multi-account runs keep one per account
+    def record_submission(
+        self,
+        assignment_id,
+        submission: dict,
+        account: Optional[str] = None,
+        result_path: Optional[str] = None,
+    ):
+        submission = _unsigned(submission)
+        self._add(
+            "submissions",
+            (
+                _id(assignment_id),
+                account or "",
+                _id(submission.get("grade")),
+                submission.get("score"),
+                submission.get("submitted_at"),
+                submission.get("workflow_state"),
+                _json(
+                    [
+                        comment.get("comment", "")
+                        for comment in submission.get("submission_comments") or []
+                    ]
+                ),
+                result_path,
+                _json(submission),
+            ),
+        )
+
+    def record_file(self, file: dict, save_path: str):
+        file = _unsigned(file)
+        self._add(
+            "files",
+            (
+                _id(file.get("id")),
+                save_path,
+                file.get("display_name"),
+                file.get("size"),
+                file.get("content-type"),
+                file.get("url"),
+                file.get("updated_at"),
+                file.get("modified_at"),
+                _json(file),
+            ),
+        )
+
+    def record_page(
+        self,
+        url: str,
+        kind: str,
+        title: Optional[str],
+        updated_at: Optional[str],
+        save_path: Optional[str],
+    ):
+        self._add("pages", (url, kind, title, updated_at, save_path, time.time()))
+
+    def record_cant_download(
+        self, file_id, module_id, title: Optional[str], reason: str, data: dict
+    ):
+        self._add(
+            "cant_download",
+            (_id(file_id), _id(module_id), title, reason, _json(data)),
+        )
+
+    # Function to run a read-only query against the written metadata
+    def query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            self._write()
+            return self._conn.execute(sql, params).fetchall()
+
+    def commit(self):
+        with self._lock:
+            self._write()
+
+    def close(self):
+        with self._lock:
+            self._write()
+            self._conn.close()
+
+
+# The metadata databases of the courses being processed. Courses are opened while they are
+# processed and closed by the last user, accounts sharing a course share the database.
+class MetadataStore:
+    def __init__(self, root: str = COURSES_ROOT):
+        self.root = root
+        self._courses: dict[str, CourseMetadata] = {}
+        self._users: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def open(self, course_id, course_name: str) -> CourseMetadata:
+        course_id = str(course_id)
+        with self._lock:
+            metadata = self._courses.get(course_id)
+            if metadata is None:
+                metadata = CourseMetadata(
+                    os.path.join(self.root, course_name, METADATA_NAME)
+                )
+                self._courses[course_id] = metadata
+            self._users[course_id] = self._users.get(course_id, 0) + 1
+        return metadata
+
+    # The database of a course that is being processed, None otherwise
+    def get(self, course_id) -> Optional[CourseMetadata]:
+        with self._lock:
+            return self._courses.get(str(course_id))
+
+    def release(self, course_id):
+        course_id = str(course_id)
+        with self._lock:
+            self._users[course_id] = self._users.get(course_id, 1) - 1
+            if self._users[course_id] > 0:
+                return
+            del self._users[course_id]
+            metadata = self._courses.pop(course_id, None)
+        if metadata is not None:
+            metadata.close()
+            main_logger.debug(f"Wrote course metadata: {metadata.path}")
+
+    def close(self):
+        with self._lock:
+            courses = list(self._courses.values())
+            self._courses.clear()
+            self._users.clear()
+        for metadata in courses:
+            metadata.close()
+
+
+_metadata: Optional[MetadataStore] = None
+
+
+# The metadata store of the run, None when it is disabled
+def get_metadata() -> Optional[MetadataStore]:
+    return _metadata
+
+
+def set_metadata(store: Optional[MetadataStore]):
+    global _metadata
+    _metadata = store
+
+
+# Function to get the metadata database of a course being processed, if any
+def course_metadata(course_id) -> Optional[CourseMetadata]:
+    return _metadata.get(course_id) if _metadata else None
@@ -0,0 +1,99 @@
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from functions import is_up_to_date
+from storage import COURSES_ROOT
+
+PAGE_INDEX_PATH = os.path.join(COURSES_ROOT, "page_index.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    course_id TEXT NOT NULL,
+    updated_at TEXT,
+    body_hash TEXT NOT NULL,
+    links TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    course_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    save_path TEXT NOT NULL,
+    PRIMARY KEY (course_id, file_id)
+);
+"""
+
+
+@dataclass
+class PageRecord:
+    url: str
+    updated_at: Optional[str]
+    body_hash: str
+    links: list[str]
+
+
+# Persistent record of every crawled page: the last seen updated_at, a hash of the body
+# and the outgoing links. Lets the crawler reuse the links of unchanged pages without
+# fetching or parsing them again. Downloaded files are recorded too, so links to files
+# that are already on disk do not cost a request.
+class PageIndex:
+    def __init__(self, path: str = PAGE_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def get_page(self, url: str) -> Optional[PageRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, updated_at, body_hash, links FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return PageRecord(row[0], row[1], row[2], json.loads(row[3]))
+
+    def put_page(
+        self,
+        url: str,
+        course_id,
+        updated_at: Optional[str],
+        body_hash: str,
+        links: list[str],
+    ):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, course_id, updated_at, body_hash, links) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, str(course_id), updated_at, body_hash, json.dumps(links)),
+            )
+            self._conn.commit()
+
+    # Returns the save path of a file that was downloaded before and is still up to date on disk,
+    # judged by the metadata of the file listing like the files phase does
+    def get_file(self, course_id, file_id, file: dict) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT save_path FROM files WHERE course_id = ? AND file_id = ?",
+                (str(course_id), str(file_id)),
+            ).fetchone()
+        if row and is_up_to_date(row[0], file):
+            return row[0]
+        return None
+
+    def put_file(self, course_id, file_id, save_path: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (course_id, file_id, save_path) VALUES (?, ?, ?)",
+                (str(course_id), str(file_id), save_path),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,211 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+from logger import main_logger
+
+PROFILE_DIR = os.path.join("logs", "profile")
+PROFILE_MODES = ("full", "sample")
+
+
+# Background thread that periodically samples the stacks of all threads.
+# Its overhead only depends on the sampling interval, so it is cheap enough to leave on in production.
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.label = "idle"
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            label = self.label
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(label)
+                self.samples[";".join(reversed(stack))] += 1
+
+    # Writes the samples in the collapsed stack format (usable with flamegraph.pl or speedscope)
+    def write_folded(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+    # Functions that were most often on top of the stack, per phase
+    def top_functions(self, top_n: int) -> list[tuple[str, int]]:
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            parts = stack.split(";")
+            leaves[f"{parts[0]}: {parts[-1]}"] += count
+        return leaves.most_common(top_n)
+
+
+# Profiles the phases of a run. In "full" mode every phase is wrapped in cProfile and tracemalloc
+# snapshots, in "sample" mode a SamplingProfiler attributes samples to the running phase.
+# Without a mode all hooks are no-ops.
+class PhaseProfiler:
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        output_dir: str = PROFILE_DIR,
+        top_n: int = 25,
+        interval: float = 0.01,
+    ):
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self._phase_stats: dict[str, pstats.Stats] = {}
+        self._phase_times: Counter = Counter()
+        self._course_stats: Optional[pstats.Stats] = None
+        self._sampler: Optional[SamplingProfiler] = None
+
+        if mode:
+            os.makedirs(output_dir, exist_ok=True)
+        if mode == "full":
+            tracemalloc.start()
+        elif mode == "sample":
+            self._sampler = SamplingProfiler(interval)
+            self._sampler.start()
+
+    def _course_dir(self, course_name: str) -> str:
+        # Imported here, the functions module pulls in the HTTP stack the CLI loads lazily
+        from functions import sanitize_filename
+
+        path = os.path.join(self.output_dir, sanitize_filename(course_name))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _write_allocations(self, path: str, before, after, title: str):
+        stats = after.compare_to(before, "lineno")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Top {self.top_n} allocation differences for {title}\n")
+            for stat in stats[: self.top_n]:
+                f.write(f"{stat}\n")
+
+    # Function to profile a single phase of a course
+    @contextmanager
+    def phase(self, phase_name: str, course_name: str):
+        if self.mode is None:
+            yield
+            return
+
+        start = time.perf_counter()
+        if self.mode == "sample":
+            self._sampler.label = phase_name
+            try:
+                yield
+            finally:
+                self._sampler.label = "idle"
+                self._phase_times[phase_name] += time.perf_counter() - start
+            return
+
+        before = tracemalloc.take_snapshot()
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            after = tracemalloc.take_snapshot()
+            elapsed = time.perf_counter() - start
+            self._phase_times[phase_name] += elapsed
+
+            course_dir = self._course_dir(course_name)
+            profile.dump_stats(os.path.join(course_dir, f"{phase_name}.prof"))
+            self._write_allocations(
+                os.path.join(course_dir, f"{phase_name}.alloc.txt"),
+                before,
+                after,
+                f"{phase_name} ({course_name})",
+            )
+
+            stats = pstats.Stats(profile)
+            if phase_name in self._phase_stats:
+                self._phase_stats[phase_name].add(stats)
+            else:
+                self._phase_stats[phase_name] = stats
+            if self._course_stats is None:
+                self._course_stats = pstats.Stats(profile)
+            else:
+                self._course_stats.add(stats)
+
+            main_logger.info(f"Profiled {phase_name} ({course_name}): {elapsed:.2f}s")
+
+    # Function to profile a whole course, the course profile combines the profiles of its phases
+    @contextmanager
+    def course(self, course_name: str):
+        if self.mode != "full":
+            yield
+            return
+
+        self._course_stats = None
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            course_dir = self._course_dir(course_name)
+            if self._course_stats is not None:
+                self._course_stats.dump_stats(os.path.join(course_dir, "course.prof"))
+            self._write_allocations(
+                os.path.join(course_dir, "course.alloc.txt"), before, after, course_name
+            )
+
+    # Function to write the per-phase reports of the whole run
+    def close(self):
+        if self.mode is None:
+            return
+
+        summary = io.StringIO()
+        summary.write("Wall time per phase\n")
+        for phase_name, elapsed in self._phase_times.most_common():
+            summary.write(f"  {phase_name}: {elapsed:.2f}s\n")
+
+        if self.mode == "full":
+            for phase_name, stats in self._phase_stats.items():
+                stats.dump_stats(os.path.join(self.output_dir, f"{phase_name}.prof"))
+                summary.write(f"\nTop {self.top_n} functions in {phase_name}\n")
+                stats.stream = summary
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+            tracemalloc.stop()
+        else:
+            self._sampler.stop()
+            self._sampler.write_folded(os.path.join(self.output_dir, "samples.folded"))
+            summary.write(f"\nTop {self.top_n} sampled functions\n")
+            for function, count in self._sampler.top_functions(self.top_n):
+                summary.write(f"  {count:8d}  {function}\n")
+
+        summary_path = os.path.join(self.output_dir, "summary.txt")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        main_logger.info(f"Wrote profile summary to: {summary_path}")
@@ -0,0 +1,234 @@
+import json
+import sys
+import threading
+import time
+from typing import Optional
+
+PROGRESS_MODES = ("auto", "bar", "json", "off")
+
+
+# Counters of a course being processed
+class CourseProgress:
+    __slots__ = ("name", "files_total", "files_done", "bytes")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.files_total = 0
+        self.files_done = 0
+        self.bytes = 0
+
+
+# Thread-safe counters updated by the download workers, the crawler and the HTTP session.
+# Updates only take a lock and add to integers, rendering happens in ProgressReporter.
+# The per-course counters belong to the thread that started the course, so accounts processed
+# in parallel each count their own course. Workers of a course run through in_course().
+class ProgressTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started = time.monotonic()
+        self.courses_total = 0
+        self.courses_done = 0
+        self.files_total = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.requests = 0
+        self.pages = 0
+        # Courses in progress, in the order they were started
+        self._active: list[CourseProgress] = []
+
+    # Courses are added per account, a multi-account run adds the plans of all accounts
+    def add_courses(self, count: int):
+        with self._lock:
+            self.courses_total += count
+
+    # The course of the calling thread, None outside of a course
+    def current_course(self) -> Optional[CourseProgress]:
+        return getattr(self._local, "course", None)
+
+    # Function to run a worker of a course, its updates count for that course
+    def in_course(self, course: Optional[CourseProgress], function, *args, **kwargs):
+        previous = self.current_course()
+        self._local.course = course
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._local.course = previous
+
+    def start_course(self, course_name: str):
+        course = CourseProgress(course_name)
+        with self._lock:
+            previous = self.current_course()
+            if previous in self._active:
+                self._active.remove(previous)
+            self._active.append(course)
+        self._local.course = course
+
+    def finish_course(self):
+        course = self.current_course()
+        with self._lock:
+            self.courses_done += 1
+            if course in self._active:
+                self._active.remove(course)
+        self._local.course = None
+
+    def finish(self):
+        course = self.current_course()
+        with self._lock:
+            if course in self._active:
+                self._active.remove(course)
+        self._local.course = None
+
+    def add_files(self, count: int):
+        course = self.current_course()
+        with self._lock:
+            self.files_total += count
+            if course is not None:
+                course.files_total += count
+
+    def file_done(self, size: int = 0):
+        course = self.current_course()
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+            if course is not None:
+                course.files_done += 1
+                course.bytes += size
+
+    def page_done(self, size: int = 0):
+        course = self.current_course()
+        with self._lock:
+            self.pages += 1
+            self.bytes_done += size
+            if course is not None:
+                course.bytes += size
+
+    def request_done(self, *args, **kwargs):
+        # Signature allows using it directly as a requests response hook
+        with self._lock:
+            self.requests += 1
+
+    # Returns a consistent copy of the counters with derived rates and an ETA.
+    # "course" is the course started last, "courses" lists all courses in progress.
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            active = [
+                {
+                    "name": course.name,
+                    "files_done": course.files_done,
+                    "files_total": course.files_total,
+                    "bytes": course.bytes,
+                }
+                for course in self._active
+            ]
+            latest = active[-1] if active else None
+            status = {
+                "elapsed": round(elapsed, 1),
+                "course": latest["name"] if latest else None,
+                "courses": active,
+                "courses_done": self.courses_done,
+                "courses_total": self.courses_total,
+                "course_files_done": latest["files_done"] if latest else 0,
+                "course_files_total": latest["files_total"] if latest else 0,
+                "course_bytes": latest["bytes"] if latest else 0,
+                "files_done": self.files_done,
+                "files_total": self.files_total,
+                "bytes": self.bytes_done,
+                "pages": self.pages,
+                "requests": self.requests,
+                "mb_per_s": round(self.bytes_done / elapsed / 1e6, 2),
+                "requests_per_s": round(self.requests / elapsed, 2),
+            }
+
+            # Courses are the only total known up front, courses in progress count by their file progress
+            progress = self.courses_done + sum(
+                course["files_done"] / course["files_total"]
+                for course in active
+                if course["files_total"]
+            )
+            if self.courses_total and progress > 0:
+                fraction = min(progress / self.courses_total, 1.0)
+                status["eta"] = round(elapsed / fraction - elapsed, 1)
+            else:
+                status["eta"] = None
+        return status
+
+
+def _format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return (
+        f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+    )
+
+
+# Renders the tracker at a fixed refresh rate: a status line on a terminal ("bar"),
+# or one JSON object per line for headless runs ("json"). Both go to stderr, so they don't
+# mix with the output of a command when it is piped.
+class ProgressReporter:
+    def __init__(self, tracker: ProgressTracker, mode: str = "auto", interval=None):
+        if mode == "auto":
+            mode = "bar" if sys.stderr.isatty() else "json"
+        self.tracker = tracker
+        self.mode = mode
+        self.interval = interval or (0.5 if mode == "bar" else 30.0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="progress-reporter", daemon=True
+        )
+
+    def start(self):
+        if self.mode != "off":
+            self._thread.start()
+
+    def stop(self):
+        if self.mode == "off":
+            return
+        self._stop.set()
+        self._thread.join()
+        self.render()
+        if self.mode == "bar":
+            sys.stderr.write("\n")
+            sys.stderr.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.render()
+
+    def render(self):
+        status = self.tracker.snapshot()
+        if self.mode == "json":
+            sys.stderr.write(json.dumps(status) + "\n")
+            sys.stderr.flush()
+            return
+
+        course = status["course"] or "-"
+        if len(course) > 30:
+            course = course[:29] + "…"
+        if len(status["courses"]) > 1:
+            course += f" (+{len(status['courses']) - 1})"
+        line = (
+            f"[{status['courses_done']}/{status['courses_total']}] {course} "
+            f"files {status['course_files_done']}/{status['course_files_total']} | "
+            f"total {status['files_done']}/{status['files_total']} files, "
+            f"{status['bytes'] / 1e6:.1f} MB, {status['mb_per_s']:.2f} MB/s, "
+            f"{status['requests_per_s']:.1f} req/s, ETA {_format_duration(status['eta'])}"
+        )
+        sys.stderr.write("\r\033[K" + line)
+        sys.stderr.flush()
+
+
+_progress = ProgressTracker()
+
+
+# The tracker updated by the download helpers and the crawler
+def get_progress() -> ProgressTracker:
+    return _progress
+
+
+def set_progress(tracker: ProgressTracker):
+    global _progress
+    _progress = tracker
@@ -0,0 +1,115 @@
+import threading
+import time
+from typing import Optional
+
+from requests.adapters import HTTPAdapter
+
+from logger import api_logger
+
+# Canvas answers 403 with this text when the quota of a token is used up
+RATE_LIMIT_EXCEEDED = b"Rate Limit Exceeded"
+# Below this many remaining quota units requests of the token are spaced out
+LOW_REMAINING_QUOTA = 100.0
+MAX_RATE_LIMIT_RETRIES = 5
+
+
+# Token bucket: allows `rate` requests per second on average and bursts of up to `burst`.
+# A rate of None only applies the pauses requested through pause().
+class TokenBucket:
+    def __init__(self, rate: Optional[float] = None, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    # Function to wait until a request may be sent
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if wait <= 0 and self.rate is None:
+                    return
+                if wait <= 0:
+                    self.tokens = min(
+                        self.burst, self.tokens + (now - self.updated) * self.rate
+                    )
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+# Transport adapter that gives every access token its own bucket, so requests of one
+# account never wait for another account's budget. Mounted on the shared session, it also
+# sizes the connection pool for all workers of all accounts.
+class RateLimitedAdapter(HTTPAdapter):
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        pool_maxsize: int = 10,
+    ):
+        super().__init__(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+
+    def bucket(self, authorization: Optional[str]) -> TokenBucket:
+        with self._buckets_lock:
+            bucket = self._buckets.get(authorization)
+            if bucket is None:
+                # Requests without a token (e.g. redirected file downloads) are not limited
+                rate = self.rate if authorization else None
+                bucket = TokenBucket(rate, self.burst)
+                self._buckets[authorization] = bucket
+            return bucket
+
+    def send(self, request, **kwargs):
+        bucket = self.bucket(request.headers.get("Authorization"))
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            bucket.acquire()
+            response = super().send(request, **kwargs)
+
+            remaining = response.headers.get("X-Rate-Limit-Remaining")
+            if remaining is not None:
+                try:
+                    if float(remaining) < LOW_REMAINING_QUOTA:
+                        bucket.pause(1.0)
+                except ValueError:
+                    pass
+
+            # The body of a streamed response is only read to detect a rate limit answer
+            if (
+                response.status_code != 403
+                or RATE_LIMIT_EXCEEDED not in response.content
+                or attempt == MAX_RATE_LIMIT_RETRIES
+            ):
+                return response
+            delay = 2**attempt
+            api_logger.warning(f"Rate limited, retrying in {delay}s: {request.url}")
+            bucket.pause(delay)
+            response.close()
+        return response
+
+
+# Function to mount the rate limited adapter on a session for all Canvas traffic
+def mount_rate_limiter(
+    session,
+    rate: Optional[float] = None,
+    burst: Optional[int] = None,
+    pool_maxsize: int = 10,
+) -> RateLimitedAdapter:
+    adapter = RateLimitedAdapter(rate, burst, pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return adapter
@@ -0,0 +1,195 @@
+import base64
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Optional
+
+import requests
+from requests.hooks import dispatch_hook
+from requests.structures import CaseInsensitiveDict
+
+from logger import main_logger
+
+# Response headers that describe the transfer rather than the content, they are not recorded
+SKIPPED_HEADERS = {"content-encoding", "transfer-encoding", "connection", "set-cookie"}
+# Bytes recorded of a streamed body when no --record-max-body is given
+STREAMED_BODY_LIMIT = 1024 * 1024
+
+
+# Request headers that select a different body for the same URL (byte ranges of segmented
+# downloads, conditional requests), they are part of the cassette key
+KEYED_HEADERS = ("Range", "If-Range", "If-None-Match", "If-Modified-Since")
+
+
+# Key identifying a request in a cassette, other request headers (and the token) are not part of it
+def _request_key(method: str, url: str, params=None, headers=None) -> str:
+    prepared = requests.Request(method.upper(), url, params=params).prepare()
+    key = f"{prepared.method} {prepared.url}"
+    headers = CaseInsensitiveDict(headers or {})
+    for name in KEYED_HEADERS:
+        if name in headers:
+            key += f" {name}: {headers[name]}"
+    return key
+
+
+# Session that performs real requests and appends every request/response pair to a
+# gzip-compressed JSON lines cassette. Bodies can be truncated to keep cassettes small,
+# streamed bodies always are.
+class RecordingSession(requests.Session):
+    def __init__(self, cassette_path: str, max_body_bytes: Optional[int] = None):
+        super().__init__()
+        self.cassette_path = cassette_path
+        self.max_body_bytes = max_body_bytes
+        self._lock = threading.Lock()
+        self._cassette = gzip.open(cassette_path, "at", encoding="utf-8")
+
+    def request(self, method, url, params=None, **kwargs):
+        start = time.perf_counter()
+        response = super().request(method, url, params=params, **kwargs)
+        elapsed = time.perf_counter() - start
+        key = _request_key(method, url, params, kwargs.get("headers"))
+        if kwargs.get("stream"):
+            self._tee(key, response, elapsed)
+        else:
+            body = response.content
+            self._record(key, response, self._truncate(body), len(body), elapsed)
+        return response
+
+    def _truncate(self, body: bytes) -> bytes:
+        if self.max_body_bytes is not None and len(body) > self.max_body_bytes:
+            return body[: self.max_body_bytes]
+        return body
+
+    # Streamed bodies (file downloads) are not read into memory: the chunks the caller reads
+    # are teed into a prefix of at most max_body_bytes (STREAMED_BODY_LIMIT by default), which is
+    # recorded once the body is consumed or the response is closed
+    def _tee(self, key: str, response: requests.Response, elapsed: float):
+        limit = (
+            self.max_body_bytes
+            if self.max_body_bytes is not None
+            else STREAMED_BODY_LIMIT
+        )
+        prefix = bytearray()
+        received = 0
+        recorded = False
+        iter_content = response.iter_content
+        close = response.close
+
+        def finish():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                self._record(key, response, bytes(prefix), received, elapsed)
+
+        def tee(chunk_size=1, decode_unicode=False):
+            nonlocal received
+            for chunk in iter_content(chunk_size, decode_unicode):
+                if len(prefix) < limit:
+                    prefix.extend(chunk[: limit - len(prefix)])
+                received += len(chunk)
+                yield chunk
+            finish()
+
+        def close_and_record():
+            finish()
+            close()
+
+        response.iter_content = tee
+        response.close = close_and_record
+
+    def _record(
+        self,
+        key: str,
+        response: requests.Response,
+        stored_body: bytes,
+        size: int,
+        elapsed: float,
+    ):
+        record = {
+            "key": key,
+            "status": response.status_code,
+            "url": response.url,
+            "headers": {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in SKIPPED_HEADERS
+            },
+            "body": base64.b64encode(stored_body).decode("ascii"),
+            "size": size,
+            "elapsed": elapsed,
+        }
+        with self._lock:
+            if not self._cassette.closed:
+                self._cassette.write(json.dumps(record) + "\n")
+
+    def close(self):
+        with self._lock:
+            if not self._cassette.closed:
+                self._cassette.close()
+        super().close()
+
+
+# Session that serves the responses of a cassette without touching the network.
+# Repeated requests are answered in recorded order, the last answer is repeated once they
+# run out. Every response is delayed by its recorded latency times latency_scale.
+class ReplaySession(requests.Session):
+    def __init__(self, cassette_path: str, latency_scale: float = 1.0):
+        super().__init__()
+        self.cassette_path = cassette_path
+        self.latency_scale = latency_scale
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._records: dict[str, deque] = defaultdict(deque)
+
+        with gzip.open(cassette_path, "rt", encoding="utf-8") as cassette:
+            try:
+                for line in cassette:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._records[record["key"]].append(record)
+            except EOFError:
+                # The recording run was interrupted before the gzip trailer was written
+                main_logger.warning(f"Cassette {cassette_path} is truncated")
+
+        main_logger.info(
+            f"Loaded {sum(len(records) for records in self._records.values())} responses from {cassette_path}"
+        )
+
+    def request(self, method, url, params=None, **kwargs):
+        key = _request_key(method, url, params, kwargs.get("headers"))
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                self.misses += 1
+                record = None
+            elif len(records) > 1:
+                record = records.popleft()
+            else:
+                record = records[0]
+
+        response = requests.Response()
+        response.request = requests.Request(
+            method.upper(), url, params=params
+        ).prepare()
+        response._content_consumed = True
+
+        if record is None:
+            main_logger.warning(f"No recorded response for {key}")
+            response.status_code = 404
+            response.url = response.request.url
+            response._content = b""
+            return dispatch_hook("response", self.hooks, response)
+
+        if self.latency_scale > 0:
+            time.sleep(record["elapsed"] * self.latency_scale)
+
+        response.status_code = record["status"]
+        response.url = record["url"]
+        response.headers = CaseInsensitiveDict(record["headers"])
+        response._content = base64.b64decode(record["body"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return dispatch_hook("response", self.hooks, response)
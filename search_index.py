@@ -0,0 +1,202 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Optional
+
+from logger import main_logger
+from storage import COURSES_ROOT
+
+SEARCH_INDEX_PATH = os.path.join(COURSES_ROOT, "search.sqlite")
+
+# Number of changed documents after which the pending transaction is committed
+COMMIT_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    course_id TEXT NOT NULL,
+    course_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    canvas_id TEXT NOT NULL,
+    title TEXT,
+    path TEXT,
+    digest TEXT NOT NULL,
+    UNIQUE (course_id, kind, canvas_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title, body, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+@dataclass
+class SearchHit:
+    course_name: str
+    kind: str
+    canvas_id: str
+    title: str
+    path: Optional[str]
+    snippet: str
+    rank: float
+
+
+# Collects the visible text of an HTML document, script and style contents are dropped
+class _TextExtractor(HTMLParser):
+    SKIPPED_TAGS = {"script", "style", "noscript"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+# Function to strip HTML and return the whitespace-normalized text
+def html_to_text(html: Optional[str]) -> str:
+    if not html:
+        return ""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return " ".join(" ".join(extractor.parts).split())
+
+
+# Incremental full text index (SQLite FTS5) over the archived content.
+# Documents are keyed by (course_id, kind, canvas_id) and only rewritten when their text changed.
+class SearchIndex:
+    def __init__(self, path: str = SEARCH_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    # Function to add or update a document, returns False if it was already indexed unchanged
+    def index_document(
+        self,
+        course_id,
+        course_name: str,
+        kind: str,
+        canvas_id,
+        title: str,
+        text: str,
+        path: Optional[str] = None,
+    ) -> bool:
+        course_id, canvas_id = str(course_id), str(canvas_id)
+        digest = hashlib.sha1(f"{title}\0{text}".encode("utf-8")).hexdigest()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, digest FROM documents WHERE course_id = ? AND kind = ? AND canvas_id = ?",
+                (course_id, kind, canvas_id),
+            ).fetchone()
+            if row and row[1] == digest:
+                return False
+
+            if row:
+                doc_id = row[0]
+                self._conn.execute(
+                    "UPDATE documents SET course_name = ?, title = ?, path = ?, digest = ? WHERE id = ?",
+                    (course_name, title, path, digest, doc_id),
+                )
+                self._conn.execute(
+                    "DELETE FROM documents_fts WHERE rowid = ?", (doc_id,)
+                )
+            else:
+                doc_id = self._conn.execute(
+                    "INSERT INTO documents (course_id, course_name, kind, canvas_id, title, path, digest) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (course_id, course_name, kind, canvas_id, title, path, digest),
+                ).lastrowid
+            self._conn.execute(
+                "INSERT INTO documents_fts (rowid, title, body) VALUES (?, ?, ?)",
+                (doc_id, title, text),
+            )
+
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self._commit()
+
+        main_logger.debug(f"Indexed {kind} {canvas_id} of course {course_name}")
+        return True
+
+    # Function to index an HTML document, the markup is stripped before indexing
+    def index_html(
+        self, course_id, course_name, kind, canvas_id, title, html, path=None
+    ) -> bool:
+        return self.index_document(
+            course_id, course_name, kind, canvas_id, title, html_to_text(html), path
+        )
+
+    # Function to run a full text query, results are ordered by relevance (bm25).
+    # Plain queries match all of their words, raw=True passes FTS5 query syntax through.
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        course: Optional[str] = None,
+        raw: bool = False,
+    ) -> list[SearchHit]:
+        if not raw:
+            query = " ".join(
+                '"' + term.replace('"', '""') + '"' for term in query.split()
+            )
+        sql = (
+            "SELECT d.course_name, d.kind, d.canvas_id, d.title, d.path, "
+            "snippet(documents_fts, 1, '[', ']', '...', 12), bm25(documents_fts, 5.0, 1.0) AS rank "
+            "FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid "
+            "WHERE documents_fts MATCH ?"
+        )
+        params: list = [query]
+        if course:
+            sql += " AND (d.course_name = ? OR d.course_id = ?)"
+            params += [course, course]
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def _commit(self):
+        self._conn.commit()
+        self._pending = 0
+
+    def commit(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+
+_search_index: Optional[SearchIndex] = None
+
+
+# The index fed by the crawler and the download phases, None when indexing is disabled
+def get_search_index() -> Optional[SearchIndex]:
+    return _search_index
+
+
+def set_search_index(search_index: Optional[SearchIndex]):
+    global _search_index
+    _search_index = search_index
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+
+from logger import main_logger
+from transport import (
+    TransferSettings,
+    get_session,
+    get_transfer_settings,
+    iter_content_with_watchdog,
+)
+
+# Segments are never smaller than this, splitting further only adds requests
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# A plain MD5 ETag (multipart uploads have a "-<parts>" suffix and are no digest of the body)
+MD5_ETAG = re.compile(r'^(?:W/)?"?([0-9a-fA-F]{32})"?$')
+
+
+# The server ignored or mangled a Range request, the file has to be downloaded as a single stream
+class RangesUnsupported(Exception):
+    pass
+
+
+class IncompleteSegment(requests.exceptions.RequestException):
+    pass
+
+
+class SegmentValidationError(requests.exceptions.RequestException):
+    pass
+
+
+# Function to get the size of a response worth downloading in segments, None for a single stream.
+# Segments need a known unencoded length above the threshold, byte ranges and positional writes.
+def segmented_size(
+    response: requests.Response, settings: TransferSettings
+) -> Optional[int]:
+    if not settings.segment_threshold or settings.segments < 2:
+        return None
+    if not hasattr(os, "pwrite"):
+        return None
+    if response.headers.get("Accept-Ranges", "").lower() != "bytes":
+        return None
+    if response.headers.get("Content-Encoding", "identity").lower() != "identity":
+        return None
+    try:
+        size = int(response.headers.get("Content-Length", ""))
+    except ValueError:
+        return None
+    return size if size >= settings.segment_threshold else None
+
+
+# Function to get the headers for the segment requests. Like a redirect, the access token is only
+# sent to the host it belongs to (file URLs redirect to signed URLs of another host).
+def segment_headers(file_url: str, segment_url: str, headers: dict) -> dict:
+    if urlparse(file_url).hostname == urlparse(segment_url).hostname:
+        return dict(headers)
+    return {}
+
+
+def _ranges(size: int, segments: int) -> list[tuple[int, int]]:
+    segment_size = max(MIN_SEGMENT_SIZE, -(-size // segments))
+    return [
+        (start, min(start + segment_size, size) - 1)
+        for start in range(0, size, segment_size)
+    ]
+
+
+def _preallocate(fd: int, size: int):
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            # Not supported by every file system
+            pass
+    os.ftruncate(fd, size)
+
+
+# Function to write a chunk at an offset, pwrite may write less than it was given
+def _pwrite_all(fd: int, chunk: bytes, offset: int):
+    view = memoryview(chunk)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        if written == 0:
+            raise OSError(f"No progress writing at offset {offset}")
+        view = view[written:]
+        offset += written
+
+
+# Function to fetch the bytes start..end (inclusive) into the file at their offsets, returns the
+# number of bytes written. A failed attempt resumes after the last written byte, a response that
+# is not the requested range means ranges are unsupported.
+def _fetch_segment(
+    url: str,
+    headers: dict,
+    fd: int,
+    start: int,
+    end: int,
+    settings: TransferSettings,
+    abort: threading.Event,
+) -> int:
+    offset = start
+    for attempt in range(settings.retries + 1):
+        try:
+            with get_session().get(
+                url,
+                headers={**headers, "Range": f"bytes={offset}-{end}"},
+                stream=True,
+                timeout=settings.timeout,
+            ) as response:
+                if response.status_code == 200:
+                    raise RangesUnsupported(f"Range request answered with 200: {url}")
+                if response.status_code != 206:
+                    raise requests.HTTPError(
+                        f"{response.status_code} for bytes {offset}-{end}",
+                        response=response,
+                    )
+                if not response.headers.get("Content-Range", "").startswith(
+                    f"bytes {offset}-"
+                ):
+                    raise RangesUnsupported(
+                        f"Unexpected Content-Range {response.headers.get('Content-Range')}: {url}"
+                    )
+                for chunk in iter_content_with_watchdog(response, settings=settings):
+                    if abort.is_set():
+                        return offset - start
+                    chunk = chunk[: end + 1 - offset]
+                    _pwrite_all(fd, chunk, offset)
+                    offset += len(chunk)
+                    if offset > end:
+                        break
+            if offset > end:
+                return offset - start
+            raise IncompleteSegment(f"Segment {start}-{end} ended at byte {offset}")
+        except requests.RequestException as e:
+            # Client errors (e.g. an expired signed URL) are not retried
+            if isinstance(e, requests.HTTPError) and e.response.status_code < 500:
+                raise
+            if attempt == settings.retries or abort.is_set():
+                raise
+            main_logger.warning(
+                f"Segment {start}-{end} attempt {attempt + 1} of {url} failed: {e}"
+            )
+
+
+# Function to hash a downloaded file, checking it against the MD5 ETag of the server if it has one.
+# The file was preallocated to its full size, the received bytes are counted per segment instead.
+def _validate(partial_path: str, etag: Optional[str]) -> str:
+    sha256 = hashlib.sha256()
+    match = MD5_ETAG.match(etag or "")
+    md5 = hashlib.md5() if match else None
+    with open(partial_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+            if md5:
+                md5.update(chunk)
+    if md5 and md5.hexdigest() != match.group(1).lower():
+        raise SegmentValidationError(
+            f"MD5 {md5.hexdigest()} does not match the ETag {etag}"
+        )
+    return sha256.hexdigest()
+
+
+# Function to download a large file as byte ranges fetched in parallel over the pooled connections,
+# written straight into a preallocated partial file. Returns the sha256 of the file.
+# Raises RangesUnsupported when the caller has to fall back to a single stream.
+def download_segmented(
+    url: str,
+    headers: dict,
+    partial_path: str,
+    size: int,
+    etag: Optional[str] = None,
+    settings: Optional[TransferSettings] = None,
+) -> str:
+    settings = settings or get_transfer_settings()
+    ranges = _ranges(size, settings.segments)
+    main_logger.debug(f"Downloading {url} in {len(ranges)} segments of {size} bytes")
+    abort = threading.Event()
+    fd = os.open(partial_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        _preallocate(fd, size)
+        with ThreadPoolExecutor(
+            max_workers=len(ranges), thread_name_prefix="segment"
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _fetch_segment, url, headers, fd, start, end, settings, abort
+                )
+                for start, end in ranges
+            ]
+            try:
+                for (start, end), future in zip(ranges, futures):
+                    received = future.result()
+                    if received != end - start + 1:
+                        raise SegmentValidationError(
+                            f"Segment {start}-{end} received {received} bytes"
+                        )
+            except BaseException:
+                # Stop the other segments, the file is retried or fetched as one stream
+                abort.set()
+                raise
+    finally:
+        os.close(fd)
+    return _validate(partial_path, etag)
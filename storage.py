@@ -0,0 +1,417 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import warnings
+import zipfile
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from logger import main_logger
+from writer import ensure_dir, get_writer
+
+COURSES_ROOT = "courses"
+
+# Compression methods supported by the archive backend (all from the standard library)
+ARCHIVE_COMPRESSION = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+# Size of the chunks that are handed to the compressor when streaming text into an archive
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Share of an archive taken up by replaced members above which it is compacted when closed
+ARCHIVE_COMPACT_RATIO = 0.25
+
+
+# Storage backend that keeps the original layout: one file per page or text artifact
+class FileSystemStorage:
+    def __init__(self, root: str = COURSES_ROOT):
+        self.root = root
+
+    def write_text(self, save_path: str, content: str) -> str:
+        return self.write_stream(save_path, _encode_chunks(content))
+
+    # With a write-behind stage the chunks are only queued, the writer thread writes the file
+    def write_stream(self, save_path: str, chunks: Iterable[bytes]) -> str:
+        writer = get_writer()
+        if writer is not None:
+            handle = writer.open(save_path)
+            for chunk in chunks:
+                handle.write(chunk)
+            handle.close(wait=False)
+            return save_path
+        ensure_dir(os.path.dirname(save_path))
+        with open(save_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return save_path
+
+    # Function to store an exact copy of an already stored artifact without writing it again.
+    # Hard links share the data on disk, a copy is made where links are not supported.
+    def link(self, source_path: str, save_path: str) -> bool:
+        writer = get_writer()
+        if writer is not None:
+            writer.wait_for(source_path)
+            writer.wait_for(save_path)
+        if not os.path.exists(source_path):
+            return False
+        if os.path.abspath(source_path) == os.path.abspath(save_path):
+            return True
+        ensure_dir(os.path.dirname(save_path))
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        try:
+            os.link(source_path, save_path)
+        except OSError:
+            shutil.copyfile(source_path, save_path)
+        return True
+
+    # Pending writes are on disk once the storage is closed
+    def close(self):
+        writer = get_writer()
+        if writer is not None:
+            writer.flush()
+
+
+# Storage backend that appends pages and text artifacts to a compressed zip archive per course.
+# Every write is also appended to a JSON lines index next to the archive (<course>.idx), which
+# stores the offset of the member so it can be read back without the zip central directory.
+# The index is what makes the archive usable after a crash, when the central directory is missing.
+# Content that is already archived unchanged is not kept again. Archives are compacted when they
+# are closed if replaced members take up more than ARCHIVE_COMPACT_RATIO of them, or an
+# interrupted run left members behind that the central directory does not list.
+class ArchiveStorage:
+    def __init__(self, root: str = COURSES_ROOT, compression: str = "deflate"):
+        if compression not in ARCHIVE_COMPRESSION:
+            raise ValueError(f"Unsupported archive compression: {compression}")
+        self.root = root
+        self.compression = ARCHIVE_COMPRESSION[compression]
+        self._fallback = FileSystemStorage(root)
+        self._archives: dict[str, zipfile.ZipFile] = {}
+        self._indexes: dict = {}
+        # Index entries of the open archives, by course and member name
+        self._entries: dict[str, dict[str, dict]] = {}
+        self._lock = threading.Lock()
+
+    def _split_path(self, save_path: str) -> Optional[tuple[str, str]]:
+        relative = os.path.relpath(save_path, self.root)
+        parts = relative.split(os.sep)
+        if parts[0] == os.pardir or len(parts) < 2:
+            return None
+        return parts[0], "/".join(parts[1:])
+
+    def _open_course(self, course_name: str) -> zipfile.ZipFile:
+        archive = self._archives.get(course_name)
+        if archive is None:
+            os.makedirs(self.root, exist_ok=True)
+            archive_path, index_path = archive_paths(self.root, course_name)
+            archive = zipfile.ZipFile(archive_path, "a", compression=self.compression)
+            self._archives[course_name] = archive
+            self._entries[course_name] = (
+                load_archive_index(index_path) if os.path.exists(index_path) else {}
+            )
+            self._indexes[course_name] = open(index_path, "a", encoding="utf-8")
+            main_logger.debug(f"Opened archive: {archive_path}")
+        return archive
+
+    def write_text(self, save_path: str, content: str) -> str:
+        return self.write_stream(save_path, _encode_chunks(content))
+
+    # With a write-behind stage the member is compressed and appended on the writer thread
+    def write_stream(self, save_path: str, chunks: Iterable[bytes]) -> str:
+        location = self._split_path(save_path)
+        if location is None:
+            main_logger.debug(
+                f"Path outside of archive root, writing plain file: {save_path}"
+            )
+            return self._fallback.write_stream(save_path, chunks)
+
+        # The chunks are consumed on the writer thread when there is one
+        writer = get_writer()
+        if writer is not None:
+            writer.submit(save_path, self._write_member, location, chunks)
+            return save_path
+        self._write_member(location, chunks)
+        return save_path
+
+    # The chunks are hashed while they are compressed into the archive, a member that turns out
+    # to be unchanged is cut off the end of the archive again
+    def _write_member(self, location: tuple[str, str], chunks: Iterable[bytes]):
+        course_name, member = location
+        digest = hashlib.sha256()
+        with self._lock:
+            archive = self._open_course(course_name)
+            replaced = archive.NameToInfo.get(member)
+            zinfo = zipfile.ZipInfo(member)
+            zinfo.compress_type = self.compression
+            with warnings.catch_warnings():
+                # Re-archiving a page appends a newer member with the same name, the index
+                # always points at the latest one
+                warnings.filterwarnings("ignore", "Duplicate name", UserWarning)
+                with archive.open(zinfo, "w") as f:
+                    for chunk in chunks:
+                        digest.update(chunk)
+                        f.write(chunk)
+
+            sha256 = digest.hexdigest()
+            previous = self._entries[course_name].get(member)
+            if previous is not None and previous.get("sha256") == sha256:
+                _drop_last_member(archive, zinfo, replaced)
+                main_logger.debug(f"Unchanged, not archived again: {member}")
+                return
+            self._write_index_entry(course_name, _index_entry(zinfo, sha256))
+
+        main_logger.debug(f"Archived {member} into {course_name}")
+
+    def _write_index_entry(self, course_name: str, entry: dict):
+        index = self._indexes[course_name]
+        index.write(json.dumps(entry) + "\n")
+        index.flush()
+        self._entries[course_name][entry["name"]] = entry
+
+    # Function to store an exact copy of an archived member: the index gets a second
+    # name pointing at the same data, nothing is compressed or written to the archive
+    def link(self, source_path: str, save_path: str) -> bool:
+        writer = get_writer()
+        if writer is not None:
+            writer.wait_for(source_path)
+        source, target = self._split_path(source_path), self._split_path(save_path)
+        if source is None or target is None or source[0] != target[0]:
+            return False
+        course_name = source[0]
+        with self._lock:
+            entry = self._entries.get(course_name, {}).get(source[1])
+            if entry is None:
+                return False
+            self._write_index_entry(course_name, {**entry, "name": target[1]})
+        main_logger.debug(f"Linked {target[1]} to {source[1]} in {course_name}")
+        return True
+
+    def close(self):
+        writer = get_writer()
+        if writer is not None:
+            writer.flush()
+        with self._lock:
+            for course_name, archive in self._archives.items():
+                stored = archive.infolist()
+                archive.close()
+                self._indexes[course_name].close()
+                main_logger.debug(f"Closed archive for course: {course_name}")
+                referenced = {
+                    entry["header_offset"]
+                    for entry in self._entries[course_name].values()
+                }
+                if _needs_compaction(archive.filename, stored, referenced):
+                    compact_archive(self.root, course_name)
+            self._archives.clear()
+            self._indexes.clear()
+            self._entries.clear()
+
+
+# Returns the archive and index paths of a course
+def archive_paths(root: str, course_name: str) -> tuple[str, str]:
+    return (
+        os.path.join(root, f"{course_name}.zip"),
+        os.path.join(root, f"{course_name}.idx"),
+    )
+
+
+def _index_entry(zinfo: zipfile.ZipInfo, sha256: Optional[str]) -> dict:
+    return {
+        "name": zinfo.filename,
+        "header_offset": zinfo.header_offset,
+        "compress_type": zinfo.compress_type,
+        "compress_size": zinfo.compress_size,
+        "file_size": zinfo.file_size,
+        "crc": zinfo.CRC,
+        "flag_bits": zinfo.flag_bits,
+        "sha256": sha256,
+    }
+
+
+# Function to cut the member written last off the end of an archive, the central directory
+# written on close no longer lists it and the name points at the member it replaced again
+def _drop_last_member(
+    archive: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+    replaced: Optional[zipfile.ZipInfo],
+):
+    archive.filelist.remove(zinfo)
+    if replaced is None:
+        del archive.NameToInfo[zinfo.filename]
+    else:
+        archive.NameToInfo[zinfo.filename] = replaced
+    archive.fp.seek(zinfo.header_offset)
+    archive.fp.truncate()
+    archive.start_dir = zinfo.header_offset
+
+
+# Function to decide whether an archive is compacted when it is closed: the index points at
+# members the central directory does not list (an interrupted run), or members that were
+# replaced take up more than ARCHIVE_COMPACT_RATIO of the archive
+def _needs_compaction(
+    archive_path: str, stored: list[zipfile.ZipInfo], referenced: set[int]
+) -> bool:
+    if referenced - {zinfo.header_offset for zinfo in stored}:
+        return True
+    dead_bytes = sum(
+        zipfile.sizeFileHeader
+        + len(zinfo.filename.encode("utf-8"))
+        + len(zinfo.extra)
+        + zinfo.compress_size
+        for zinfo in stored
+        if zinfo.header_offset not in referenced
+    )
+    return dead_bytes > ARCHIVE_COMPACT_RATIO * os.path.getsize(archive_path)
+
+
+# Function to rewrite an archive with only the members its index points at. Replaced members
+# and the leftovers of an interrupted run are dropped, names linked to the same data keep
+# sharing it. Members that can't be read back (cut off by a crash) are dropped from the index.
+# Returns the number of members in the compacted archive.
+def compact_archive(root: str, course_name: str) -> int:
+    archive_path, index_path = archive_paths(root, course_name)
+    entries = load_archive_index(index_path)
+    compacted_path, compacted_index_path = archive_path + ".tmp", index_path + ".tmp"
+    # New index entries by the offset of the data in the old archive
+    written: dict[int, dict] = {}
+    try:
+        with zipfile.ZipFile(compacted_path, "w") as archive, open(
+            compacted_index_path, "w", encoding="utf-8"
+        ) as index:
+            for name, entry in entries.items():
+                copied = written.get(entry["header_offset"])
+                if copied is None:
+                    try:
+                        content = read_archive_member(archive_path, entry)
+                    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                        main_logger.warning(
+                            f"Dropping unreadable member {name} of {course_name}: {e}"
+                        )
+                        continue
+                    zinfo = zipfile.ZipInfo(name)
+                    zinfo.compress_type = entry["compress_type"]
+                    archive.writestr(zinfo, content)
+                    copied = _index_entry(zinfo, entry.get("sha256"))
+                    written[entry["header_offset"]] = copied
+                index.write(json.dumps({**copied, "name": name}) + "\n")
+    except OSError as e:
+        main_logger.warning(f"Could not compact the archive of {course_name}: {e}")
+        for path in (compacted_path, compacted_index_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return 0
+    os.replace(compacted_path, archive_path)
+    os.replace(compacted_index_path, index_path)
+    main_logger.info(
+        f"Compacted the archive of {course_name} to {len(written)} members"
+    )
+    return len(written)
+
+
+# Function to load the offset index of an archive, later entries replace earlier ones
+def load_archive_index(index_path: str) -> dict[str, dict]:
+    entries = {}
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partially written last line behind
+                main_logger.warning(f"Skipping corrupt index line in {index_path}")
+                continue
+            entries[entry["name"]] = entry
+    return entries
+
+
+# Function to read a single member from an archive using its index entry (random access)
+def read_archive_member(archive_path: str, entry: dict) -> bytes:
+    zinfo = zipfile.ZipInfo(entry["name"])
+    zinfo.compress_type = entry["compress_type"]
+    zinfo.compress_size = entry["compress_size"]
+    zinfo.file_size = entry["file_size"]
+    zinfo.CRC = entry["crc"]
+    zinfo.flag_bits = entry["flag_bits"]
+
+    with open(archive_path, "rb") as f:
+        f.seek(entry["header_offset"])
+        header = f.read(zipfile.sizeFileHeader)
+        fields = struct.unpack(zipfile.structFileHeader, header)
+        if fields[0] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(
+                f"Bad local header for {entry['name']} in {archive_path}"
+            )
+        # Skip the file name and the extra field of the local header
+        f.seek(fields[10] + fields[11], os.SEEK_CUR)
+        with zipfile.ZipExtFile(f, "r", zinfo) as member:
+            return member.read()
+
+
+# Function to iterate over all (member, content) pairs in an archive
+def iter_archive(root: str, course_name: str) -> Iterator[tuple[str, bytes]]:
+    archive_path, index_path = archive_paths(root, course_name)
+    for name, entry in load_archive_index(index_path).items():
+        yield name, read_archive_member(archive_path, entry)
+
+
+# Function to extract course archives into the regular courses/<course>/... directory layout
+def extract_archives(
+    root: str = COURSES_ROOT,
+    dest: Optional[str] = None,
+    courses: Optional[list[str]] = None,
+) -> int:
+    dest = dest or root
+    if not courses:
+        courses = [
+            file_name[: -len(".idx")]
+            for file_name in sorted(os.listdir(root))
+            if file_name.endswith(".idx")
+        ]
+
+    extracted = 0
+    for course_name in courses:
+        for name, content in iter_archive(root, course_name):
+            save_path = os.path.join(dest, course_name, *name.split("/"))
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            with open(save_path, "wb") as f:
+                f.write(content)
+            extracted += 1
+        main_logger.info(f"Extracted archive for course: {course_name}")
+    return extracted
+
+
+def _encode_chunks(content: str) -> Iterator[bytes]:
+    for start in range(0, len(content), STREAM_CHUNK_SIZE):
+        yield content[start : start + STREAM_CHUNK_SIZE].encode("utf-8")
+
+
+# Function to create the storage backend by name ("files" or "archive")
+def create_storage(
+    backend: str, root: str = COURSES_ROOT, compression: str = "deflate"
+):
+    if backend == "archive":
+        return ArchiveStorage(root, compression)
+    if backend == "files":
+        return FileSystemStorage(root)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+_storage = FileSystemStorage()
+
+
+# The storage used by the save_* helpers, can be replaced with set_storage()
+def get_storage():
+    return _storage
+
+
+def set_storage(storage):
+    global _storage
+    _storage = storage
@@ -0,0 +1,136 @@
+import logging
+import os
+import sys
+
+import pytest
+
+# The modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger import LazyFileHandler  # noqa: E402
+
+
+# Log files go to a temporary directory instead of logs/ of the working directory
+@pytest.fixture(autouse=True, scope="session")
+def log_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("logs")
+    for name in ("main", "api", "crawl", "ignore"):
+        for handler in logging.getLogger(name).handlers:
+            if isinstance(handler, LazyFileHandler):
+                handler.close()
+                handler.baseFilename = str(
+                    directory / os.path.basename(handler.baseFilename)
+                )
+    return directory
+
+
+# Every test runs in its own directory, the modules write to relative paths like courses/
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    import writer
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(writer, "_directories", set())
+    return tmp_path
+
+
+# The module singletons a test (or a command it runs) replaces are restored after it
+@pytest.fixture(autouse=True)
+def singletons(monkeypatch):
+    import accounts
+    import dead_letters
+    import manifest
+    import metadata
+    import progress
+    import search_index
+    import storage
+    import transport
+    import writer
+
+    for module, name in (
+        (accounts, "_accounts"),
+        (dead_letters, "_dead_letters"),
+        (manifest, "_manifest"),
+        (metadata, "_metadata"),
+        (search_index, "_search_index"),
+        (storage, "_storage"),
+        (transport, "_session"),
+        (transport, "_transfer_settings"),
+        (writer, "_writer"),
+    ):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    monkeypatch.setattr(progress, "_progress", progress.ProgressTracker())
+
+
+class FakeResponse:
+    def __init__(
+        self, url: str, status_code: int = 200, body: bytes = b"", headers=None
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self):
+        import json
+
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size: int = 1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start : start + chunk_size]
+
+    def raise_for_status(self):
+        import requests
+
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}: {self.url}", response=self)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Stand-in for the shared HTTP session: handler(url, headers) returns a FakeResponse,
+# query parameters are part of the url
+class FakeSession:
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests: list[tuple[str, dict]] = []
+        self.hooks: dict = {"response": []}
+
+    def get(self, url, headers=None, params=None, **kwargs):
+        from urllib.parse import urlencode
+
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        headers = headers or {}
+        self.requests.append((url, headers))
+        return self.handler(url, headers)
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_session():
+    import transport
+
+    def install(handler) -> FakeSession:
+        session = FakeSession(handler)
+        transport.set_session(session)
+        return session
+
+    return install
@@ -0,0 +1,114 @@
+import json
+import os
+
+import pytest
+
+from api import CanvasAPIClient
+from conftest import FakeResponse
+from metadata import MetadataStore, set_metadata
+
+API = "https://canvas.example.edu/api/v1"
+ASSIGNMENTS = [
+    {"id": 11, "name": "Lab 1", "description": "<p>Measure things</p>"},
+    {"id": 12, "name": "Lab 2", "description": None},
+]
+SUBMISSIONS = {
+    11: {
+        "grade": "A",
+        "score": 9.5,
+        "submission_comments": [{"comment": "Nice work"}],
+        "attachments": [
+            {
+                "id": 99,
+                "display_name": "report.pdf",
+                "url": "https://files.example.edu/99",
+                "size": 6,
+            }
+        ],
+    },
+    12: {"grade": None, "score": None, "submission_comments": []},
+}
+
+
+def _canvas(url, headers):
+    if url == f"{API}/courses/5/assignments/?page=1":
+        return FakeResponse(url, 200, json.dumps(ASSIGNMENTS).encode())
+    if url == f"{API}/courses/5/assignments/?page=2":
+        return FakeResponse(url, 200, b"[]")
+    for assignment_id, submission in SUBMISSIONS.items():
+        if url == (
+            f"{API}/courses/5/assignments/{assignment_id}/submissions/self"
+            "?include%5B%5D=submission_comments"
+        ):
+            return FakeResponse(url, 200, json.dumps(submission).encode())
+    if url == "https://files.example.edu/99":
+        return FakeResponse(url, 200, b"report")
+    return FakeResponse(url, 404)
+
+
+@pytest.fixture
+def metadata_store():
+    store = MetadataStore()
+    set_metadata(store)
+    yield store
+    set_metadata(None)
+    store.close()
+
+
+def test_assignments_phase_saves_descriptions_grades_and_submissions(
+    fake_session, metadata_store
+):
+    from downloader import download_assignments_and_submissions
+
+    fake_session(_canvas)
+    client = CanvasAPIClient("token", "canvas.example.edu")
+    metadata = metadata_store.open(5, "Bio")
+
+    download_assignments_and_submissions(client, 5, "Bio")
+
+    lab1 = os.path.join("courses", "Bio", "cv_assignments", "Lab 1")
+    with open(os.path.join(lab1, "assignment_description.txt")) as f:
+        assert f.read() == "<p>Measure things</p>"
+    with open(os.path.join(lab1, "assignment_result_score.txt")) as f:
+        assert f.read() == "Grade: A\nScore: 9.5\n\nComments:\n- Nice work\n"
+    with open(os.path.join(lab1, "submission_report.pdf"), "rb") as f:
+        assert f.read() == b"report"
+    assert os.path.exists(
+        os.path.join(
+            "courses", "Bio", "cv_assignments", "Lab 2", "assignment_result_score.txt"
+        )
+    )
+    assert sorted(
+        metadata.query("SELECT assignment_id, grade, score FROM submissions")
+    ) == [("11", "A", 9.5), ("12", None, None)]
+
+
+def test_unchanged_attachments_stay_in_the_search_index(fake_session, monkeypatch):
+    import downloader
+    from search_index import SearchIndex, set_search_index
+
+    attachment = {
+        "id": 77,
+        "display_name": "sheet.pdf",
+        "url": "https://files.example.edu/77",
+        "size": 5,
+        "updated_at": "2020-01-01T00:00:00Z",
+    }
+    monkeypatch.setitem(ASSIGNMENTS[0], "attachments", [attachment])
+    session = fake_session(_canvas)
+    lab1 = os.path.join("courses", "Bio", "cv_assignments", "Lab 1")
+    os.makedirs(lab1)
+    with open(os.path.join(lab1, "sheet.pdf"), "wb") as f:
+        f.write(b"sheet")
+    search_index = SearchIndex()
+    set_search_index(search_index)
+
+    downloader.download_assignments_and_submissions(
+        CanvasAPIClient("token", "canvas.example.edu"), 5, "Bio", incremental=True
+    )
+
+    # Not downloaded again, but found by search
+    assert "https://files.example.edu/77" not in [url for url, _ in session.requests]
+    hits = search_index.search("sheet")
+    search_index.close()
+    assert [(hit.kind, hit.canvas_id) for hit in hits] == [("file", "77")]
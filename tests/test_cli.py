@@ -0,0 +1,35 @@
+import pytest
+
+from cli import ARCHIVE_COMPRESSION_METHOD, build_parser
+
+
+@pytest.mark.parametrize("command", ["run", "watch", "retry"])
+def test_sync_options_are_accepted_after_the_command(command):
+    args = build_parser().parse_args(
+        [command, "--storage", "archive", "--workers", "3", "--only", "files"]
+    )
+    assert args.storage == "archive"
+    assert args.workers == 3
+    assert args.only == ["files"]
+
+
+def test_options_before_the_command_are_kept():
+    args = build_parser().parse_args(
+        ["--storage", "archive", "--no-search-index", "retry", "--profile"]
+    )
+    assert args.storage == "archive"
+    assert args.search_index is False
+    assert args.profile == "full"
+    assert args.compression == ARCHIVE_COMPRESSION_METHOD
+
+
+def test_options_without_a_command_run_the_downloader():
+    args = build_parser().parse_args(["--storage", "archive", "--full-crawl"])
+    assert args.command is None
+    assert args.storage == "archive"
+    assert args.full_crawl
+
+
+def test_other_commands_keep_their_own_options():
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(["search", "lab", "--storage", "archive"])
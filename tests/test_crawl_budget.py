@@ -0,0 +1,46 @@
+import time
+
+from crawl_budget import BudgetTracker, CrawlBudget
+
+
+def test_budgets_are_read_from_the_environment(monkeypatch):
+    monkeypatch.setenv("CRAWL_MAX_DEPTH", "3")
+    monkeypatch.setenv("CRAWL_MAX_PAGES", " 500 ")
+    monkeypatch.setenv("CRAWL_MAX_SECONDS", "1.5")
+    monkeypatch.setenv("CRAWL_MAX_BYTES", "")
+    assert CrawlBudget.from_env("CRAWL") == CrawlBudget(
+        max_depth=3, max_pages=500, max_seconds=1.5, max_bytes=None
+    )
+
+
+def test_malformed_values_leave_the_limit_unset(monkeypatch):
+    monkeypatch.setenv("GLOBAL_CRAWL_MAX_PAGES", "lots")
+    monkeypatch.setenv("GLOBAL_CRAWL_MAX_BYTES", "10MB")
+    monkeypatch.setenv("GLOBAL_CRAWL_MAX_DEPTH", "2.5")
+    monkeypatch.setenv("GLOBAL_CRAWL_MAX_SECONDS", "60")
+    assert CrawlBudget.from_env("GLOBAL_CRAWL") == CrawlBudget(max_seconds=60.0)
+
+
+def test_trackers_report_the_exhausted_limit():
+    tracker = BudgetTracker(CrawlBudget(max_pages=2, max_bytes=100, max_depth=1))
+    assert tracker.exhausted() is None
+    tracker.consume(pages=1, size=60)
+    assert tracker.exhausted() is None
+    tracker.consume(size=40)
+    assert tracker.exhausted() == "max_bytes"
+    assert tracker.allows_depth(1) and not tracker.allows_depth(2)
+
+    tracker = BudgetTracker(CrawlBudget(max_pages=1))
+    tracker.consume(pages=1)
+    assert tracker.exhausted() == "max_pages"
+
+    tracker = BudgetTracker(CrawlBudget(max_seconds=0.01))
+    time.sleep(0.02)
+    assert tracker.exhausted() == "max_seconds"
+
+
+def test_an_empty_budget_never_runs_out():
+    tracker = BudgetTracker()
+    tracker.consume(pages=10**6, size=10**12)
+    assert tracker.exhausted() is None
+    assert tracker.allows_depth(10**6)
@@ -0,0 +1,134 @@
+import heapq
+import os
+import random
+from types import SimpleNamespace
+
+from crawl_budget import CrawlBudget
+from crawler import CanvasCrawler, FrontierEntry
+from functions import html_save_path
+
+
+def test_frontier_pops_shallow_pages_first_then_priority_then_insertion_order():
+    entries = [
+        FrontierEntry(2, 0, 0, "depth 2"),
+        FrontierEntry(1, 1, 1, "depth 1, linked from a page"),
+        FrontierEntry(1, 0, 2, "depth 1, linked from the front page"),
+        FrontierEntry(0, 0, 3, "start"),
+        FrontierEntry(1, 1, 4, "depth 1, linked from a page, later"),
+        FrontierEntry(1, 0, 5, "depth 1, linked from the front page, later"),
+    ]
+    expected = [entries[i].url for i in (3, 2, 5, 1, 4, 0)]
+    random.Random(1).shuffle(entries)
+    heapq.heapify(entries)
+    assert [heapq.heappop(entries).url for _ in range(len(entries))] == expected
+
+
+def test_frontier_keys_keep_the_depth():
+    entry = FrontierEntry(7, 1, 2**40 - 1, "url")
+    assert entry.depth == 7
+    assert FrontierEntry(6, 1, 2**40 - 1, "url") < FrontierEntry(7, 0, 0, "url")
+
+
+COURSE = "https://canvas.example.edu/courses/1"
+
+
+def _page_url(slug: str) -> str:
+    return f"{COURSE}/pages/{slug}"
+
+
+# Serves the pages of course 1 by slug, with the attributes the crawler reads of the API models
+class FakeClient:
+    domain_url = "canvas.example.edu"
+    access_token = "token"
+
+    def __init__(self, pages: dict[str, str]):
+        self.pages = pages
+        self.fetched: list[str] = []
+
+    def get_course(self, course_id, with_syllabus=False):
+        return SimpleNamespace(
+            status_code=200, data=SimpleNamespace(name="Bio", syllabus_body=None)
+        )
+
+    def get_course_pages(self, course_id):
+        return []
+
+    def get_course_page(self, course_id, page_id):
+        self.fetched.append(page_id)
+        return SimpleNamespace(
+            status_code=200,
+            data=SimpleNamespace(
+                body=self.pages[page_id],
+                title=page_id,
+                updated_at="2024-01-01T00:00:00Z",
+            ),
+        )
+
+
+def _saved(slug: str) -> str:
+    return html_save_path(_page_url(slug), "Bio")
+
+
+def test_exact_copies_are_linked_and_different_pages_are_not():
+    lecture = "<p>" + " ".join(f"lecture word {i}" for i in range(200)) + "</p>"
+    client = FakeClient(
+        {
+            "a": f'<a href="{_page_url("b")}">b</a><a href="{_page_url("c")}">c</a>'
+            + lecture,
+            # The same page under another slug
+            "b": f'<a href="{_page_url("b")}">b</a><a href="{_page_url("c")}">c</a>'
+            + lecture,
+            "c": "<p>" + " ".join(f"lab step {i}" for i in range(200)) + "</p>",
+        }
+    )
+    CanvasCrawler(client).crawl([_page_url("a")])
+
+    # b was linked to the saved copy of a, not parsed and written again
+    assert os.path.samefile(_saved("a"), _saved("b"))
+    assert not os.path.samefile(_saved("a"), _saved("c"))
+    with open(os.path.join("courses", "Bio", "duplicate_pages.txt")) as f:
+        report = f.read()
+    assert report.count("Cluster") == 1
+    assert _page_url("b") in report and _page_url("c") not in report
+
+
+# Pages a, b, c and d of about 1 KB, each linking to the next one
+def _chain() -> FakeClient:
+    slugs = ["a", "b", "c", "d"]
+    return FakeClient(
+        {
+            slug: f'<a href="{_page_url(next_slug)}">next</a><p>{"x" * 1000}</p>'
+            for slug, next_slug in zip(slugs, slugs[1:] + ["a"])
+        }
+    )
+
+
+def _skipped() -> str:
+    with open(os.path.join("courses", "Bio", "crawl_skipped.txt")) as f:
+        return f.read()
+
+
+def test_a_course_crawl_stops_at_the_page_budget():
+    client = _chain()
+    CanvasCrawler(client, course_budget=CrawlBudget(max_pages=2)).crawl(
+        [_page_url("a")]
+    )
+    assert client.fetched == ["a", "b"]
+    assert _skipped() == f"max_pages\tdepth 2\t{_page_url('c')}\n"
+
+
+def test_a_course_crawl_stops_at_the_byte_budget():
+    client = _chain()
+    CanvasCrawler(client, course_budget=CrawlBudget(max_bytes=1500)).crawl(
+        [_page_url("a")]
+    )
+    assert client.fetched == ["a", "b"]
+    assert _skipped().startswith("max_bytes\t")
+
+
+def test_the_budget_of_each_course_starts_over():
+    client = _chain()
+    crawler = CanvasCrawler(client, course_budget=CrawlBudget(max_pages=1))
+    crawler.crawl([_page_url("a")])
+    crawler.crawl([_page_url("c")])
+    assert client.fetched == ["a", "c"]
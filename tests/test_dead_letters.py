@@ -0,0 +1,90 @@
+import os
+import sqlite3
+
+from conftest import FakeResponse
+from dead_letters import DeadLetterQueue
+
+
+def test_failures_record_their_account(workdir):
+    queue = DeadLetterQueue(str(workdir / "dead_letters.sqlite"))
+    queue.add(
+        "file", "https://canvas/files/1", 500, "courses/Bio/a.pdf", 1, account="bob"
+    )
+    # A later failure without a known account keeps the recorded one
+    queue.add("file", "https://canvas/files/1", 502, "courses/Bio/a.pdf", 1)
+
+    (entry,) = queue.entries()
+    assert (entry.account, entry.status, entry.attempts) == ("bob", "502", 2)
+    queue.close()
+
+
+def test_queues_without_accounts_are_migrated(workdir):
+    path = str(workdir / "dead_letters.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE failures (key TEXT PRIMARY KEY, kind TEXT NOT NULL, url TEXT NOT NULL, "
+        "file_id TEXT, course_id TEXT, course_name TEXT, save_path TEXT, status TEXT, "
+        "attempts INTEGER NOT NULL, first_failed REAL NOT NULL, last_failed REAL NOT NULL, "
+        "next_attempt REAL NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO failures VALUES ('https://canvas/p', 'page', 'https://canvas/p', "
+        "NULL, '5', 'Bio', NULL, '500', 1, 0, 0, 0)"
+    )
+    conn.commit()
+    conn.close()
+
+    queue = DeadLetterQueue(path)
+    (entry,) = queue.entries()
+    assert (entry.kind, entry.course_name, entry.account) == ("page", "Bio", None)
+    queue.close()
+
+
+def test_failed_downloads_are_queued_and_recovered_by_retry(
+    fake_session, monkeypatch, capsys
+):
+    import downloader
+    from accounts import Account, set_accounts
+    from cli import build_parser
+    from dead_letters import set_dead_letters
+    from functions import download_file
+
+    save_path = os.path.join("courses", "Bio", "a.pdf")
+    os.makedirs(os.path.dirname(save_path))
+    set_accounts([Account("alice", "tok-alice"), Account("bob", "tok-bob")])
+    fake_session(lambda url, headers: FakeResponse(url, 500))
+    queue = DeadLetterQueue()
+    set_dead_letters(queue)
+
+    # An empty queue must still take its first failure
+    assert not download_file(("https://files.example.edu/1", save_path), "tok-bob", 1)
+    (entry,) = queue.entries()
+    assert (entry.kind, entry.save_path, entry.status, entry.account) == (
+        "file",
+        save_path,
+        "500",
+        "bob",
+    )
+    queue.close()
+    set_dead_letters(None)
+
+    # Only bob can read the file
+    session = fake_session(
+        lambda url, headers: FakeResponse(
+            url, 200 if headers["Authorization"] == "Bearer tok-bob" else 403, b"data"
+        )
+    )
+    monkeypatch.setattr(
+        downloader, "CANVAS_ACCESS_TOKENS", "alice:tok-alice,bob:tok-bob"
+    )
+    monkeypatch.setattr(downloader, "CANVAS_DOMAIN", "canvas.example.edu")
+    args = build_parser().parse_args(["retry", "--now", "--all", "--workers", "2"])
+    args.func(args)
+
+    assert "Recovered 1 of 1 failures, 0 left" in capsys.readouterr().out
+    assert [headers["Authorization"] for _, headers in session.requests] == [
+        "Bearer tok-bob"
+    ]
+    with open(save_path, "rb") as f:
+        assert f.read() == b"data"
+    assert DeadLetterQueue().entries() == []
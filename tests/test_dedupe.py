@@ -0,0 +1,80 @@
+import random
+
+from dedupe import (
+    _BAND_BITS,
+    _BANDS,
+    NEAR_DUPLICATE_DISTANCE,
+    PageFingerprint,
+    PageFingerprints,
+    hamming_distance,
+    simhash,
+)
+
+
+def _flip(value: int, bits: list[int]) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def _fingerprint(url: str, value: int, body_hash=None) -> PageFingerprint:
+    return PageFingerprint(url, body_hash or url, value)
+
+
+def test_bands_find_every_near_duplicate_at_the_threshold():
+    rng = random.Random(7)
+    for _ in range(500):
+        base = rng.getrandbits(64)
+        bits = rng.sample(range(64), rng.randint(1, NEAR_DUPLICATE_DISTANCE))
+        fingerprints = PageFingerprints()
+        fingerprints.add(_fingerprint("a", base))
+        fingerprints.add(_fingerprint("b", _flip(base, bits)))
+        assert [[f.url for f in c] for c in fingerprints.clusters()] == [["a", "b"]]
+
+
+def test_pages_beyond_the_threshold_are_not_grouped():
+    rng = random.Random(7)
+    for _ in range(500):
+        base = rng.getrandbits(64)
+        # One bit in every band, so the pages share no band either
+        bits = [band * _BAND_BITS + rng.randrange(_BAND_BITS) for band in range(_BANDS)]
+        bits += rng.sample(
+            [bit for bit in range(64) if bit not in bits], rng.randint(0, 4)
+        )
+        fingerprints = PageFingerprints()
+        fingerprints.add(_fingerprint("a", base))
+        fingerprints.add(_fingerprint("b", _flip(base, bits)))
+        assert fingerprints.clusters() == []
+        # Sharing three bands isn't enough beyond the threshold
+        fingerprints.add(
+            _fingerprint(
+                "c",
+                _flip(base, rng.sample(range(_BAND_BITS), NEAR_DUPLICATE_DISTANCE + 1)),
+            )
+        )
+        assert fingerprints.clusters() == []
+
+
+def test_near_duplicate_pages_have_close_simhashes():
+    words = " ".join(f"photosynthesis step {i} uses light" for i in range(100))
+    edited = words.replace("step 50 uses", "step 50 needs")
+    other = " ".join(f"titration sample {i} turns pink" for i in range(100))
+    assert hamming_distance(simhash(words), simhash(edited)) <= NEAR_DUPLICATE_DISTANCE
+    assert hamming_distance(simhash(words), simhash(other)) > NEAR_DUPLICATE_DISTANCE
+
+    fingerprints = PageFingerprints()
+    for url, text in (("a", words), ("b", edited), ("c", other)):
+        fingerprints.add(_fingerprint(url, simhash(text)))
+    assert [[f.url for f in c] for c in fingerprints.clusters()] == [["a", "b"]]
+
+
+def test_exact_copies_are_counted_and_reported():
+    fingerprints = PageFingerprints()
+    fingerprints.add(_fingerprint("a", 1, "same"))
+    fingerprints.add(_fingerprint("b", 1, "same"))
+    fingerprints.add(_fingerprint("c", 3, "other"))
+    assert fingerprints.find_exact("same").url == "a"
+    assert fingerprints.exact_duplicates == 1
+    assert fingerprints.report() == (
+        "Cluster 1 (3 pages)\n  exact\ta\n  exact\tb\n  distance 1\tc\n"
+    )
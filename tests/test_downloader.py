@@ -0,0 +1,85 @@
+import os
+
+import downloader
+from accounts import CoursePlan
+from conftest import FakeResponse
+from file_index import FileIndexCache
+from filters import SyncFilter
+
+
+class FakeCrawler:
+    def __init__(self):
+        self.file_indexes = FileIndexCache(None, persist_dir=None)
+
+    def forget_course(self, course_id):
+        pass
+
+
+def test_courses_with_a_failed_phase_are_reported(monkeypatch):
+    def download_all_files(client, course_id, *args):
+        if course_id == 1:
+            raise RuntimeError("listing failed")
+
+    monkeypatch.setattr(downloader, "download_all_files", download_all_files)
+    failed = downloader.download_content_from_course(
+        client=None,
+        crawler=FakeCrawler(),
+        sync_filter=SyncFilter(content_types={"files"}),
+        plan=CoursePlan([{"id": 1, "name": "Bio"}, {"id": 2, "name": "Chem"}], []),
+    )
+    assert failed == {1}
+
+
+class FakeClient:
+    class hedger:
+        @staticmethod
+        def close():
+            pass
+
+
+# Reports every course as changed, the third poll stops the daemon
+class FakeWatcher:
+    def __init__(self, client, state_path):
+        self.polls = 0
+
+    def changed_courses(self, courses):
+        self.polls += 1
+        if self.polls > 2:
+            raise KeyboardInterrupt
+        return [(course, {}) for course in courses]
+
+    def mark_synced(self, course, signals):
+        pass
+
+
+def test_watch_downloads_a_file_again_when_it_changed(monkeypatch, fake_session):
+    import cli
+    from functions import download_file
+
+    bodies = iter([b"first", b"second"])
+    fake_session(lambda url, headers: FakeResponse(url, 200, next(bodies)))
+    save_path = os.path.join("courses", "Bio", "a.pdf")
+
+    def download_content_from_course(**kwargs):
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        download_file(("https://x/a", save_path), "t")
+        return set()
+
+    monkeypatch.setattr(downloader.signal, "signal", lambda *args: None)
+    monkeypatch.setattr(
+        downloader, "configure_transfers", lambda args, workers: {"main": FakeClient}
+    )
+    monkeypatch.setattr(
+        downloader, "list_courses", lambda *args: [{"id": 1, "name": "Bio"}]
+    )
+    monkeypatch.setattr(downloader, "ChangeWatcher", FakeWatcher)
+    monkeypatch.setattr(
+        downloader, "download_content_from_course", download_content_from_course
+    )
+    args = cli.build_parser().parse_args(
+        ["watch", "--workers", "1", "--min-interval", "0", "--max-interval", "0"]
+    )
+    args.func(args)
+
+    with open(save_path, "rb") as f:
+        assert f.read() == b"second"
@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from api import CanvasAPIClient
+from conftest import FakeResponse
+from events import AssignmentEvent, ContentStream, CourseEvent
+from filters import SyncFilter
+
+API = "https://canvas.example.edu/api/v1"
+
+
+def _canvas(url, headers):
+    if url == f"{API}/courses/5/assignments/?page=1":
+        return FakeResponse(
+            url, 200, json.dumps([{"id": 11, "name": "Lab 1"}]).encode()
+        )
+    if url == f"{API}/courses/5/assignments/?page=2":
+        return FakeResponse(url, 200, b"[]")
+    if url.startswith(f"{API}/courses/5/assignments/11/submissions/self"):
+        return FakeResponse(url, 200, json.dumps({"grade": "B"}).encode())
+    return FakeResponse(url, 404)
+
+
+def _stream() -> ContentStream:
+    client = CanvasAPIClient("token", "canvas.example.edu")
+    return ContentStream(client, sync_filter=SyncFilter(content_types={"assignments"}))
+
+
+def _check(events):
+    assert [type(event) for event in events] == [CourseEvent, AssignmentEvent]
+    assert events[1].assignment["name"] == "Lab 1"
+    assert events[1].submission == {"grade": "B"}
+
+
+def test_stream_yields_assignments_with_submissions(fake_session):
+    fake_session(_canvas)
+    _check(list(_stream().events([{"id": 5, "name": "Bio"}])))
+
+
+def test_async_stream_yields_assignments_with_submissions(fake_session):
+    fake_session(_canvas)
+
+    async def collect():
+        return [event async for event in _stream().aevents([{"id": 5, "name": "Bio"}])]
+
+    _check(asyncio.run(collect()))
@@ -0,0 +1,55 @@
+import json
+import threading
+import time
+
+from file_index import CourseFileIndex
+
+LISTING = [
+    {"id": 1, "display_name": "a.pdf", "size": 3, "url": "https://signed/1?sig=old"},
+    {"id": 2, "display_name": "b.pdf", "size": 4, "url": "https://signed/2?sig=old"},
+]
+
+
+class FakeClient:
+    def __init__(self, listing):
+        self.listing = listing
+        self.calls: list = []
+
+    def get_course_files(self, course_id, file_id=None):
+        self.calls.append(file_id)
+        if file_id is None:
+            time.sleep(0.05)
+            return self.listing
+        return [{"id": int(file_id), "url": f"https://signed/{file_id}?sig=new"}]
+
+
+def test_concurrent_lookups_wait_for_the_listing():
+    client = FakeClient(LISTING)
+    index = CourseFileIndex(client, 10)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(index.get(2))) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.calls == [None]
+    assert [file["url"] for file in results] == ["https://signed/2?sig=old"] * 8
+
+
+def test_persisted_listing_has_no_urls_and_is_refreshed(workdir):
+    CourseFileIndex(FakeClient(LISTING), 10, str(workdir)).load()
+    with open(workdir / "10.json", encoding="utf-8") as f:
+        assert all("url" not in file for file in json.load(f))
+
+    # The listing is unavailable in the next run
+    client = FakeClient([])
+    index = CourseFileIndex(client, 10, str(workdir))
+    assert index.get(1)["url"] == "https://signed/1?sig=new"
+    assert sorted(file["url"] for file in index.files()) == [
+        "https://signed/1?sig=new",
+        "https://signed/2?sig=new",
+    ]
+    assert client.calls == [None, "1", "2"]
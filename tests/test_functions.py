@@ -0,0 +1,13 @@
+from conftest import FakeResponse
+from functions import get_page_content
+
+
+def test_page_content_is_returned_for_200(fake_session):
+    fake_session(lambda url, headers: FakeResponse(url, 200, b"<p>Hi</p>"))
+    assert get_page_content("https://x/pages/1", "t") == "<p>Hi</p>"
+
+
+def test_failed_page_fetches_return_nothing(fake_session):
+    session = fake_session(lambda url, headers: FakeResponse(url, 404, b"missing"))
+    assert get_page_content("https://x/pages/1", "t") == ""
+    assert session.requests == [("https://x/pages/1", {"Authorization": "Bearer t"})]
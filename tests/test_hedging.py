@@ -0,0 +1,75 @@
+import threading
+import time
+
+from conftest import FakeResponse, FakeSession
+from hedging import MIN_SAMPLES, HedgedGetter, LatencyTracker
+
+
+class ClosingResponse(FakeResponse):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _warm(getter: HedgedGetter, seconds: float = 0.01):
+    for _ in range(MIN_SAMPLES):
+        getter.latencies.add(seconds)
+
+
+def test_percentiles_need_enough_samples():
+    tracker = LatencyTracker()
+    for sample in range(MIN_SAMPLES - 1):
+        tracker.add(sample)
+    assert tracker.percentile(90) is None
+    tracker.add(MIN_SAMPLES - 1)
+    assert tracker.percentile(90) == 18
+    assert tracker.percentile(50) == 10
+
+
+def test_a_slow_request_is_hedged_and_the_duplicate_wins():
+    release = threading.Event()
+    responses = []
+
+    def handler(url, headers):
+        response = ClosingResponse(url, 200, b"body")
+        responses.append(response)
+        if len(responses) == 1:
+            # The primary hangs until the hedge has answered
+            release.wait(5)
+        return response
+
+    getter = HedgedGetter()
+    _warm(getter)
+    response = getter.get(FakeSession(handler), "https://x/a", 90)
+    release.set()
+    getter.close()
+
+    assert response is responses[1]
+    assert getter.hedged == 1
+    assert getter.hedge_wins == 1
+    # The losing primary is closed once it arrives
+    for _ in range(100):
+        if responses[0].closed:
+            break
+        time.sleep(0.01)
+    assert responses[0].closed
+
+
+def test_fast_requests_are_not_hedged():
+    session = FakeSession(lambda url, headers: FakeResponse(url, 200, b"body"))
+    getter = HedgedGetter()
+    _warm(getter, 1.0)
+    assert getter.get(session, "https://x/a", 90).content == b"body"
+    getter.close()
+    assert getter.hedged == 0
+    assert len(session.requests) == 1
+
+
+def test_hedging_is_off_without_a_percentile():
+    session = FakeSession(lambda url, headers: FakeResponse(url, 200, b"body"))
+    getter = HedgedGetter()
+    _warm(getter, 0.0)
+    getter.get(session, "https://x/a")
+    assert getter.hedged == 0
+    assert len(session.requests) == 1
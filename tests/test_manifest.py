@@ -0,0 +1,56 @@
+import os
+import threading
+
+from conftest import FakeResponse
+from functions import download_file
+from manifest import DownloadManifest, set_manifest
+
+
+def test_a_second_download_of_a_path_waits_for_the_first(fake_session):
+    set_manifest(DownloadManifest())
+    os.makedirs("courses")
+    save_path = os.path.join("courses", "a.pdf")
+    started = threading.Event()
+    proceed = threading.Event()
+
+    def handler(url, headers):
+        started.set()
+        proceed.wait(5)
+        return FakeResponse(url, 200, b"content")
+
+    session = fake_session(handler)
+    results = []
+    owner = threading.Thread(
+        target=lambda: results.append(download_file(("https://x/a", save_path), "t"))
+    )
+    owner.start()
+    assert started.wait(5)
+
+    def check_after_wait():
+        saved = download_file(("https://x/a", save_path), "t")
+        # Only reported once the owner saved the file
+        results.append((saved, os.path.exists(save_path)))
+
+    waiter = threading.Thread(target=check_after_wait)
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+
+    proceed.set()
+    owner.join(5)
+    waiter.join(5)
+    assert sorted(results, key=str) == [(True, True), True]
+    assert len(session.requests) == 1
+
+
+def test_waiters_of_a_failed_download_are_told_it_failed():
+    manifest = DownloadManifest()
+    assert manifest.claim("a.pdf")
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(manifest.wait("a.pdf")))
+    waiter.start()
+    manifest.release("a.pdf")
+    waiter.join(5)
+    assert results == [False]
+    # Released paths can be claimed again
+    assert manifest.claim("a.pdf")
@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+import metadata
+from metadata import METADATA_NAME, MetadataStore
+
+FILE = {
+    "id": 7,
+    "display_name": "notes.pdf",
+    "size": 10,
+    "content-type": "application/pdf",
+    "url": "https://canvas.example.edu/files/7/download?download_frd=1&verifier=secret",
+    "thumbnail_url": "https://inst.example.com/thumbnails/7/abc?sig=secret",
+    "updated_at": "2024-01-01T00:00:00Z",
+}
+
+
+@pytest.fixture
+def store():
+    store = MetadataStore()
+    yield store
+    store.close()
+
+
+def test_signed_file_urls_are_not_stored(store):
+    course = store.open(5, "Bio")
+    course.record_file(FILE, "courses/Bio/notes.pdf")
+    course.record_submission(
+        11,
+        {"grade": "A", "attachments": [FILE]},
+        "alice",
+        "courses/Bio/result.txt",
+    )
+
+    ((url, data),) = course.query("SELECT url, data FROM files")
+    ((submission,),) = course.query("SELECT data FROM submissions")
+    assert url == "https://canvas.example.edu/files/7/download"
+    assert json.loads(data)["thumbnail_url"] == (
+        "https://inst.example.com/thumbnails/7/abc"
+    )
+    assert json.loads(submission)["attachments"][0]["url"] == url
+    assert "secret" not in data + submission
+    # The caller's object is left alone
+    assert "verifier=secret" in FILE["url"]
+
+
+def test_records_replace_earlier_ones_and_are_batched(store, monkeypatch):
+    monkeypatch.setattr(metadata, "BATCH_SIZE", 2)
+    course = store.open(5, "Bio")
+    path = os.path.join("courses", "Bio", METADATA_NAME)
+    course.record_assignment({"id": 11, "name": "Lab", "points_possible": 10})
+    course.record_assignment({"id": 11, "name": "Lab 1", "points_possible": 10})
+    # The second row filled the batch, it is written without a commit
+    with metadata.sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT id, name FROM assignments").fetchall() == [
+            ("11", "Lab 1")
+        ]
+
+
+def test_courses_are_closed_by_their_last_user(store):
+    first = store.open(5, "Bio")
+    assert store.open("5", "Bio") is first
+    first.record_page("https://x/pages/a", "pages", "A", None, None)
+
+    store.release(5)
+    assert store.get(5) is first
+    store.release(5)
+    assert store.get(5) is None
+
+    reopened = store.open(5, "Bio")
+    assert reopened is not first
+    assert reopened.query("SELECT url, title FROM pages") == [
+        ("https://x/pages/a", "A")
+    ]
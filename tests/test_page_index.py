@@ -0,0 +1,18 @@
+import os
+
+from page_index import PageIndex
+
+
+def test_changed_files_are_not_reported_as_downloaded(workdir):
+    index = PageIndex(str(workdir / "page_index.sqlite"))
+    save_path = os.path.join("courses", "Bio", "cv_files", "notes.pdf")
+    os.makedirs(os.path.dirname(save_path))
+    with open(save_path, "wb") as f:
+        f.write(b"12345")
+    index.put_file(1, 7, save_path)
+
+    file = {"id": 7, "size": 5, "updated_at": "2020-01-01T00:00:00Z"}
+    assert index.get_file(1, 7, file) == save_path
+    assert index.get_file(1, 7, {**file, "size": 6}) is None
+    assert index.get_file(1, 7, {**file, "updated_at": "2999-01-01T00:00:00Z"}) is None
+    index.close()
@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import downloader
+from accounts import CoursePlan
+from filters import SyncFilter
+from profiling import PhaseProfiler
+from test_downloader import FakeCrawler
+
+PHASES = ("download_all_files", "download_files_from_modules")
+
+
+def _busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _sync(monkeypatch, profiler: PhaseProfiler):
+    for phase in PHASES:
+        monkeypatch.setattr(downloader, phase, lambda *args: _busy(0.02))
+    downloader.download_content_from_course(
+        client=None,
+        crawler=FakeCrawler(),
+        profiler=profiler,
+        sync_filter=SyncFilter(content_types={"files", "modules"}),
+        plan=CoursePlan([{"id": 1, "name": "Bio"}, {"id": 2, "name": "Chem"}], []),
+    )
+    profiler.close()
+
+
+def test_full_profiles_write_a_report_per_phase(monkeypatch, workdir):
+    output_dir = str(workdir / "profile")
+    _sync(monkeypatch, PhaseProfiler("full", output_dir))
+
+    for course in ("Bio", "Chem"):
+        files = set(os.listdir(os.path.join(output_dir, course)))
+        assert files == {
+            f"{phase}.{suffix}" for phase in PHASES for suffix in ("prof", "alloc.txt")
+        } | {"course.prof", "course.alloc.txt"}
+    assert {f"{phase}.prof" for phase in PHASES} <= set(os.listdir(output_dir))
+    with open(os.path.join(output_dir, "summary.txt")) as f:
+        summary = f.read()
+    for phase in PHASES:
+        assert f"  {phase}: " in summary
+        assert f"Top 25 functions in {phase}" in summary
+    assert not tracemalloc.is_tracing()
+
+
+def test_sampled_profiles_attribute_samples_to_phases(monkeypatch, workdir):
+    output_dir = str(workdir / "profile")
+    profiler = PhaseProfiler("sample", output_dir, interval=0.001)
+    # The sampler skips its own thread only, the phases run on this one
+    _sync(monkeypatch, profiler)
+
+    with open(os.path.join(output_dir, "samples.folded")) as f:
+        stacks = [line.rsplit(" ", 1)[0] for line in f]
+    busy = f"_busy (test_profiling.py:{_busy.__code__.co_firstlineno})"
+    assert any(
+        stack.startswith("download_all_files;") and stack.endswith(busy)
+        for stack in stacks
+    )
+    with open(os.path.join(output_dir, "summary.txt")) as f:
+        assert "Top 25 sampled functions" in f.read()
+
+
+def test_disabled_profiling_is_a_no_op(workdir):
+    profiler = PhaseProfiler(None, str(workdir / "profile"))
+    threads = threading.active_count()
+    with profiler.course("Bio"), profiler.phase("download_all_files", "Bio"):
+        # No profiler hook, no allocation tracing and no sampler thread
+        assert sys.getprofile() is None
+        assert not tracemalloc.is_tracing()
+        assert threading.active_count() == threads
+    profiler.close()
+    assert not os.path.exists(workdir / "profile")
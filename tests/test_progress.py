@@ -0,0 +1,66 @@
+import json
+import threading
+
+from progress import ProgressReporter, ProgressTracker
+
+
+def test_concurrent_accounts_count_their_own_course():
+    tracker = ProgressTracker()
+    tracker.add_courses(2)
+    started = threading.Barrier(2)
+
+    def account(course_name: str, files: int):
+        tracker.start_course(course_name)
+        tracker.add_files(files)
+        started.wait()
+        course = tracker.current_course()
+        workers = [
+            threading.Thread(
+                target=tracker.in_course, args=(course, tracker.file_done, 10)
+            )
+            for _ in range(files)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        started.wait()
+
+    threads = [
+        threading.Thread(target=account, args=("Bio", 3)),
+        threading.Thread(target=account, args=("Chem", 5)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    courses = {course["name"]: course for course in tracker.snapshot()["courses"]}
+    assert courses["Bio"] == {
+        "name": "Bio",
+        "files_done": 3,
+        "files_total": 3,
+        "bytes": 30,
+    }
+    assert courses["Chem"] == {
+        "name": "Chem",
+        "files_done": 5,
+        "files_total": 5,
+        "bytes": 50,
+    }
+    assert tracker.snapshot()["files_done"] == 8
+
+
+def test_json_progress_goes_to_stderr(capsys):
+    tracker = ProgressTracker()
+    tracker.add_files(2)
+    tracker.file_done(10)
+    reporter = ProgressReporter(tracker, "json", interval=60)
+    reporter.start()
+    reporter.stop()
+
+    out, err = capsys.readouterr()
+    assert out == ""
+    (line,) = err.splitlines()
+    status = json.loads(line)
+    assert (status["files_done"], status["files_total"]) == (1, 2)
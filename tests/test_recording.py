@@ -0,0 +1,107 @@
+import base64
+import gzip
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import segments
+from functions import download_file
+from recording import RecordingSession, ReplaySession
+from transport import TransferSettings, set_session, set_transfer_settings
+
+BODY = bytes(range(256)) * 4096
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        requested = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if requested:
+            start, end = map(int, requested.groups())
+            body = BODY[start : end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(BODY)}")
+        else:
+            body = BODY
+            self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _records(path) -> list[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_streamed_bodies_are_teed_not_loaded(workdir, server_url):
+    cassette = workdir / "run.cassette.gz"
+    session = RecordingSession(str(cassette), max_body_bytes=1000)
+    with session.get(f"{server_url}/files/1", stream=True) as response:
+        received = b"".join(response.iter_content(64 * 1024))
+        # The body was never read into the response
+        assert response._content is False
+    session.get(f"{server_url}/api/v1/courses")
+    session.close()
+
+    assert received == BODY
+    streamed, plain = _records(cassette)
+    assert base64.b64decode(streamed["body"]) == BODY[:1000]
+    assert streamed["size"] == len(BODY)
+    assert base64.b64decode(plain["body"]) == BODY[:1000]
+
+
+def test_streams_closed_early_are_recorded_once(workdir, server_url):
+    cassette = workdir / "run.cassette.gz"
+    session = RecordingSession(str(cassette))
+    with session.get(f"{server_url}/files/1", stream=True) as response:
+        next(response.iter_content(10))
+    session.close()
+
+    (record,) = _records(cassette)
+    assert base64.b64decode(record["body"]) == BODY[:10]
+
+
+def test_segmented_downloads_are_replayed_by_range(workdir, server_url, monkeypatch):
+    monkeypatch.setattr(segments, "MIN_SEGMENT_SIZE", 64 * 1024)
+    set_transfer_settings(
+        TransferSettings(segment_threshold=len(BODY), segments=4, retries=0)
+    )
+    cassette = str(workdir / "run.cassette.gz")
+    os.makedirs("courses")
+    save_path = os.path.join("courses", "a.bin")
+
+    session = RecordingSession(cassette)
+    set_session(session)
+    assert download_file((f"{server_url}/files/1", save_path), "t")
+    session.close()
+    # The first request and one per segment
+    first, *ranges = _records(cassette)
+    assert len(ranges) == 4
+    # The segments finish in any order, replaying must not depend on it
+    with gzip.open(cassette, "wt", encoding="utf-8") as f:
+        for record in [first, *reversed(ranges)]:
+            f.write(json.dumps(record) + "\n")
+
+    os.remove(save_path)
+    set_session(ReplaySession(cassette, latency_scale=0))
+    assert download_file((f"{server_url}/files/1", save_path), "t")
+    with open(save_path, "rb") as f:
+        assert f.read() == BODY
@@ -0,0 +1,82 @@
+import pytest
+
+from search_index import SearchIndex, html_to_text
+
+
+@pytest.fixture
+def search_index():
+    search_index = SearchIndex()
+    search_index.index_html(
+        1,
+        "Biology 101",
+        "page",
+        "photosynthesis",
+        "Photosynthesis",
+        "<h1>Light reactions</h1><script>var lab = 1;</script><p>Chlorophyll absorbs light</p>",
+        "courses/Biology 101/cv_pages/photosynthesis.html",
+    )
+    search_index.index_document(
+        1, "Biology 101", "assignment", 11, "Lab report", "Measure the leaf area"
+    )
+    search_index.index_document(
+        2, "Chemistry", "assignment", 21, "Lab safety", "Wear goggles in the lab"
+    )
+    yield search_index
+    search_index.close()
+
+
+def test_html_is_reduced_to_its_visible_text():
+    assert html_to_text("<p>A&amp;B</p><style>p {}</style>\n<b>bold</b>") == "A&B bold"
+
+
+def test_plain_queries_match_all_their_words(search_index):
+    hits = search_index.search("light chlorophyll")
+    assert [(hit.course_name, hit.canvas_id) for hit in hits] == [
+        ("Biology 101", "photosynthesis")
+    ]
+    assert "[Chlorophyll]" in hits[0].snippet
+    assert hits[0].path == "courses/Biology 101/cv_pages/photosynthesis.html"
+    # Script contents are not indexed
+    assert search_index.search("var") == []
+
+
+def test_titles_rank_above_bodies(search_index):
+    search_index.index_document(
+        1, "Biology 101", "page", "safety", "Safety", "Read this before the lab"
+    )
+    hits = search_index.search("lab")
+    # Title and body, title only, body only
+    assert [hit.title for hit in hits] == ["Lab safety", "Lab report", "Safety"]
+
+
+def test_results_can_be_limited_to_a_course(search_index):
+    by_name = search_index.search("lab", course="Chemistry")
+    by_id = search_index.search("lab", course="1")
+    assert [hit.canvas_id for hit in by_name] == ["21"]
+    assert [hit.canvas_id for hit in by_id] == ["11"]
+
+
+def test_raw_queries_use_fts_syntax(search_index):
+    hits = search_index.search("goggle* OR leaf", raw=True)
+    assert sorted(hit.canvas_id for hit in hits) == ["11", "21"]
+    # Quoted, the operators are plain words
+    assert search_index.search("goggle* OR leaf") == []
+
+
+def test_unchanged_documents_are_not_rewritten(search_index):
+    assert not search_index.index_document(
+        2, "Chemistry", "assignment", 21, "Lab safety", "Wear goggles in the lab"
+    )
+    assert search_index.index_document(
+        2, "Chemistry", "assignment", 21, "Lab safety", "Wear a lab coat"
+    )
+    assert search_index.search("goggles") == []
+    assert [hit.canvas_id for hit in search_index.search("coat")] == ["21"]
+
+
+def test_diacritics_are_ignored():
+    search_index = SearchIndex()
+    search_index.index_document(3, "French", "page", 1, "Café", "Crème brûlée")
+    hits = search_index.search("creme brulee")
+    search_index.close()
+    assert [hit.title for hit in hits] == ["Café"]
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import re
+
+import pytest
+
+import segments
+from conftest import FakeResponse
+from transport import TransferSettings
+
+BODY = bytes(range(256)) * 8
+
+
+def _ranges(url, headers):
+    start, end = map(int, re.fullmatch(r"bytes=(\d+)-(\d+)", headers["Range"]).groups())
+    return FakeResponse(
+        url,
+        206,
+        BODY[start : end + 1],
+        {"Content-Range": f"bytes {start}-{end}/{len(BODY)}"},
+    )
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(segments, "MIN_SEGMENT_SIZE", 100)
+    return TransferSettings(segments=4, min_download_rate=0, retries=0)
+
+
+def test_short_writes_are_completed(fake_session, small_segments, monkeypatch):
+    fake_session(_ranges)
+    pwrite = os.pwrite
+    # The OS may write only part of a buffer
+    monkeypatch.setattr(
+        os, "pwrite", lambda fd, data, offset: pwrite(fd, data[:7], offset)
+    )
+
+    sha256 = segments.download_segmented(
+        "https://files/1", {}, "a.part", len(BODY), settings=small_segments
+    )
+
+    assert sha256 == hashlib.sha256(BODY).hexdigest()
+    with open("a.part", "rb") as f:
+        assert f.read() == BODY
+
+
+def test_missing_bytes_fail_despite_the_preallocated_size(
+    fake_session, small_segments, monkeypatch
+):
+    fake_session(_ranges)
+    # A segment that stops early without an error, e.g. after an abort
+    monkeypatch.setattr(
+        segments,
+        "_fetch_segment",
+        lambda url, headers, fd, start, end, settings, abort: end - start,
+    )
+
+    with pytest.raises(segments.SegmentValidationError):
+        segments.download_segmented(
+            "https://files/1", {}, "a.part", len(BODY), settings=small_segments
+        )
+    assert os.path.getsize("a.part") == len(BODY)
@@ -0,0 +1,129 @@
+import os
+import zipfile
+
+from storage import (
+    ArchiveStorage,
+    archive_paths,
+    iter_archive,
+    load_archive_index,
+    read_archive_member,
+)
+
+
+def _sync(root):
+    storage = ArchiveStorage(root)
+    storage.write_text(os.path.join(root, "Bio", "external_links.txt"), "links")
+    storage.write_text(os.path.join(root, "Bio", "Week 1", "P2.txt"), "page two")
+    storage.close()
+
+
+def test_unchanged_content_is_not_archived_again(workdir):
+    root = str(workdir / "courses")
+    for _ in range(3):
+        _sync(root)
+
+    archive_path, index_path = archive_paths(root, "Bio")
+    with zipfile.ZipFile(archive_path) as archive:
+        assert sorted(archive.namelist()) == ["Week 1/P2.txt", "external_links.txt"]
+    with open(index_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_replaced_members_are_compacted_on_close(workdir):
+    root = str(workdir / "courses")
+    save_path = os.path.join(root, "Bio", "assignment_description.txt")
+    for version in range(3):
+        storage = ArchiveStorage(root)
+        storage.write_text(save_path, f"version {version}")
+        storage.close()
+
+    archive_path, _ = archive_paths(root, "Bio")
+    with zipfile.ZipFile(archive_path) as archive:
+        assert archive.namelist() == ["assignment_description.txt"]
+        assert archive.read("assignment_description.txt") == b"version 2"
+    assert dict(iter_archive(root, "Bio")) == {
+        "assignment_description.txt": b"version 2"
+    }
+
+
+def test_archive_is_recovered_after_a_crash(workdir):
+    root = str(workdir / "courses")
+    storage = ArchiveStorage(root)
+    storage.write_text(os.path.join(root, "Bio", "a.txt"), "first")
+    storage.write_text(os.path.join(root, "Bio", "b.txt"), "second")
+    # The run dies before the central directory is written
+    archive = storage._archives.pop("Bio")
+    archive.fp.close()
+    archive.fp = None
+    storage._indexes.pop("Bio").close()
+
+    archive_path, index_path = archive_paths(root, "Bio")
+    assert dict(iter_archive(root, "Bio")) == {"a.txt": b"first", "b.txt": b"second"}
+
+    storage = ArchiveStorage(root)
+    storage.write_text(os.path.join(root, "Bio", "b.txt"), "second")
+    storage.write_text(os.path.join(root, "Bio", "c.txt"), "third")
+    storage.close()
+
+    with zipfile.ZipFile(archive_path) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == ["a.txt", "b.txt", "c.txt"]
+    assert sorted(load_archive_index(index_path)) == ["a.txt", "b.txt", "c.txt"]
+    assert dict(iter_archive(root, "Bio")) == {
+        "a.txt": b"first",
+        "b.txt": b"second",
+        "c.txt": b"third",
+    }
+
+
+def test_linked_members_share_their_data_after_compaction(workdir):
+    root = str(workdir / "courses")
+    storage = ArchiveStorage(root, "stored")
+    source = os.path.join(root, "Bio", "a.txt")
+    storage.write_text(source, "old" * 1000)
+    storage.write_text(source, "shared")
+    assert storage.link(source, os.path.join(root, "Bio", "copy.txt"))
+    storage.close()
+
+    archive_path, index_path = archive_paths(root, "Bio")
+    with zipfile.ZipFile(archive_path) as archive:
+        assert archive.namelist() == ["a.txt"]
+    entries = load_archive_index(index_path)
+    assert entries["a.txt"]["header_offset"] == entries["copy.txt"]["header_offset"]
+    assert dict(iter_archive(root, "Bio"))["copy.txt"] == b"shared"
+
+
+def test_small_replacements_wait_for_the_compaction_threshold(workdir):
+    root = str(workdir / "courses")
+    storage = ArchiveStorage(root, "stored")
+    storage.write_text(os.path.join(root, "Bio", "big.txt"), "x" * 10000)
+    storage.write_text(os.path.join(root, "Bio", "page.txt"), "version 1")
+    storage.close()
+
+    storage = ArchiveStorage(root, "stored")
+    storage.write_text(os.path.join(root, "Bio", "page.txt"), "version 2")
+    storage.close()
+
+    archive_path, index_path = archive_paths(root, "Bio")
+    # The replaced page stays in the archive, the index points at the new one
+    with zipfile.ZipFile(archive_path) as archive:
+        assert archive.namelist() == ["big.txt", "page.txt", "page.txt"]
+    entry = load_archive_index(index_path)["page.txt"]
+    assert read_archive_member(archive_path, entry) == b"version 2"
+
+
+def test_unchanged_members_are_cut_off_the_archive(workdir):
+    root = str(workdir / "courses")
+    _sync(root)
+    archive_path, _ = archive_paths(root, "Bio")
+    size = os.path.getsize(archive_path)
+
+    storage = ArchiveStorage(root)
+    storage.write_text(os.path.join(root, "Bio", "Week 1", "P2.txt"), "page two")
+    # Written and cut off again before the archive is closed
+    assert os.path.getsize(archive_path) < size
+    storage.close()
+
+    assert os.path.getsize(archive_path) == size
+    with zipfile.ZipFile(archive_path) as archive:
+        assert archive.testzip() is None
@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+import requests
+
+from api import CanvasAPIClient
+from conftest import FakeResponse
+from functions import download_file
+from transport import (
+    StallError,
+    TransferSettings,
+    iter_content_with_watchdog,
+    set_transfer_settings,
+)
+
+
+# A body that arrives one byte every `delay` seconds
+class SlowResponse(FakeResponse):
+    def __init__(self, url: str, body: bytes, delay: float):
+        super().__init__(url, 200, body)
+        self.delay = delay
+
+    def iter_content(self, chunk_size: int = 1):
+        for byte in self.content:
+            time.sleep(self.delay)
+            yield bytes([byte])
+
+
+def test_a_slow_network_is_reported_as_a_stall():
+    settings = TransferSettings(min_download_rate=1000, stall_window=0.05)
+    response = SlowResponse("https://x/a", b"x" * 20, 0.02)
+    with pytest.raises(StallError):
+        list(iter_content_with_watchdog(response, settings=settings))
+
+
+def test_a_slow_consumer_is_not_a_stall():
+    settings = TransferSettings(min_download_rate=1000, stall_window=0.05)
+    response = FakeResponse("https://x/a", 200, b"x" * 10)
+    chunks = []
+    for chunk in iter_content_with_watchdog(response, 1, settings):
+        # E.g. blocked on a full write-behind queue
+        time.sleep(0.02)
+        chunks.append(chunk)
+    assert b"".join(chunks) == b"x" * 10
+
+
+def test_downloads_are_retried_after_a_timeout(fake_session):
+    set_transfer_settings(TransferSettings(retries=2))
+    calls = []
+
+    def handler(url, headers):
+        calls.append(url)
+        if len(calls) < 3:
+            raise requests.Timeout("read timed out")
+        return FakeResponse(url, 200, b"content")
+
+    fake_session(handler)
+    os.makedirs("courses")
+    save_path = os.path.join("courses", "a.pdf")
+    assert download_file(("https://x/a", save_path), "t")
+    assert len(calls) == 3
+    with open(save_path, "rb") as f:
+        assert f.read() == b"content"
+
+
+def test_stalled_downloads_are_retried_and_given_up(fake_session):
+    set_transfer_settings(
+        TransferSettings(retries=1, min_download_rate=1000, stall_window=0.05)
+    )
+    session = fake_session(lambda url, headers: SlowResponse(url, b"x" * 20, 0.02))
+    os.makedirs("courses")
+    save_path = os.path.join("courses", "a.pdf")
+    assert not download_file(("https://x/a", save_path), "t")
+    assert len(session.requests) == 2
+    assert not os.path.exists(save_path + ".part")
+
+
+def test_api_requests_are_retried_after_a_timeout(fake_session):
+    set_transfer_settings(TransferSettings(retries=1))
+
+    def handler(url, headers):
+        raise requests.Timeout("read timed out")
+
+    session = fake_session(handler)
+    client = CanvasAPIClient("t", "canvas.example.com", session=session)
+    with pytest.raises(requests.Timeout):
+        client._get("https://canvas.example.com/api/v1/courses")
+    assert len(session.requests) == 2
@@ -0,0 +1,32 @@
+import os
+from dataclasses import replace
+
+from conftest import FakeResponse
+from verify import VerifyEntry, VerifyResult, requeue_failed
+
+
+def test_requeue_uses_the_account_that_listed_the_file(fake_session):
+    session = fake_session(
+        lambda url, headers: FakeResponse(
+            url,
+            200 if headers["Authorization"] == "Bearer bob-token" else 401,
+            b"content",
+        )
+    )
+    os.makedirs("courses/Bio")
+    entry = VerifyEntry("courses/Bio/notes.pdf", "https://canvas/files/1", 7)
+
+    results = [VerifyResult(replace(entry, account="bob"), "missing")]
+    tokens = {"alice": "alice-token", "bob": "bob-token"}
+    assert requeue_failed(results, tokens) == 1
+    assert [headers["Authorization"] for _, headers in session.requests] == [
+        "Bearer bob-token"
+    ]
+
+    # Manifest entries don't know their account, the other tokens are tried in turn
+    os.remove(entry.path)
+    session.requests.clear()
+    assert requeue_failed([VerifyResult(entry, "missing")], tokens) == 1
+    assert len(session.requests) == 2
+    with open(entry.path, "rb") as f:
+        assert f.read() == b"content"
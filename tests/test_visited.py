@@ -0,0 +1,59 @@
+from visited import BloomFilter, VisitedSet, _hash128, canonical_url
+
+
+def _urls(prefix: str, count: int) -> list[str]:
+    return [
+        f"https://canvas.example.edu/courses/1/pages/{prefix}-{i}" for i in range(count)
+    ]
+
+
+def test_spellings_of_a_url_are_one_key():
+    assert canonical_url("HTTPS://Canvas.Example.edu/pages/a/?b=2&a=1#top") == (
+        "https://canvas.example.edu/pages/a?a=1&b=2"
+    )
+    visited = VisitedSet()
+    visited.add("https://canvas.example.edu/pages/a/?b=2&a=1")
+    assert "https://CANVAS.example.edu/pages/a?a=1&b=2#section" in visited
+    assert len(visited) == 1
+
+
+def test_the_exact_tier_grows_without_losing_urls():
+    visited = VisitedSet()
+    urls = _urls("page", 5000)
+    for url in urls:
+        visited.add(url)
+        visited.add(url)
+    assert len(visited) == 5000
+    assert all(url in visited for url in urls)
+    assert not any(url in visited for url in _urls("other", 1000))
+    assert visited._bloom is None
+
+
+def test_urls_beyond_max_exact_go_to_the_bloom_tier():
+    visited = VisitedSet(max_exact=100, bloom_capacity=10_000, error_rate=0.001)
+    exact, spilled = _urls("exact", 100), _urls("bloom", 2000)
+    for url in exact:
+        visited.add(url)
+    size = visited.nbytes()
+    for url in spilled:
+        visited.add(url)
+
+    assert visited._used == 100
+    assert visited._bloom.count == 2000
+    assert len(visited) == 2100
+    # No false negatives in either tier
+    assert all(url in visited for url in exact + spilled)
+    # Adding a URL again doesn't count it twice
+    visited.add(spilled[0])
+    assert len(visited) == 2100
+    # The Bloom tier has a fixed size, the table doesn't grow anymore
+    assert visited.nbytes() == size + len(visited._bloom.bits)
+
+
+def test_false_positives_stay_within_the_error_rate():
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    for url in _urls("seen", 10_000):
+        bloom.add_hash(*_hash128(url))
+    unseen = _urls("unseen", 20_000)
+    false_positives = sum(bloom.contains_hash(*_hash128(url)) for url in unseen)
+    assert false_positives / len(unseen) < 0.02
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from conftest import FakeResponse
+from writer import WriteBehindWriter, set_writer
+
+
+@pytest.fixture
+def writer():
+    writer = WriteBehindWriter(max_pending=4)
+    yield writer
+    writer.close()
+
+
+def test_a_failing_write_fails_only_its_file(writer):
+    broken = writer.open("broken.txt")
+    # Not bytes, the write raises TypeError on the writer thread
+    broken.write("text")
+    with pytest.raises(TypeError):
+        broken.close()
+
+    # The thread is still serving, more writes than the queue holds go through
+    handle = writer.open("ok.txt")
+    for _ in range(10):
+        handle.write(b"data")
+    handle.close()
+    with open("ok.txt", "rb") as f:
+        assert f.read() == b"data" * 10
+    assert writer.metrics()["errors"] == 1
+
+
+def test_failing_writes_release_the_download(writer, fake_session):
+    from functions import download_file
+    from manifest import DownloadManifest, set_manifest
+
+    set_writer(writer)
+    manifest = DownloadManifest()
+    set_manifest(manifest)
+    fake_session(lambda url, headers: FakeResponse(url, 200, b"content"))
+    # The directory can't be created, a file is in its way
+    with open("courses", "w") as f:
+        f.write("")
+    save_path = os.path.join("courses", "Bio", "a.pdf")
+
+    with pytest.raises(OSError):
+        download_file(("https://files/1", save_path), "token")
+
+    assert not os.path.exists(save_path + ".part")
+    # The claim was released, the file can be downloaded again in this run
+    assert manifest.claim(save_path)
+    manifest.close()
@@ -0,0 +1,92 @@
+import time
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+import requests
+
+# Shared HTTP session used by the API client and the download helpers.
+# Reusing one session keeps connections alive between requests, and lets the whole
+# HTTP layer be replaced (e.g. by a recording or replaying session).
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def set_session(session: requests.Session):
+    global _session
+    _session = session
+
+
+# Timeouts and stall limits for all requests. The read timeout bounds the wait for any single
+# chunk, the minimum rate catches downloads that keep trickling just fast enough to never time out.
+@dataclass
+class TransferSettings:
+    connect_timeout: float = 10.0
+    read_timeout: float = 60.0
+    # Bytes per second a download must reach over stall_window seconds, 0 disables the watchdog
+    min_download_rate: float = 10_000.0
+    stall_window: float = 30.0
+    # Attempts after a timeout, stall or connection error, only for idempotent GETs
+    retries: int = 2
+    # Percentile of the recent API latencies after which a duplicate request is sent, None disables hedging
+    hedge_percentile: Optional[float] = None
+    # Files of at least this many bytes are downloaded as parallel byte ranges, 0 disables segments
+    segment_threshold: int = 256 * 1024 * 1024
+    segments: int = 4
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+
+_transfer_settings = TransferSettings()
+
+
+def get_transfer_settings() -> TransferSettings:
+    return _transfer_settings
+
+
+def set_transfer_settings(settings: TransferSettings):
+    global _transfer_settings
+    _transfer_settings = settings
+
+
+class StallError(requests.exceptions.RequestException):
+    pass
+
+
+# Function to iterate a streamed response body, raises StallError when the throughput of the
+# last window falls below the minimum rate. Only the time spent waiting for the network counts,
+# the time the consumer takes between chunks (e.g. blocked on a full write-behind queue) does not.
+def iter_content_with_watchdog(
+    response: requests.Response,
+    chunk_size: int = 64 * 1024,
+    settings: Optional[TransferSettings] = None,
+) -> Iterator[bytes]:
+    settings = settings or get_transfer_settings()
+    chunks = response.iter_content(chunk_size)
+    window_seconds = 0.0
+    window_bytes = 0
+    while True:
+        start = time.monotonic()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        window_seconds += time.monotonic() - start
+        yield chunk
+        if not settings.min_download_rate:
+            continue
+        window_bytes += len(chunk)
+        if window_seconds >= settings.stall_window:
+            if window_bytes / window_seconds < settings.min_download_rate:
+                raise StallError(
+                    f"Download stalled at {window_bytes / window_seconds:.0f} B/s: {response.url}"
+                )
+            window_seconds = 0.0
+            window_bytes = 0
@@ -0,0 +1,146 @@
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from logger import main_logger
+from storage import COURSES_ROOT
+
+# Size of the slices handed to hashlib, large slices let hashlib release the GIL for longer
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+@dataclass
+class VerifyEntry:
+    path: str
+    url: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    # The account whose listing the file comes from, unknown for manifest entries
+    account: Optional[str] = None
+
+
+@dataclass
+class VerifyResult:
+    entry: VerifyEntry
+    status: str  # "ok", "missing", "size" or "hash"
+    actual_size: Optional[int] = None
+    actual_sha256: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+# Function to hash a file through a memory map. hashlib releases the GIL while hashing
+# buffers, so several files can be hashed in parallel by a thread pool.
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for start in range(0, len(view), HASH_CHUNK_SIZE):
+                    digest.update(view[start : start + HASH_CHUNK_SIZE])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+# Function to check a single file, the (cheap) size check runs before hashing
+def verify_entry(entry: VerifyEntry, check_hash: bool = True) -> VerifyResult:
+    try:
+        actual_size = os.stat(entry.path).st_size
+    except FileNotFoundError:
+        return VerifyResult(entry, "missing")
+
+    if entry.size is not None and actual_size != entry.size:
+        return VerifyResult(entry, "size", actual_size)
+
+    if check_hash and entry.sha256:
+        actual_sha256 = hash_file(entry.path)
+        if actual_sha256 != entry.sha256:
+            return VerifyResult(entry, "hash", actual_size, actual_sha256)
+        return VerifyResult(entry, "ok", actual_size, actual_sha256)
+
+    return VerifyResult(entry, "ok", actual_size)
+
+
+# Function to verify many files in parallel
+def verify_entries(
+    entries: Iterable[VerifyEntry], workers: int = 8, check_hash: bool = True
+) -> list[VerifyResult]:
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(verify_entry, entry, check_hash) for entry in entries
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            if not result.ok:
+                main_logger.warning(
+                    f"Verification failed ({result.status}): {result.entry.path}"
+                )
+            results.append(result)
+    return results
+
+
+# Builds the entries from the download manifest (size and sha256 of every download)
+def entries_from_manifest(manifest_entries: dict[str, dict]) -> list[VerifyEntry]:
+    return [
+        VerifyEntry(path, entry.get("url"), entry.get("size"), entry.get("sha256"))
+        for path, entry in manifest_entries.items()
+    ]
+
+
+# Builds the entries from the Canvas file listings, using the layout of download_all_files
+def entries_from_canvas(
+    client, courses: list[dict], account: Optional[str] = None
+) -> list[VerifyEntry]:
+    entries = []
+    for course in courses:
+        course_name = course.get("name", "Unnamed_Course").replace("/", "_")
+        for file in client.get_course_files(course["id"]):
+            entries.append(
+                VerifyEntry(
+                    os.path.join(
+                        COURSES_ROOT,
+                        course_name,
+                        file["display_name"].replace("/", "_"),
+                    ),
+                    file.get("url"),
+                    file.get("size"),
+                    account=account,
+                )
+            )
+    return entries
+
+
+# Function to download the files that failed verification again, returns how many succeeded.
+# access_tokens maps account names to tokens. A file is fetched with the token of the account
+# that listed it first, then with the others: manifest entries don't know their account.
+def requeue_failed(
+    results: list[VerifyResult], access_tokens: dict[str, str], workers: int = 8
+) -> int:
+    failed = [result.entry for result in results if not result.ok and result.entry.url]
+    if not failed or not access_tokens:
+        return 0
+
+    # Imported here, the functions module pulls in the HTTP stack the CLI loads lazily
+    from functions import download_file
+
+    def download(entry: VerifyEntry) -> bool:
+        names = sorted(access_tokens, key=lambda name: name != entry.account)
+        return any(
+            download_file((entry.url, entry.path), access_tokens[name])
+            for name in names
+        )
+
+    main_logger.info(f"Re-downloading {len(failed)} files")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download, entry) for entry in failed]
+        return sum(1 for future in as_completed(futures) if future.result())
@@ -0,0 +1,119 @@
+import hashlib
+import math
+from array import array
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Fraction of the slots that may be used before the exact table doubles
+MAX_LOAD = 0.6
+
+
+# Canonical form of a URL: lowercase scheme and host, no fragment, sorted query parameters and
+# no trailing slash, so different spellings of the same page are one key
+def canonical_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = parts.query
+    if "&" in query:
+        query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def _hash128(key: str) -> tuple[int, int]:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+# Bloom filter sized for `capacity` keys at the given false positive rate
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    # Double hashing: the k positions are h1 + i * h2
+    def _positions(self, h1: int, h2: int):
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add_hash(self, h1: int, h2: int):
+        for position in self._positions(h1, h2):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def contains_hash(self, h1: int, h2: int) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(h1, h2)
+        )
+
+
+# Set of visited URLs that stores 64-bit hashes of the canonical URLs in an open addressing
+# table (8 bytes per slot instead of a string per URL). With max_exact set, URLs beyond that
+# many go into a Bloom filter tier of fixed size, which bounds the memory of very large crawls
+# at the cost of the configured false positive rate (a false positive skips a page).
+class VisitedSet:
+    def __init__(
+        self,
+        max_exact: Optional[int] = None,
+        bloom_capacity: int = 1_000_000,
+        error_rate: float = 0.001,
+    ):
+        self.max_exact = max_exact
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self._slots = array("Q", bytes(8 * 1024))
+        self._used = 0
+        self._bloom: Optional[BloomFilter] = None
+
+    # 0 marks an empty slot, the hash of a key is never 0
+    def _find(self, slots: array, h: int) -> int:
+        mask = len(slots) - 1
+        index = h & mask
+        while slots[index] and slots[index] != h:
+            index = (index + 1) & mask
+        return index
+
+    def _grow(self):
+        slots = array("Q", bytes(16 * len(self._slots)))
+        for h in self._slots:
+            if h:
+                slots[self._find(slots, h)] = h
+        self._slots = slots
+
+    def add(self, url: str):
+        h1, h2 = _hash128(canonical_url(url))
+        h = h1 or 1
+        index = self._find(self._slots, h)
+        if self._slots[index]:
+            return
+        if self._bloom is not None and self._bloom.contains_hash(h1, h2):
+            return
+        if self.max_exact is not None and self._used >= self.max_exact:
+            if self._bloom is None:
+                self._bloom = BloomFilter(self.bloom_capacity, self.error_rate)
+            self._bloom.add_hash(h1, h2)
+            return
+        self._slots[index] = h
+        self._used += 1
+        if self._used > len(self._slots) * MAX_LOAD:
+            self._grow()
+
+    def __contains__(self, url: str) -> bool:
+        h1, h2 = _hash128(canonical_url(url))
+        if self._slots[self._find(self._slots, h1 or 1)]:
+            return True
+        return self._bloom is not None and self._bloom.contains_hash(h1, h2)
+
+    def __len__(self) -> int:
+        return self._used + (self._bloom.count if self._bloom else 0)
+
+    # Approximate memory of the table and the Bloom tier in bytes
+    def nbytes(self) -> int:
+        size = self._slots.itemsize * len(self._slots)
+        if self._bloom is not None:
+            size += len(self._bloom.bits)
+        return size
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from logger import main_logger
+from storage import COURSES_ROOT
+
+WATCH_STATE_PATH = os.path.join(COURSES_ROOT, ".watch_state.json")
+
+
+# Poll interval that shrinks to the minimum as soon as something changed and grows
+# by `factor` with every quiet poll, so an idle daemon costs almost nothing
+@dataclass
+class AdaptiveInterval:
+    min_seconds: float = 60.0
+    max_seconds: float = 1800.0
+    factor: float = 1.5
+
+    def __post_init__(self):
+        self.current = self.min_seconds
+
+    def update(self, changed: bool) -> float:
+        if changed:
+            self.current = self.min_seconds
+        else:
+            self.current = min(self.current * self.factor, self.max_seconds)
+        return self.current
+
+
+def _digest(value) -> str:
+    return hashlib.sha1(
+        json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+# Detects which courses changed since they were last synced, from cheap signals:
+# one activity stream request for all courses, plus the most recently updated file and page
+# and the module listing of every course. The signals of the last sync are kept in a state
+# file, so a restarted daemon only syncs what changed while it was down.
+class ChangeWatcher:
+    def __init__(self, client, state_path: Optional[str] = WATCH_STATE_PATH):
+        self.client = client
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._state: dict[str, dict] = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                self._state = json.load(f)
+
+    # Function to get the newest activity per course id from the activity stream
+    def _activity(self) -> dict[str, str]:
+        latest: dict[str, str] = {}
+        for item in self.client.get_activity_stream():
+            course_id = item.get("course_id")
+            updated_at = item.get("updated_at") or item.get("created_at")
+            if course_id is None or not updated_at:
+                continue
+            course_id = str(course_id)
+            latest[course_id] = max(latest.get(course_id, ""), updated_at)
+        return latest
+
+    def _signals(self, course_id) -> dict[str, str]:
+        signals = {}
+        for kind in ("files", "pages"):
+            recent = self.client.get_recently_updated(course_id, kind)
+            signals[kind] = _digest(
+                [(item.get("id"), item.get("updated_at")) for item in recent]
+            )
+        modules = self.client.get_modules(course_id)
+        signals["modules"] = _digest(
+            [
+                (
+                    module.get("id"),
+                    module.get("name"),
+                    module.get("items_count"),
+                    module.get("published"),
+                    module.get("unlock_at"),
+                )
+                for module in modules
+            ]
+        )
+        return signals
+
+    # Function to find the courses that changed, returns (course, signals) pairs.
+    # Courses without a recorded sync always count as changed.
+    def changed_courses(self, courses: list[dict]) -> list[tuple[dict, dict]]:
+        activity = self._activity()
+        changed = []
+        for course in courses:
+            course_id = str(course["id"])
+            with self._lock:
+                previous = self._state.get(course_id)
+            signals = self._signals(course["id"])
+            signals["activity"] = activity.get(
+                course_id, (previous or {}).get("activity", "")
+            )
+            if previous != signals:
+                reasons = [
+                    name
+                    for name, value in signals.items()
+                    if (previous or {}).get(name) != value
+                ]
+                main_logger.info(
+                    f"Changes in {course.get('name', course_id)}: {', '.join(reasons)}"
+                )
+                changed.append((course, signals))
+        return changed
+
+    # Function to record the signals a course was synced at
+    def mark_synced(self, course: dict, signals: dict):
+        with self._lock:
+            self._state[str(course["id"])] = signals
+        self.save()
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            state = dict(self._state)
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temporary_path, self.state_path)
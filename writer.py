@@ -0,0 +1,264 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from logger import main_logger
+
+FSYNC_POLICIES = ("none", "file", "batch")
+# Operations the writer thread takes from the queue at once
+BATCH_SIZE = 64
+
+_directories: set[str] = set()
+_directories_lock = threading.Lock()
+
+
+# Function to create a directory once per run, later calls for the same directory cost no syscall
+def ensure_dir(directory: str):
+    directory = directory or "."
+    if directory in _directories:
+        return
+    os.makedirs(directory, exist_ok=True)
+    with _directories_lock:
+        _directories.add(directory)
+
+
+# A file written by the writer thread from chunks handed over by a network worker.
+# write() only queues the chunk, close() waits until the file is on disk (and fsynced,
+# depending on the policy) unless told not to, and raises the error the write failed with.
+class WriteHandle:
+    __slots__ = ("writer", "path", "file", "error", "done")
+
+    def __init__(self, writer: "WriteBehindWriter", path: str):
+        self.writer = writer
+        self.path = path
+        self.file = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+    def write(self, chunk: bytes):
+        self.writer._put(("chunk", self, chunk))
+
+    def close(self, wait: bool = True):
+        self.writer._put(("close", self, None))
+        if wait:
+            self.wait()
+
+    # Function to drop a partially written file
+    def abort(self):
+        self.writer._put(("abort", self, None))
+        self.done.wait()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+
+
+# Write-behind stage: network workers hand their data to a bounded queue and go on, a single
+# writer thread writes it in batches. A full queue blocks the workers, so memory stays bounded
+# when the disk is slower than the network. Fsync policies: "none" leaves flushing to the OS,
+# "file" fsyncs every file when it is closed, "batch" fsyncs the files closed in a batch together
+# at the end of the batch.
+class WriteBehindWriter:
+    def __init__(self, max_pending: int = 256, fsync: str = "none"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.fsync = fsync
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_pending))
+        # Last pending handle or task per path, so readers of a path can wait for it
+        self._pending: dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.max_depth = 0
+        self.operations = 0
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.fsyncs = 0
+        self.write_seconds = 0.0
+        self.max_write_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._thread.start()
+
+    def _put(self, operation: tuple):
+        self._queue.put(operation)
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def _track(self, path: str, done: threading.Event):
+        with self._lock:
+            self._pending[path] = done
+
+    # Function to start writing a file, its chunks are written in the order they are queued
+    def open(self, path: str) -> WriteHandle:
+        handle = WriteHandle(self, path)
+        self._track(path, handle.done)
+        self._put(("open", handle, None))
+        return handle
+
+    # Function to run a write (e.g. an archive member) on the writer thread, errors are logged
+    def submit(self, path: str, function: Callable, *args):
+        done = threading.Event()
+        self._track(path, done)
+        self._put(("call", (function, args, done), None))
+
+    # Function to wait for the queued writes of a path, e.g. before linking to it
+    def wait_for(self, path: str):
+        with self._lock:
+            done = self._pending.get(path)
+        if done is not None:
+            done.wait()
+
+    # Function to wait until everything queued so far is written
+    def flush(self):
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._put(("barrier", done, None))
+        done.wait()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            start = time.perf_counter()
+            closed: list[WriteHandle] = []
+            barriers: list[threading.Event] = []
+            stop = False
+            for operation in batch:
+                if operation is None:
+                    stop = True
+                elif operation[0] == "barrier":
+                    barriers.append(operation[1])
+                else:
+                    self._execute(operation, closed)
+            # Files closed in this batch are synced together before their writers are released
+            for handle in closed:
+                self._finish(handle, self.fsync == "batch")
+            for barrier in barriers:
+                barrier.set()
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.operations += len(batch)
+                self.write_seconds += elapsed
+                self.max_write_seconds = max(self.max_write_seconds, elapsed)
+                for path in [
+                    path for path, done in self._pending.items() if done.is_set()
+                ]:
+                    del self._pending[path]
+            if stop:
+                return
+
+    def _execute(self, operation: tuple, closed: list):
+        kind, target, chunk = operation
+        if kind == "call":
+            function, args, done = target
+            try:
+                function(*args)
+            except Exception:
+                self.errors += 1
+                main_logger.exception(f"Write-behind task failed: {args[:1]}")
+            done.set()
+            return
+
+        handle: WriteHandle = target
+        try:
+            if kind == "open":
+                if handle.error is None:
+                    ensure_dir(os.path.dirname(handle.path))
+                    handle.file = open(handle.path, "wb")
+            elif kind == "chunk":
+                if handle.file is not None:
+                    handle.file.write(chunk)
+                    self.bytes += len(chunk)
+            elif kind == "close":
+                if self.fsync == "batch" and handle.file is not None:
+                    # Buffered data goes out now, only the fsync waits for the end of the batch
+                    handle.file.flush()
+                    closed.append(handle)
+                    return
+                self._finish(handle, self.fsync == "file")
+                return
+            elif kind == "abort":
+                if handle.file is not None:
+                    handle.file.close()
+                    handle.file = None
+                if os.path.exists(handle.path):
+                    os.remove(handle.path)
+                handle.done.set()
+                return
+        except Exception as e:
+            # Any failure only fails this file, the writer thread keeps serving the others
+            self._fail(handle, e)
+            if kind in ("close", "abort"):
+                handle.done.set()
+
+    def _finish(self, handle: WriteHandle, fsync: bool):
+        try:
+            if handle.file is not None:
+                if fsync:
+                    handle.file.flush()
+                    os.fsync(handle.file.fileno())
+                    self.fsyncs += 1
+                handle.file.close()
+                handle.file = None
+                self.files += 1
+        except Exception as e:
+            self._fail(handle, e)
+        handle.done.set()
+
+    # Later chunks of a failed file are dropped, close() raises the error to the worker
+    def _fail(self, handle: WriteHandle, error: Exception):
+        if handle.error is None:
+            self.errors += 1
+            main_logger.error(f"Writing {handle.path} failed: {error}")
+            handle.error = error
+        if handle.file is not None:
+            try:
+                handle.file.close()
+            except Exception:
+                pass
+            handle.file = None
+
+    # Queue depth, write latency per batch and totals
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "operations": self.operations,
+                "files": self.files,
+                "bytes": self.bytes,
+                "errors": self.errors,
+                "fsyncs": self.fsyncs,
+                "write_seconds": round(self.write_seconds, 3),
+                "max_batch_seconds": round(self.max_write_seconds, 3),
+            }
+
+    def close(self):
+        if not self._thread.is_alive():
+            return
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+
+_writer: Optional[WriteBehindWriter] = None
+
+
+# The write-behind stage of the run, None writes on the calling thread
+def get_writer() -> Optional[WriteBehindWriter]:
+    return _writer
+
+
+def set_writer(writer: Optional[WriteBehindWriter]):
+    global _writer
+    _writer = writer